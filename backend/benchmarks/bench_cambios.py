@@ -0,0 +1,140 @@
+"""
+Mide /cambios con muchos suscriptos inactivos: cuánto cuesta tenerlos
+conectados (memoria e hilos del servidor) y cuánto tarda en llegarles a
+todos el aviso de una versión nueva.
+
+Uso (desde backend/):
+    python benchmarks/bench_cambios.py [--suscriptos N] [--workers N]
+
+La mini web corre en otro proceso (sin hilo de refresco); la versión
+nueva se publica a mano. Los clientes se conectan desde varias IPs de
+loopback (127.0.0.x), así no se agotan los puertos efímeros.
+"""
+import argparse
+import multiprocessing
+import selectors
+import socket
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Conexiones por IP de origen (hay ~28k puertos efímeros por destino)
+_POR_IP = 20_000
+
+
+def _servir(puerto: int, workers: int, suscriptos: int, listo, publicar):
+    import os
+    import threading
+
+    sys.stdout = open(os.devnull, "w")  # el log por request frenaría al servidor
+    import miniweb_precios
+
+    miniweb_precios.MAX_SUSCRIPTORES_CAMBIOS = suscriptos + 1
+    miniweb_precios._notificador.max_suscriptores = suscriptos + 1
+    miniweb_precios.subir_limite_de_archivos()
+    miniweb_precios._notificador.publicar("v1")
+    servidor = miniweb_precios.crear_servidor("127.0.0.1", puerto, workers)
+
+    def publicar_cuando_pidan():
+        publicar.wait()
+        miniweb_precios._notificador.publicar("v2")
+
+    threading.Thread(target=publicar_cuando_pidan, daemon=True).start()
+    listo.set()
+    servidor.serve_forever()
+
+
+def _estado_proceso(pid: int) -> dict[str, str]:
+    """VmRSS e hilos de otro proceso (solo Linux; en otros sistemas, vacío)."""
+    try:
+        lineas = Path(f"/proc/{pid}/status").read_text().splitlines()
+    except OSError:
+        return {}
+    return dict(l.split(":", 1) for l in lineas if l.startswith(("VmRSS", "Threads")))
+
+
+def _leer_hasta(sockets: list[socket.socket], marca: bytes, limite: float) -> list[float]:
+    """Lee de todos hasta ver `marca` en cada uno; devuelve el instante en que llegó a cada uno."""
+    selector = selectors.DefaultSelector()
+    recibido = {}
+    for s in sockets:
+        selector.register(s, selectors.EVENT_READ)
+        recibido[s] = b""
+    llegadas = []
+    while recibido and time.perf_counter() < limite:
+        for clave, _ in selector.select(1.0):
+            s = clave.fileobj
+            datos = s.recv(4096)
+            recibido[s] += datos
+            if marca in recibido[s] or not datos:
+                llegadas.append(time.perf_counter())
+                selector.unregister(s)
+                del recibido[s]
+    if recibido:
+        print(f"[ERROR] {len(recibido)} suscriptos no recibieron {marca!r}")
+    selector.close()
+    return llegadas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--suscriptos", type=int, default=20_000)
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+    from miniweb_precios import subir_limite_de_archivos
+
+    subir_limite_de_archivos(args.suscriptos + 1024)
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        puerto = s.getsockname()[1]
+
+    contexto = multiprocessing.get_context("spawn")
+    listo, publicar = contexto.Event(), contexto.Event()
+    proceso = contexto.Process(
+        target=_servir, args=(puerto, args.workers, args.suscriptos, listo, publicar), daemon=True
+    )
+    proceso.start()
+    listo.wait(30)
+    antes = _estado_proceso(proceso.pid)
+
+    pedido = b"GET /cambios?version=v1 HTTP/1.1\r\nHost: bench\r\n\r\n"
+    sockets = []
+    t0 = time.perf_counter()
+    try:
+        for i in range(args.suscriptos):
+            origen = (f"127.0.0.{2 + i // _POR_IP}", 0)
+            s = socket.create_connection(("127.0.0.1", puerto), timeout=30, source_address=origen)
+            s.sendall(pedido)
+            sockets.append(s)
+        for s in sockets:
+            s.setblocking(False)
+        suscriptos = _leer_hasta(sockets, b"retry:", time.perf_counter() + 120)
+        conexion = time.perf_counter() - t0
+        print(f"[INFO] {len(suscriptos)} suscriptos conectados en {conexion:.1f} s "
+              f"({len(suscriptos) / conexion:,.0f}/s)")
+
+        time.sleep(1.0)
+        durante = _estado_proceso(proceso.pid)
+        if antes and durante:
+            print(f"[INFO] Servidor: RSS {antes['VmRSS'].strip()} -> {durante['VmRSS'].strip()}, "
+                  f"hilos {antes['Threads'].strip()} -> {durante['Threads'].strip()}")
+
+        t_publicacion = time.perf_counter()
+        publicar.set()
+        llegadas = sorted(t - t_publicacion for t in _leer_hasta(sockets, b"data: v2", time.perf_counter() + 120))
+        if llegadas:
+            p = lambda q: llegadas[min(len(llegadas) - 1, int(len(llegadas) * q))] * 1000  # noqa: E731
+            print(f"[INFO] Aviso de versión nueva a {len(llegadas)} suscriptos: "
+                  f"p50 {p(0.5):.1f} ms, p99 {p(0.99):.1f} ms, último {llegadas[-1] * 1000:.1f} ms")
+    finally:
+        for s in sockets:
+            s.close()
+        proceso.terminate()
+        proceso.join()
+
+
+if __name__ == "__main__":
+    main()
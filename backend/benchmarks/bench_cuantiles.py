@@ -0,0 +1,107 @@
+"""
+Mide el bosquejo de cuantiles (cuantiles.py): error de rango y memoria
+contra ordenar todos los valores, y el segundo corte con el filtro por
+cuantiles contra la banda de MAX_DESVIACION en modo nacional.
+
+Uso (desde backend/):
+    python benchmarks/bench_cuantiles.py [ruta.csv] [--valores N] [--repeticiones N]
+"""
+import argparse
+import bisect
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import procesarPrecios  # noqa: E402
+from cuantiles import BosquejoCuantiles  # noqa: E402
+
+
+def _medir(nombre: str, fn, repeticiones: int):
+    mejor, resultado = float("inf"), None
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        resultado = fn()
+        mejor = min(mejor, time.perf_counter() - t0)
+    print(f"{nombre:<36} {mejor:8.3f} s")
+    return mejor, resultado
+
+
+def _pico(fn) -> int:
+    """Pico de memoria (tracemalloc) de fn()."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _precision(valores: int):
+    rnd = random.Random(0)
+    precios = [round(rnd.lognormvariate(7.4, 0.08), 2) for _ in range(valores)]
+
+    bosquejo = BosquejoCuantiles()
+    for p in precios:
+        bosquejo.agregar(p)
+    ordenados = sorted(precios)
+    qs = procesarPrecios.CUANTILES_PUBLICADOS
+    for q, v in zip(qs, bosquejo.cuantiles(qs)):
+        rango = bisect.bisect_right(ordenados, v) / len(ordenados)
+        print(f"[INFO] p{round(q * 100)}: {v:.2f} (rango real {rango:.4f}, error {abs(rango - q):.4f})")
+
+    def con_bosquejo():
+        b = BosquejoCuantiles()
+        for p in precios:
+            b.agregar(p)
+        return b.cuantiles(procesarPrecios.CUANTILES_PUBLICADOS)
+
+    def con_lista():
+        lista = []
+        for p in precios:
+            lista.append(p)
+        lista.sort()
+        return lista
+
+    print(f"[INFO] {valores} valores: el bosquejo guarda {sum(map(len, bosquejo._niveles))}; "
+          f"pico {_pico(con_bosquejo) / 1024:.0f} KiB contra {_pico(con_lista) / 1024:.0f} KiB ordenando todo")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("csv", nargs="?", type=Path, default=procesarPrecios.LOCAL_CSV)
+    parser.add_argument("--valores", type=int, default=1_000_000)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    _precision(args.valores)
+
+    # Sin checkpoint: se procesa el archivo entero
+    procesarPrecios.LOCAL_CSV = args.csv
+    procesarPrecios.PROCESAMIENTO_INCREMENTAL = False
+    estaciones = list(procesarPrecios.procesar_csv_nacional(1).values())
+    print(f"[INFO] {args.csv}: {len(estaciones)} estaciones, mejor de {args.repeticiones}")
+
+    procesarPrecios.FILTRO_OUTLIERS = "banda"
+    _, banda = _medir(
+        "segundo corte, banda", lambda: procesarPrecios.calcular_filas_finales(estaciones), args.repeticiones
+    )
+    procesarPrecios.FILTRO_OUTLIERS = "cuantiles"
+    _, cuantiles = _medir(
+        "segundo corte, cuantiles", lambda: procesarPrecios.calcular_filas_finales(estaciones), args.repeticiones
+    )
+    _medir(
+        "estadísticas por ciudad",
+        lambda: procesarPrecios.renderizar_estadisticas(procesarPrecios.bosquejos_por_grupo(estaciones)),
+        args.repeticiones,
+    )
+
+    distintas = sum(a != b for a, b in zip(banda, cuantiles)) + abs(len(banda) - len(cuantiles))
+    print(f"[INFO] {len(banda)} filas finales; {distintas} cambian al filtrar por cuantiles")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Compara el parseo del CSV en serie contra el repartido en varios procesos
+por rangos de bytes, en modo nacional (todas las localidades y banderas).
+
+Uso (desde backend/):
+    python benchmarks/bench_paralelo.py [ruta.csv] [--workers N] [--repeticiones N]
+
+Verifica que el por_estacion combinado sea idéntico al de la corrida en
+serie (mismas claves, mismos registros y mismo orden) y que el registro
+de estaciones, armado desde cero en cada corrida, les dé los mismos ids.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import procesarPrecios  # noqa: E402
+
+
+def _medir(nombre: str, fn, repeticiones: int):
+    mejor, resultado = float("inf"), None
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        resultado = fn()
+        mejor = min(mejor, time.perf_counter() - t0)
+    print(f"{nombre:<36} {mejor:8.3f} s")
+    return mejor, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("csv", nargs="?", type=Path, default=procesarPrecios.LOCAL_CSV)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    # Sin checkpoint: las dos corridas tienen que procesar el archivo entero
+    procesarPrecios.LOCAL_CSV = args.csv
+    procesarPrecios.PROCESAMIENTO_INCREMENTAL = False
+    # Ni el registro guardado: cada corrida asigna todos los ids
+    procesarPrecios.REGISTRO_ESTACIONES_JSON = Path(tempfile.mkdtemp()) / "estaciones.json"
+
+    tam_mb = args.csv.stat().st_size / 1e6
+    print(f"[INFO] {args.csv} ({tam_mb:.1f} MB), mejor de {args.repeticiones}")
+
+    def procesar(procesos: int) -> tuple[dict, list]:
+        procesarPrecios._registro = None
+        por_estacion = procesarPrecios.procesar_csv_nacional(procesos)
+        return por_estacion, procesarPrecios.registro_actual().entradas()
+
+    serie, (esperado, ids_serie) = _medir("en serie", lambda: procesar(1), args.repeticiones)
+    paralelo, (obtenido, ids_paralelo) = _medir(
+        f"{args.workers} procesos", lambda: procesar(args.workers), args.repeticiones
+    )
+    print(f"[INFO] paralelo vs serie: x{serie / paralelo:.1f}")
+
+    if ids_paralelo != ids_serie:
+        distintas = sum(a != b for a, b in zip(ids_paralelo, ids_serie)) + abs(len(ids_paralelo) - len(ids_serie))
+        print(f"[ERROR] El registro en paralelo difiere del de la corrida en serie ({distintas} lecturas)")
+        sys.exit(1)
+    if list(obtenido.items()) != list(esperado.items()):
+        print("[ERROR] El resultado en paralelo difiere del de la corrida en serie")
+        sys.exit(1)
+    print(f"[INFO] Resultados idénticos ({len(esperado)} estaciones, {len(ids_serie)} lecturas, mismos ids)")
+
+
+if __name__ == "__main__":
+    main()
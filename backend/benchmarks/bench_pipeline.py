@@ -0,0 +1,175 @@
+"""
+Mide el pipeline completo sobre CSVs sintéticos (generar_csv.py) de varios
+tamaños, sin depender del sitio del gobierno: el CSV se sirve desde un
+servidor HTTP local con ETag, HEAD condicional y Range.
+
+Uso (desde backend/):
+    python benchmarks/bench_pipeline.py [--filas N [N ...]] [--repeticiones N] [--dir DIR]
+
+Casos (cada uno en un proceso nuevo, así el pico de memoria es solo suyo):
+  - parseo del CSV local con el filtro de precios.txt y con todo el país
+  - descargar_csv_si_necesario con descarga completa
+  - generar_precios_txt desde cero (descarga + parseo en streaming)
+  - generar_precios_txt con el CSV sin cambios (HEAD 304 + checkpoint)
+
+Los CSV generados se guardan en --dir y se reusan entre corridas.
+"""
+import argparse
+import email.utils
+import hashlib
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+try:
+    import resource  # no existe en Windows: ahí no se mide el pico de memoria
+except ImportError:
+    resource = None
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import generar_csv  # noqa: E402
+import procesarPrecios  # noqa: E402
+
+
+class _ServidorCSV(BaseHTTPRequestHandler):
+    """Sirve un único archivo como lo hace el sitio oficial: ETag, 304 y Range."""
+
+    archivo: Path
+
+    def _encabezados(self):
+        st = self.archivo.stat()
+        etag = '"' + hashlib.sha1(f"{st.st_size}-{st.st_mtime_ns}".encode()).hexdigest() + '"'
+        return st.st_size, etag, email.utils.formatdate(st.st_mtime, usegmt=True)
+
+    def do_HEAD(self):
+        self._responder(con_cuerpo=False)
+
+    def do_GET(self):
+        self._responder(con_cuerpo=True)
+
+    def _responder(self, con_cuerpo: bool):
+        tamano, etag, modificado = self._encabezados()
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        desde = 0
+        rango = self.headers.get("Range", "")
+        if rango.startswith("bytes=") and rango.endswith("-") and self.headers.get("If-Range", etag) == etag:
+            desde = int(rango[len("bytes="):-1])
+        self.send_response(206 if desde else 200)
+        self.send_header("Content-Length", str(tamano - desde))
+        if desde:
+            self.send_header("Content-Range", f"bytes {desde}-{tamano - 1}/{tamano}")
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", modificado)
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        if con_cuerpo:
+            with self.archivo.open("rb") as f:
+                f.seek(desde)
+                shutil.copyfileobj(f, self.wfile, procesarPrecios.CHUNK_BYTES)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _levantar_servidor_csv(archivo: Path) -> tuple[ThreadingHTTPServer, str]:
+    handler = type("Handler", (_ServidorCSV,), {"archivo": archivo})
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}/{archivo.name}"
+
+
+def _pico_memoria_mb() -> float | None:
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KB, macOS en bytes
+    return pico / (1 << 20) if sys.platform == "darwin" else pico / 1024
+
+
+def _correr_caso(caso: str, csv_path: Path, url: str, trabajo: Path) -> tuple[float, float | None]:
+    """Corre un caso en este proceso (uno nuevo por caso) y devuelve (segundos, pico MB)."""
+    # Todas las rutas del pipeline son relativas: quedan dentro de `trabajo`
+    os.chdir(trabajo)
+    procesarPrecios.CSV_DOWNLOAD_URL = url
+    sys.stdout = open(os.devnull, "w")
+
+    if caso == "sin_cambios":
+        # Estado previo: una regeneración completa ya hecha
+        procesarPrecios.generar_precios_txt(max_edad_csv=0)
+
+    t0 = time.perf_counter()
+    if caso in ("parseo", "parseo_nacional"):
+        filtro = procesarPrecios.FILTRO_NACIONAL if caso == "parseo_nacional" else None
+        with csv_path.open("r", encoding="utf-8", newline="") as f:
+            procesarPrecios._procesar_stream_csv(f, filtro=filtro)
+    elif caso == "descarga":
+        procesarPrecios.descargar_csv_si_necesario(max_edad=0)
+    else:
+        procesarPrecios.generar_precios_txt(max_edad_csv=0)
+    return time.perf_counter() - t0, _pico_memoria_mb()
+
+
+CASOS = (
+    ("parseo", "parseo (filtro de precios.txt)"),
+    ("parseo_nacional", "parseo (todo el país)"),
+    ("descarga", "descargar_csv_si_necesario"),
+    ("completa", "generar_precios_txt desde cero"),
+    ("sin_cambios", "generar_precios_txt sin cambios"),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--filas", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--dir", type=Path, default=Path(tempfile.gettempdir()) / "bench_precios")
+    args = parser.parse_args()
+    args.dir.mkdir(parents=True, exist_ok=True)
+
+    # spawn: cada caso arranca con la memoria de un intérprete limpio
+    contexto = multiprocessing.get_context("spawn")
+
+    for filas in args.filas:
+        csv_path = (args.dir / f"sintetico_{filas}_{args.semilla}.csv").resolve()
+        if not csv_path.exists():
+            print(f"[INFO] Generando {csv_path.name}...")
+            generar_csv.generar(csv_path, filas, args.semilla)
+        tam_mb = csv_path.stat().st_size / 1e6
+        servidor, url = _levantar_servidor_csv(csv_path)
+        print(f"\n[INFO] {filas} filas ({tam_mb:.1f} MB), mejor de {args.repeticiones}")
+        print(f"{'caso':<36} {'tiempo':>9} {'filas/s':>11} {'MB/s':>7} {'pico RSS':>9}")
+
+        for caso, nombre in CASOS:
+            mejor, pico = float("inf"), None
+            for _ in range(args.repeticiones):
+                with tempfile.TemporaryDirectory(dir=args.dir) as trabajo:
+                    with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as pool:
+                        segundos, pico_caso = pool.submit(
+                            _correr_caso, caso, csv_path, url, Path(trabajo)
+                        ).result()
+                mejor = min(mejor, segundos)
+                if pico_caso is not None:
+                    pico = max(pico or 0.0, pico_caso)
+            rss = f"{pico:7.0f}MB" if pico is not None else f"{'-':>9}"
+            print(f"{nombre:<36} {mejor:8.3f}s {filas / mejor:11,.0f} {tam_mb / mejor:7.1f} {rss}")
+
+        servidor.shutdown()
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Compara el camino con prefiltro de texto contra el parseo CSV completo.
+
+El prefiltro descarta sin parsear las líneas sin "Diurno". Se mide sobre
+todo el país, como lo procesa el pipeline (FILTRO_NACIONAL).
+
+Uso (desde backend/):
+    python benchmarks/bench_prefiltro.py [ruta.csv] [--repeticiones N]
+
+Por defecto usa el CSV local del pipeline (LOCAL_CSV).
+"""
+import argparse
+import csv
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import procesarPrecios  # noqa: E402
+
+
+def _medir(nombre: str, fn, repeticiones: int) -> float:
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        fn()
+        mejor = min(mejor, time.perf_counter() - t0)
+    print(f"{nombre:<42} {mejor:8.3f} s")
+    return mejor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("csv", nargs="?", type=Path, default=procesarPrecios.LOCAL_CSV)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    tam_mb = args.csv.stat().st_size / 1e6
+    print(f"[INFO] {args.csv} ({tam_mb:.1f} MB), mejor de {args.repeticiones}")
+
+    salidas = {}
+
+    def procesar(prefiltro: bool):
+        with args.csv.open("r", encoding="utf-8", newline="") as f:
+            por_estacion = procesarPrecios._procesar_stream_csv(
+                f, prefiltro=prefiltro, filtro=procesarPrecios.FILTRO_NACIONAL
+            )
+        salidas[prefiltro] = procesarPrecios.renderizar_precios_txt(
+            procesarPrecios.calcular_filas_finales(por_estacion.values())
+        )
+
+    def solo_dictreader():
+        # Referencia del camino anterior: solo armar los dicts, sin filtrar
+        with args.csv.open("r", encoding="utf-8", newline="") as f:
+            for _ in csv.DictReader(f):
+                pass
+
+    base = _medir("csv.DictReader (solo parseo, camino viejo)", solo_dictreader, args.repeticiones)
+    completo = _medir("csv.reader posicional, sin prefiltro", lambda: procesar(False), args.repeticiones)
+    rapido = _medir("prefiltro de texto + csv.reader", lambda: procesar(True), args.repeticiones)
+
+    print(f"[INFO] prefiltro vs sin prefiltro: x{completo / rapido:.1f}")
+    print(f"[INFO] prefiltro vs solo DictReader: x{base / rapido:.1f}")
+    if salidas[True] != salidas[False]:
+        print("[ERROR] Las salidas con y sin prefiltro difieren")
+        sys.exit(1)
+    print("[INFO] Salidas idénticas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Generador de carga contra miniweb_precios: mide requests/s y latencias
+(p50 / p90 / p99 / máx).
+
+Uso (desde backend/):
+    python benchmarks/carga_miniweb.py [--url URL] [--conexiones N] [--duracion S]
+                                       [--gzip] [--revalidar] [--levantar FILAS]
+                                       [--sin-keepalive | --comparar-keepalive]
+
+Sin --levantar, le pega a un miniweb_precios que ya esté corriendo en --url.
+Con --levantar FILAS, genera un CSV sintético de FILAS filas, arma su
+precios.txt y levanta una mini web en otro proceso (sin el hilo de
+refresco, así nunca regenera) solo para la medición.
+
+Cada hilo reusa su conexión mientras el servidor la deje abierta. Con
+--sin-keepalive pide "Connection: close" (una conexión TCP nueva por
+request) y con --comparar-keepalive mide las dos variantes seguidas.
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from urllib.parse import urlsplit
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import generar_csv  # noqa: E402
+import procesarPrecios  # noqa: E402
+
+
+def _trabajador(url, headers: dict, hasta: float, latencias: list, estados: Counter, errores: list):
+    partes = urlsplit(url)
+    ruta = partes.path + (f"?{partes.query}" if partes.query else "")
+    conexion = None
+    while time.perf_counter() < hasta:
+        if conexion is None:
+            conexion = http.client.HTTPConnection(partes.hostname, partes.port or 80, timeout=30)
+        t0 = time.perf_counter()
+        try:
+            conexion.request("GET", ruta, headers=headers)
+            resp = conexion.getresponse()
+            resp.read()
+        except (OSError, http.client.HTTPException) as e:
+            errores.append(repr(e))
+            conexion.close()
+            conexion = None
+            continue
+        latencias.append(time.perf_counter() - t0)
+        estados[resp.status] += 1
+        if resp.will_close:
+            # Servidor sin keep-alive: una conexión nueva por request
+            conexion.close()
+            conexion = None
+    if conexion is not None:
+        conexion.close()
+
+
+def _percentil(ordenadas: list[float], p: float) -> float:
+    return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p))]
+
+
+def medir(url: str, conexiones: int, duracion: float, headers: dict) -> dict:
+    """Corre la carga y devuelve el resumen (también lo imprime)."""
+    hasta = time.perf_counter() + duracion
+    latencias: list[float] = []
+    estados: Counter = Counter()
+    errores: list[str] = []
+    hilos = [
+        threading.Thread(target=_trabajador, args=(url, headers, hasta, latencias, estados, errores))
+        for _ in range(conexiones)
+    ]
+    t0 = time.perf_counter()
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    total = time.perf_counter() - t0
+
+    latencias.sort()
+    resumen = {"requests": len(latencias), "segundos": total, "errores": len(errores)}
+    print(f"[INFO] {url}: {conexiones} conexiones, {total:.1f} s")
+    print(f"[INFO] {len(latencias)} requests ({len(latencias) / total:,.0f} req/s), "
+          f"estados {dict(estados)}, {len(errores)} errores")
+    if latencias:
+        for nombre, p in (("p50", 0.50), ("p90", 0.90), ("p99", 0.99)):
+            resumen[nombre] = _percentil(latencias, p)
+        resumen["max"] = latencias[-1]
+        print("[INFO] latencia " + ", ".join(
+            f"{nombre} {resumen[nombre] * 1000:.2f} ms" for nombre in ("p50", "p90", "p99", "max")
+        ))
+    if errores:
+        print(f"[ERROR] Primer error: {errores[0]}")
+    return resumen
+
+
+def _servir(trabajo: str, puerto: int, workers: int, listo):
+    """Mini web en este proceso, con el precios.txt de `trabajo` y sin refresco."""
+    os.chdir(trabajo)
+    sys.stdout = open(os.devnull, "w")  # el log por request frenaría al servidor
+    import miniweb_precios
+
+    miniweb_precios._snapshot = miniweb_precios._cargar_snapshot_desde_disco()
+    servidor = miniweb_precios.crear_servidor("127.0.0.1", puerto, workers)
+    listo.set()
+    servidor.serve_forever()
+
+
+def _levantar(filas: int, trabajo: Path, workers: int) -> tuple[multiprocessing.Process, str]:
+    csv_path = trabajo / "sintetico.csv"
+    generar_csv.generar(csv_path, filas)
+    procesarPrecios.LOCAL_CSV = csv_path
+    procesarPrecios.PROCESAMIENTO_INCREMENTAL = False
+    por_estacion = procesarPrecios.procesar_csv_nacional()
+    procesarPrecios._escribir_precios_txt(
+        procesarPrecios._filas_finales_configuradas(por_estacion), trabajo / procesarPrecios.OUTPUT_TXT.name
+    )
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        puerto = s.getsockname()[1]
+
+    contexto = multiprocessing.get_context("spawn")
+    listo = contexto.Event()
+    proceso = contexto.Process(
+        target=_servir, args=(str(trabajo), puerto, workers, listo), daemon=True
+    )
+    proceso.start()
+    listo.wait(30)
+    return proceso, f"http://127.0.0.1:{puerto}/precios.txt"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8080/precios.txt")
+    parser.add_argument("--conexiones", type=int, default=16)
+    parser.add_argument("--duracion", type=float, default=10.0)
+    parser.add_argument("--gzip", action="store_true", help="pedir Accept-Encoding: gzip, br")
+    parser.add_argument(
+        "--revalidar", action="store_true",
+        help="mandar el ETag de la primera respuesta (mide el camino del 304)",
+    )
+    parser.add_argument("--levantar", type=int, metavar="FILAS", default=None)
+    parser.add_argument("--workers", type=int, default=16, help="workers de la mini web con --levantar")
+    keepalive = parser.add_mutually_exclusive_group()
+    keepalive.add_argument("--sin-keepalive", action="store_true", help="una conexión nueva por request")
+    keepalive.add_argument(
+        "--comparar-keepalive", action="store_true",
+        help="medir con y sin keep-alive, uno después del otro",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as trabajo:
+        proceso = None
+        url = args.url
+        if args.levantar is not None:
+            proceso, url = _levantar(args.levantar, Path(trabajo), args.workers)
+
+        headers = {}
+        if args.gzip:
+            headers["Accept-Encoding"] = "gzip, br"
+        if args.revalidar:
+            partes = urlsplit(url)
+            conexion = http.client.HTTPConnection(partes.hostname, partes.port or 80)
+            conexion.request("GET", url[len(f"{partes.scheme}://{partes.netloc}"):], headers=headers)
+            resp = conexion.getresponse()
+            resp.read()
+            conexion.close()
+            if resp.getheader("ETag"):
+                headers["If-None-Match"] = resp.getheader("ETag")
+
+        try:
+            if args.comparar_keepalive:
+                print("[INFO] Con keep-alive:")
+                con = medir(url, args.conexiones, args.duracion, headers)
+                print("[INFO] Sin keep-alive (Connection: close):")
+                sin = medir(url, args.conexiones, args.duracion, {**headers, "Connection": "close"})
+                if con["requests"] and sin["requests"]:
+                    ratio = (con["requests"] / con["segundos"]) / (sin["requests"] / sin["segundos"])
+                    print(
+                        f"[INFO] keep-alive: x{ratio:.2f} requests/s, "
+                        f"p50 {con['p50'] * 1000:.2f} ms vs {sin['p50'] * 1000:.2f} ms"
+                    )
+            elif args.sin_keepalive:
+                medir(url, args.conexiones, args.duracion, {**headers, "Connection": "close"})
+            else:
+                medir(url, args.conexiones, args.duracion, headers)
+        finally:
+            if proceso is not None:
+                proceso.terminate()
+                proceso.join()
+
+
+if __name__ == "__main__":
+    main()
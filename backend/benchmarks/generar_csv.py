@@ -0,0 +1,207 @@
+"""
+Genera un CSV sintético con el mismo formato que el del dataset oficial de
+precios en surtidor (mismas columnas y orden, BOM, precios con coma
+decimal entre comillas, geojson con comillas escapadas, alguna dirección
+con coma o salto de línea), con localidades y banderas reales.
+
+Uso (desde backend/):
+    python benchmarks/generar_csv.py salida.csv [--filas N] [--semilla S]
+
+Con la misma semilla y la misma cantidad de filas, el archivo sale igual
+byte a byte. Se escribe fila a fila: sirve también para 50M de filas.
+"""
+import argparse
+import random
+import time
+from pathlib import Path
+
+ENCABEZADO = (
+    "indice_tiempo,idempresa,cuit,empresa,direccion,localidad,provincia,region,"
+    "idproducto,producto,idtipohorario,tipohorario,precio,fecha_vigencia,"
+    "idempresabandera,empresabandera,latitud,longitud,geojson"
+)
+
+# (localidad, provincia, región, latitud, longitud, peso ~ cantidad de estaciones)
+LOCALIDADES = (
+    ("CAPITAL FEDERAL", "CAPITAL FEDERAL", "PAMPEANA", -34.6037, -58.3816, 40),
+    ("LA PLATA", "BUENOS AIRES", "PAMPEANA", -34.9214, -57.9545, 12),
+    ("MAR DEL PLATA", "BUENOS AIRES", "PAMPEANA", -38.0055, -57.5426, 12),
+    ("BAHIA BLANCA", "BUENOS AIRES", "PAMPEANA", -38.7183, -62.2663, 8),
+    ("TANDIL", "BUENOS AIRES", "PAMPEANA", -37.3217, -59.1332, 4),
+    ("CORDOBA", "CORDOBA", "PAMPEANA", -31.4201, -64.1888, 25),
+    ("RIO CUARTO", "CORDOBA", "PAMPEANA", -33.1232, -64.3493, 6),
+    ("VILLA MARIA", "CORDOBA", "PAMPEANA", -32.4075, -63.2402, 4),
+    ("ROSARIO", "SANTA FE", "PAMPEANA", -32.9442, -60.6505, 20),
+    ("SANTA FE", "SANTA FE", "PAMPEANA", -31.6333, -60.7000, 10),
+    ("RAFAELA", "SANTA FE", "PAMPEANA", -31.2503, -61.4867, 4),
+    ("PARANA", "ENTRE RIOS", "PAMPEANA", -31.7413, -60.5115, 7),
+    ("CONCORDIA", "ENTRE RIOS", "PAMPEANA", -31.3929, -58.0209, 5),
+    ("SANTA ROSA", "LA PAMPA", "PAMPEANA", -36.6203, -64.2906, 4),
+    ("MENDOZA", "MENDOZA", "CUYO", -32.8895, -68.8458, 15),
+    ("SAN RAFAEL", "MENDOZA", "CUYO", -34.6177, -68.3301, 5),
+    ("SAN JUAN", "SAN JUAN", "CUYO", -31.5375, -68.5364, 7),
+    ("SAN LUIS", "SAN LUIS", "CUYO", -33.2950, -66.3356, 5),
+    ("SAN MIGUEL DE TUCUMAN", "TUCUMAN", "NOA", -26.8083, -65.2176, 12),
+    ("SALTA", "SALTA", "NOA", -24.7821, -65.4232, 10),
+    ("SAN SALVADOR DE JUJUY", "JUJUY", "NOA", -24.1858, -65.2995, 6),
+    ("SANTIAGO DEL ESTERO", "SANTIAGO DEL ESTERO", "NOA", -27.7834, -64.2642, 6),
+    ("SAN FERNANDO DEL VALLE DE CATAMARCA", "CATAMARCA", "NOA", -28.4696, -65.7795, 4),
+    ("LA RIOJA", "LA RIOJA", "NOA", -29.4131, -66.8558, 4),
+    ("CORRIENTES", "CORRIENTES", "NEA", -27.4692, -58.8306, 9),
+    ("PASO DE LOS LIBRES", "CORRIENTES", "NEA", -29.7125, -57.0877, 3),
+    ("GOYA", "CORRIENTES", "NEA", -29.1400, -59.2626, 3),
+    ("RESISTENCIA", "CHACO", "NEA", -27.4606, -58.9839, 8),
+    ("POSADAS", "MISIONES", "NEA", -27.3621, -55.9009, 8),
+    ("OBERA", "MISIONES", "NEA", -27.4871, -55.1199, 3),
+    ("FORMOSA", "FORMOSA", "NEA", -26.1775, -58.1781, 5),
+    ("NEUQUEN", "NEUQUEN", "PATAGONIA", -38.9516, -68.0591, 9),
+    ("CIPOLLETTI", "RIO NEGRO", "PATAGONIA", -38.9339, -67.9900, 4),
+    ("SAN CARLOS DE BARILOCHE", "RIO NEGRO", "PATAGONIA", -41.1335, -71.3103, 5),
+    ("COMODORO RIVADAVIA", "CHUBUT", "PATAGONIA", -45.8641, -67.4966, 6),
+    ("TRELEW", "CHUBUT", "PATAGONIA", -43.2489, -65.3051, 4),
+    ("RIO GALLEGOS", "SANTA CRUZ", "PATAGONIA", -51.6230, -69.2168, 4),
+    ("USHUAIA", "TIERRA DEL FUEGO", "PATAGONIA", -54.8019, -68.3030, 3),
+)
+
+# (idempresabandera, empresabandera, peso)
+BANDERAS = (
+    ("2", "YPF", 40),
+    ("4", "SHELL C.A.P.S.A.", 15),
+    ("27", "AXION", 12),
+    ("28", "PUMA", 10),
+    ("1", "BLANCA", 12),
+    ("19", "GULF", 4),
+    ("33", "REFINOR", 3),
+    ("7", "OIL COMBUSTIBLES S.A.", 4),
+)
+
+# (idproducto, texto del CSV, precio base en pesos, probabilidad de que la estación lo venda)
+PRODUCTOS = (
+    ("2", "Nafta (súper) entre 92 y 95 Ron", 1600.0, 1.0),
+    ("3", "Nafta (premium) de más de 95 Ron", 1900.0, 0.85),
+    ("19", "Gas Oil Grado 2", 1700.0, 0.95),
+    ("21", "Gas Oil Grado 3", 1950.0, 0.75),
+    ("6", "GNC", 700.0, 0.3),
+)
+
+HORARIOS = (("2", "Diurno"), ("3", "Nocturno"))
+
+_CALLES = (
+    "AV. SAN MARTIN", "BELGRANO", "RIVADAVIA", "AV. PTE. PERON", "MITRE",
+    "RUTA NACIONAL 14", "RUTA 12 KM", "AV. ARMENIA", "SARMIENTO", "ESPAÑA",
+    "AV. COSTANERA", "9 DE JULIO", "URQUIZA", "JUAN B. JUSTO", "RUTA PROV. 5",
+)
+
+
+def _estaciones(rnd: random.Random, cantidad: int) -> list[tuple]:
+    """Estaciones fijas: cada fila del CSV es una estación, un producto y un horario."""
+    pesos_loc = [l[5] for l in LOCALIDADES]
+    pesos_band = [b[2] for b in BANDERAS]
+    estaciones = []
+    for n in range(cantidad):
+        loc, prov, region, lat, lon, _ = rnd.choices(LOCALIDADES, pesos_loc)[0]
+        idband, band, _ = rnd.choices(BANDERAS, pesos_band)[0]
+        direccion = f"{rnd.choice(_CALLES)} {rnd.randint(1, 9999)}"
+        r = rnd.random()
+        if r < 0.01:
+            direccion = f'"{direccion}, ESQ. {rnd.choice(_CALLES)}"'
+        elif r < 0.012:
+            # Campo entre comillas con salto de línea y comillas escapadas
+            direccion = f'"{direccion}\n(EX ""{rnd.choice(_CALLES)}"")"'
+        productos = [p for p in PRODUCTOS if rnd.random() < p[3]]
+        estaciones.append((
+            str(1000 + n),
+            f"30-{rnd.randint(10000000, 99999999)}-{rnd.randint(0, 9)}",
+            f"ESTACION {n} S.R.L.",
+            direccion,
+            loc, prov, region,
+            idband, band,
+            f"{lat + rnd.uniform(-0.08, 0.08):.6f}",
+            f"{lon + rnd.uniform(-0.08, 0.08):.6f}",
+            rnd.uniform(0.95, 1.08),   # factor de precio propio de la estación
+            productos,
+        ))
+    return estaciones
+
+
+def _meses(cantidad: int, ultimo: tuple[int, int] = (2025, 6)) -> list[str]:
+    anio, mes = ultimo
+    meses = []
+    for _ in range(cantidad):
+        meses.append(f"{anio}-{mes:02d}")
+        anio, mes = (anio, mes - 1) if mes > 1 else (anio - 1, 12)
+    return meses[::-1]
+
+
+def generar(salida, filas: int, semilla: int = 0, estaciones: int | None = None, meses: int = 24):
+    """
+    Escribe `filas` filas (más el encabezado con BOM) en `salida` (ruta o
+    archivo de texto abierto). Por defecto, una estación cada ~40 filas
+    (hasta las ~5000 del país real).
+    """
+    rnd = random.Random(semilla)
+    if estaciones is None:
+        estaciones = max(10, min(5000, filas // 40))
+    lista = _estaciones(rnd, estaciones)
+    lista_meses = _meses(meses)
+    # Inflación mensual aproximada: el último mes vale 1 (los meses viejos
+    # quedan en parte por debajo de los mínimos, como en el dataset real)
+    inflacion = [0.985 ** (meses - 1 - i) for i in range(meses)]
+
+    propio = not hasattr(salida, "write")
+    out = open(salida, "w", encoding="utf-8", newline="") if propio else salida
+    try:
+        out.write("\ufeff" + ENCABEZADO + "\n")
+        escribir = out.write
+        random_ = rnd.random
+        randrange = rnd.randrange
+        for _ in range(filas):
+            (idemp, cuit, empresa, direccion, loc, prov, region, idband, band,
+             lat, lon, factor, productos) = lista[randrange(estaciones)]
+            if not productos:
+                productos = PRODUCTOS[:1]
+            idprod, producto, base, _ = productos[randrange(len(productos))]
+            i_mes = randrange(meses)
+            idhor, horario = HORARIOS[random_() < 0.25]
+
+            r = random_()
+            if r < 0.003:
+                precio = ""                      # sin precio
+            elif r < 0.006:
+                precio = "0"                     # precio inválido (debajo del mínimo)
+            else:
+                valor = base * factor * inflacion[i_mes] * (1.0 + (random_() - 0.5) * 0.02)
+                # La mitad con coma decimal (va entre comillas), la otra mitad con punto
+                precio = f'"{valor:.1f}"'.replace(".", ",") if r < 0.5 else f"{valor:.2f}"
+            mes = lista_meses[i_mes]
+            escribir(
+                f"{mes},{idemp},{cuit},{empresa},{direccion},{loc},{prov},{region},"
+                f"{idprod},{producto},{idhor},{horario},{precio},{mes}-{1 + randrange(28):02d} "
+                f"{randrange(24):02d}:{randrange(60):02d}:00,{idband},{band},{lat},{lon},"
+                f'"{{""type"": ""Point"", ""coordinates"": [{lon}, {lat}]}}"\n'
+            )
+    finally:
+        if propio:
+            out.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("salida", type=Path)
+    parser.add_argument("--filas", type=int, default=1_000_000)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--estaciones", type=int, default=None)
+    parser.add_argument("--meses", type=int, default=24)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    generar(args.salida, args.filas, args.semilla, args.estaciones, args.meses)
+    tam_mb = args.salida.stat().st_size / 1e6
+    print(
+        f"[INFO] {args.salida}: {args.filas} filas, {tam_mb:.1f} MB "
+        f"en {time.perf_counter() - t0:.1f} s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Bosquejo de cuantiles en memoria acotada (KLL, Karnin-Lang-Liberty): se
+le pasan valores de a uno y responde cualquier cuantil con error de rango
+de ~1.5 / K_CUANTILES, guardando a lo sumo unos 3 x K_CUANTILES valores
+sin importar cuántos entren. Dos bosquejos se pueden combinar: el
+resultado es el bosquejo de la unión.
+
+Mientras entran menos de K_CUANTILES valores no se descarta ninguno y los
+cuantiles son exactos (el caso de casi todas las ciudades). Cuando un
+nivel se llena, se ordena y queda uno de cada dos valores, que pasa al
+nivel siguiente con el doble de peso. Qué mitad queda se alterna en vez
+de sortearse: el mismo orden de entrada da siempre el mismo resultado.
+"""
+import math
+
+
+# Tamaño del nivel más alto; el error de rango es ~1.5 / K
+K_CUANTILES = 200
+
+# Cada nivel hacia abajo tiene 2/3 de la capacidad del de arriba
+_FACTOR_CAPACIDAD = 2 / 3
+
+
+class BosquejoCuantiles:
+    __slots__ = ("k", "n", "_niveles", "_paridad", "_capacidad_total", "_guardados")
+
+    def __init__(self, k: int = K_CUANTILES):
+        self.k = k
+        self.n = 0  # valores que entraron
+        self._niveles: list[list[float]] = []  # nivel h: valores con peso 2**h
+        self._paridad: list[int] = []          # por nivel, qué mitad queda en la próxima compactación
+        self._capacidad_total = 0
+        self._guardados = 0
+        self._crecer()
+
+    def __len__(self) -> int:
+        return self.n
+
+    def _capacidad(self, nivel: int) -> int:
+        profundidad = len(self._niveles) - nivel - 1
+        return math.ceil(self.k * _FACTOR_CAPACIDAD ** profundidad) + 1
+
+    def _crecer(self):
+        self._niveles.append([])
+        self._paridad.append(0)
+        self._capacidad_total = sum(self._capacidad(h) for h in range(len(self._niveles)))
+
+    def agregar(self, valor: float):
+        self._niveles[0].append(valor)
+        self.n += 1
+        self._guardados += 1
+        if self._guardados >= self._capacidad_total:
+            self._compactar()
+
+    def combinar(self, otro: "BosquejoCuantiles"):
+        """Suma a este bosquejo los valores de `otro` (que no cambia)."""
+        while len(self._niveles) < len(otro._niveles):
+            self._crecer()
+        for nivel, valores in enumerate(otro._niveles):
+            self._niveles[nivel].extend(valores)
+        self.n += otro.n
+        self._guardados += otro._guardados
+        while self._guardados >= self._capacidad_total:
+            self._compactar()
+
+    def _compactar(self):
+        """Compacta desde abajo los niveles llenos hasta volver a tener lugar."""
+        for nivel in range(len(self._niveles)):
+            valores = self._niveles[nivel]
+            if len(valores) < self._capacidad(nivel):
+                continue
+            if nivel + 1 == len(self._niveles):
+                self._crecer()
+
+            valores.sort()
+            # Con una cantidad impar, el último se queda en el nivel (el peso total no cambia)
+            resto = [valores.pop()] if len(valores) % 2 else []
+            paridad = self._paridad[nivel]
+            self._paridad[nivel] ^= 1
+            self._niveles[nivel + 1].extend(valores[paridad::2])
+            self._niveles[nivel] = resto
+
+            self._guardados = sum(map(len, self._niveles))
+            if self._guardados < self._capacidad_total:
+                break
+
+    def cuantiles(self, qs) -> list[float]:
+        """
+        Para cada q de `qs` (entre 0 y 1), el menor valor guardado con al
+        menos q * n valores menores o iguales (sin interpolar: siempre es
+        uno de los valores que entraron). Sin valores, NaN.
+        """
+        if self.n == 0:
+            return [math.nan for _ in qs]
+        pesados = sorted(
+            (valor, 1 << nivel) for nivel, valores in enumerate(self._niveles) for valor in valores
+        )
+        resultados = []
+        for q in qs:
+            objetivo = q * self.n
+            acumulado = 0
+            for valor, peso in pesados:
+                acumulado += peso
+                if acumulado >= objetivo:
+                    break
+            resultados.append(valor)
+        return resultados
+
+    def cuantil(self, q: float) -> float:
+        return self.cuantiles((q,))[0]
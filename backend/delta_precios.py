@@ -0,0 +1,99 @@
+from collections import OrderedDict
+import csv
+import io
+import threading
+
+
+# Cuántas versiones de precios.txt se recuerdan para responder ?since=
+VERSIONES_DELTA = 8
+
+# Columnas que identifican una fila de precios.txt (una por ciudad, producto y MAX/MIN)
+_CLAVE = ("indice_precio", "localidad", "producto")
+
+# Primera columna de un delta: alta, modificación o baja de la fila
+ALTA, MODIFICACION, BAJA = "A", "M", "B"
+
+
+def _leer_filas(data: bytes) -> tuple[list[str], dict[tuple, list[str]]] | None:
+    """Encabezado y filas de precios.txt por clave, o None si no tiene las columnas de la clave."""
+    lector = csv.reader(io.StringIO(data.decode("utf-8"), newline=""), delimiter="|")
+    encabezado = next(lector, [])
+    try:
+        posiciones = [encabezado.index(c) for c in _CLAVE]
+    except ValueError:
+        return None
+    return encabezado, {tuple(fila[i] for i in posiciones): fila for fila in lector if fila}
+
+
+def calcular_delta(anterior: bytes, nuevo: bytes) -> bytes | None:
+    """
+    Filas agregadas (A), modificadas (M) y borradas (B) para pasar de
+    `anterior` a `nuevo`, en el mismo formato que precios.txt con una
+    columna "cambio" adelante. Las borradas llevan la fila que había.
+    None si no se puede expresar como delta (cambiaron las columnas).
+    """
+    viejo, nuevas = _leer_filas(anterior), _leer_filas(nuevo)
+    if viejo is None or nuevas is None or viejo[0] != nuevas[0]:
+        return None
+    encabezado, filas_viejas = viejo
+    filas_nuevas = nuevas[1]
+
+    out = io.StringIO(newline="")
+    w = csv.writer(out, delimiter="|")
+    w.writerow(["cambio", *encabezado])
+    for clave, fila in filas_nuevas.items():
+        previa = filas_viejas.get(clave)
+        if previa is None:
+            w.writerow([ALTA, *fila])
+        elif previa != fila:
+            w.writerow([MODIFICACION, *fila])
+    for clave, fila in filas_viejas.items():
+        if clave not in filas_nuevas:
+            w.writerow([BAJA, *fila])
+    return out.getvalue().encode("utf-8")
+
+
+class HistorialVersiones:
+    """
+    Las últimas VERSIONES_DELTA versiones de precios.txt y, para cada una
+    de las anteriores, el delta hasta la vigente. Los deltas se calculan
+    una sola vez, al agregar la versión nueva; pedir uno es un dict lookup.
+    """
+
+    def __init__(self, maximo: int = VERSIONES_DELTA):
+        self.maximo = maximo
+        self._versiones: OrderedDict[str, bytes] = OrderedDict()   # versión -> precios.txt
+        self._deltas: dict[str, bytes] = {}                         # versión vieja -> delta a la vigente
+        self._lock = threading.Lock()
+
+    def agregar(self, version: str, data: bytes):
+        """Suma la versión nueva (si es la vigente, no hace nada) y recalcula los deltas hacia ella."""
+        with self._lock:
+            if next(reversed(self._versiones), None) == version:
+                return
+            versiones = OrderedDict(self._versiones)
+        versiones.pop(version, None)
+        versiones[version] = data
+        while len(versiones) > self.maximo:
+            versiones.popitem(last=False)
+
+        # También desde la vigente misma: el cliente al día recibe un delta vacío
+        deltas = {}
+        for vieja, anterior in versiones.items():
+            delta = calcular_delta(anterior, data)
+            # Si el delta no es más chico que el archivo, conviene mandar el archivo
+            if delta is not None and len(delta) < len(data):
+                deltas[vieja] = delta
+
+        with self._lock:
+            self._versiones = versiones
+            self._deltas = deltas
+
+    def delta_desde(self, version: str) -> tuple[str, bytes] | None:
+        """(versión vigente, delta desde `version`), o None si hay que mandar el archivo entero."""
+        with self._lock:
+            vigente = next(reversed(self._versiones), None)
+            delta = self._deltas.get(version)
+        if vigente is None or delta is None:
+            return None
+        return vigente, delta
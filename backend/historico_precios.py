@@ -0,0 +1,372 @@
+import csv
+import io
+import sqlite3
+import statistics
+from functools import lru_cache
+from itertools import groupby
+from pathlib import Path
+
+from registro_estaciones import DECIMALES_COORDENADAS, normalizar_coordenada
+
+
+# Histórico de precios mensuales por estación, con resúmenes por ciudad (SQLite)
+HISTORICO_DB = Path("precios_historico.sqlite")
+
+# Cuánto espera una escritura a que otra conexión suelte la base (los
+# procesos de _procesar_en_paralelo ingieren sus lotes a la vez)
+ESPERA_BLOQUEO_SECONDS = 60
+
+# Si cambia el esquema o la regla de ingesta, se rearma el histórico desde cero
+_VERSION_HISTORICO = 4
+
+# (latitud, longitud) crudas distintas cuya celda se recuerda (ver celda_de)
+CACHE_CELDAS_MAX = 1 << 16
+
+# Cada estación se guarda por su celda (registro_estaciones.normalizar_coordenada)
+# y su bandera, como en el registro: el mismo punto escrito con otros decimales
+# es la misma fila, y dos banderas en la misma esquina no se pisan
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS precios (
+    celda_lat INTEGER NOT NULL,
+    celda_lon INTEGER NOT NULL,
+    categoria TEXT NOT NULL,
+    mes TEXT NOT NULL,
+    localidad TEXT NOT NULL,
+    provincia TEXT NOT NULL,
+    idempresabandera TEXT NOT NULL,
+    empresabandera TEXT NOT NULL,
+    direccion TEXT NOT NULL,
+    precio REAL NOT NULL,
+    PRIMARY KEY (celda_lat, celda_lon, idempresabandera, categoria, mes)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS precios_por_ciudad
+    ON precios (provincia, localidad, categoria, mes);
+
+CREATE TABLE IF NOT EXISTS resumen (
+    provincia TEXT NOT NULL,
+    localidad TEXT NOT NULL,
+    categoria TEXT NOT NULL,
+    mes TEXT NOT NULL,
+    minimo REAL NOT NULL,
+    maximo REAL NOT NULL,
+    mediana REAL NOT NULL,
+    estaciones INTEGER NOT NULL,
+    PRIMARY KEY (localidad, categoria, provincia, mes)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS ingesta (
+    clave TEXT PRIMARY KEY,
+    valor TEXT NOT NULL
+);
+"""
+
+# Mismo criterio que el primer corte: dentro del mes gana el precio más
+# alto. El empate se resuelve por las columnas (ver desempate()), no por
+# orden de llegada: da lo mismo cómo se parten los lotes o en qué orden los
+# escriben los procesos en paralelo, y reingerir filas no cambia nada
+_UPSERT_PRECIO = """
+INSERT INTO precios VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (celda_lat, celda_lon, idempresabandera, categoria, mes) DO UPDATE SET
+    localidad = excluded.localidad,
+    provincia = excluded.provincia,
+    empresabandera = excluded.empresabandera,
+    direccion = excluded.direccion,
+    precio = excluded.precio
+WHERE excluded.precio > precios.precio
+   OR (excluded.precio = precios.precio
+       AND (excluded.direccion, excluded.empresabandera, excluded.localidad, excluded.provincia)
+         > (precios.direccion, precios.empresabandera, precios.localidad, precios.provincia))
+"""
+
+
+@lru_cache(maxsize=CACHE_CELDAS_MAX)
+def celda_de(latitud: str, longitud: str) -> tuple:
+    """La celda con la que se guarda una estación (registro_estaciones.normalizar_coordenada)."""
+    return normalizar_coordenada(latitud), normalizar_coordenada(longitud)
+
+
+def desempate(r) -> tuple:
+    """
+    Entre dos PrecioEstacion de la misma celda, bandera, producto, mes y
+    precio, queda el de mayor desempate: el mismo orden que aplica _UPSERT_PRECIO.
+    """
+    return r.direccion, r.empresabandera, r.localidad, r.provincia
+
+
+def _conectar(db_path: Path) -> sqlite3.Connection:
+    con = sqlite3.connect(db_path, timeout=ESPERA_BLOQUEO_SECONDS)
+    # WAL: las consultas de /historico no se bloquean mientras se ingiere
+    con.execute("PRAGMA journal_mode=WAL")
+    if con.execute("PRAGMA user_version").fetchone()[0] != _VERSION_HISTORICO:
+        # Base de otra versión (o nueva): sin estado de ingesta, se rearma entera
+        con.executescript(
+            "DROP TABLE IF EXISTS precios; DROP TABLE IF EXISTS resumen; DROP TABLE IF EXISTS ingesta;"
+            + _ESQUEMA
+            + f"PRAGMA user_version = {_VERSION_HISTORICO};"
+        )
+    return con
+
+
+def _cargar_estado(con: sqlite3.Connection) -> dict:
+    return dict(con.execute("SELECT clave, valor FROM ingesta"))
+
+
+def _guardar_estado(con: sqlite3.Connection, estado: dict):
+    con.execute("DELETE FROM ingesta")
+    con.executemany("INSERT INTO ingesta VALUES (?, ?)", ((k, str(v)) for k, v in estado.items()))
+
+
+class IngestaHistorico:
+    """
+    Lo que el parseo del CSV (procesarPrecios.procesar_csv_nacional y la
+    descarga en streaming) le va pasando al histórico: lotes de precios por
+    estación, producto y mes, y al final hasta dónde llegó. El histórico no
+    vuelve a leer el CSV; sale de la misma pasada que precios.txt y el índice.
+
+    Lo ingerido queda asociado al checkpoint de esa pasada: si la próxima
+    parte de un checkpoint distinto (o de ninguno), se reprocesa el CSV
+    entero y el histórico se rearma. Si la base falla, el parseo sigue (el
+    histórico no frena precios.txt) y la ingesta queda para rearmar.
+
+    Se puede mandar a otro proceso: cada proceso de _procesar_en_paralelo
+    escribe sus lotes con su propia conexión y devuelve su copia, con lo
+    que tocó, para combinar().
+    """
+
+    def __init__(self, db_path: Path = HISTORICO_DB):
+        self.db_path = db_path
+        # (provincia, localidad, categoria, mes) con resúmenes a recalcular; None = todos
+        self.tocados: set | None = set()
+        self.registros = 0
+        self.fallida = False
+
+    def _en_transaccion(self, accion: str, fn) -> bool:
+        """fn(con) en una transacción. Si la base falla, avisa y las siguientes se saltean."""
+        if self.fallida:
+            return False
+        try:
+            con = _conectar(self.db_path)
+            try:
+                with con:
+                    fn(con)
+            finally:
+                con.close()
+        except sqlite3.Error as e:
+            print(f"[ERROR] Falló {accion} del histórico: {e!r}")
+            self.fallida = True
+            return False
+        return True
+
+    def al_dia(self, estado: dict) -> bool:
+        """True si lo último ingerido llega justo hasta `estado` (el del checkpoint)."""
+        guardado = {}
+        self._en_transaccion("la lectura del estado", lambda con: guardado.update(_cargar_estado(con)))
+        return guardado == {k: str(v) for k, v in estado.items()}
+
+    def reiniciar(self):
+        """Vacía el histórico antes de ingerir el CSV desde el principio."""
+        def vaciar(con):
+            con.execute("DELETE FROM precios")
+            con.execute("DELETE FROM resumen")
+            _guardar_estado(con, {})
+
+        self._en_transaccion("el vaciado", vaciar)
+        self.tocados = None
+
+    def agregar(self, lote):
+        """Suma un lote de PrecioEstacion (a lo sumo uno por celda, bandera, producto y mes)."""
+        filas = [
+            (*celda_de(r.latitud, r.longitud), r.categoria, r.indice_tiempo, r.localidad,
+             r.provincia, r.idempresabandera, r.empresabandera, r.direccion, r.precio_num)
+            for r in lote
+        ]
+        if not self._en_transaccion("la ingesta", lambda con: con.executemany(_UPSERT_PRECIO, filas)):
+            return
+        self.registros += len(filas)
+        if self.tocados is not None:
+            self.tocados.update((r.provincia, r.localidad, r.categoria, r.indice_tiempo) for r in lote)
+
+    def combinar(self, otro: "IngestaHistorico"):
+        """Suma lo que ingirió `otro` (el de un proceso de _procesar_en_paralelo)."""
+        self.registros += otro.registros
+        self.fallida = self.fallida or otro.fallida
+        if self.tocados is not None and otro.tocados is not None:
+            self.tocados |= otro.tocados
+
+    def terminar(self, estado: dict | None):
+        """
+        Recalcula los resúmenes tocados y guarda hasta dónde se ingirió: el
+        estado del checkpoint recién guardado, o None si no se guardó (y
+        entonces la próxima pasada lo rearma).
+        """
+        if self.fallida:
+            # Quedó a medias: sin estado, la próxima pasada reprocesa todo
+            self.fallida = False
+            if self._en_transaccion("el cierre", lambda con: _guardar_estado(con, {})):
+                print("[WARN] El histórico quedó incompleto; se rearma en la próxima pasada.")
+            return
+
+        resumenes = []
+
+        def cerrar(con):
+            resumenes.append(_recalcular_resumenes(con, self.tocados))
+            _guardar_estado(con, estado or {})
+
+        if self._en_transaccion("el cierre", cerrar):
+            print(f"[INFO] Histórico actualizado: {self.registros} registros, {resumenes[0]} resúmenes.")
+
+
+def _resumen(grupo: tuple, precios: list[float]) -> tuple:
+    return (*grupo, min(precios), max(precios), statistics.median(precios), len(precios))
+
+
+def _recalcular_resumenes(con: sqlite3.Connection, grupos: set | None) -> int:
+    """
+    MIN / MAX / mediana de cada (provincia, localidad, categoria, mes) de
+    `grupos`; con None, de todos, en una sola pasada ordenada por el índice
+    por ciudad. Devuelve cuántos resúmenes se escribieron.
+    """
+    insertar = "INSERT OR REPLACE INTO resumen VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+    if grupos is None:
+        con.execute("DELETE FROM resumen")
+        filas = con.execute(
+            "SELECT provincia, localidad, categoria, mes, precio FROM precios"
+            " ORDER BY provincia, localidad, categoria, mes"
+        )
+        resumenes = [
+            _resumen(grupo, [f[4] for f in del_grupo])
+            for grupo, del_grupo in groupby(filas, key=lambda f: f[:4])
+        ]
+        con.executemany(insertar, resumenes)
+        return len(resumenes)
+
+    resumenes = []
+    for grupo in grupos:
+        precios = [p for (p,) in con.execute(
+            "SELECT precio FROM precios"
+            " WHERE provincia = ? AND localidad = ? AND categoria = ? AND mes = ?",
+            grupo,
+        )]
+        resumenes.append(_resumen(grupo, precios))
+    con.executemany(insertar, resumenes)
+    return len(resumenes)
+
+
+def _conectar_lectura(db_path: Path) -> sqlite3.Connection:
+    # Solo lectura: si no existe el archivo, falla en vez de crearlo vacío
+    return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+
+
+def consultar_resumen(
+    localidad: str,
+    categoria: str,
+    desde: str = "",
+    hasta: str = "9999-99",
+    provincia: str | None = None,
+    db_path: Path = HISTORICO_DB,
+) -> list[tuple]:
+    """
+    Resúmenes mensuales (mes, provincia, localidad, categoria, minimo,
+    maximo, mediana, estaciones) de una ciudad y producto entre desde y
+    hasta (AAAA-MM, inclusive), del más viejo al más nuevo.
+    """
+    consulta = (
+        "SELECT mes, provincia, localidad, categoria, minimo, maximo, mediana, estaciones"
+        " FROM resumen WHERE localidad = ? AND categoria = ? AND mes BETWEEN ? AND ?"
+    )
+    params = [localidad, categoria, desde, hasta]
+    if provincia is not None:
+        consulta += " AND provincia = ?"
+        params.append(provincia)
+    con = _conectar_lectura(db_path)
+    try:
+        return con.execute(consulta + " ORDER BY mes, provincia", params).fetchall()
+    finally:
+        con.close()
+
+
+def _celda_consultada(
+    con: sqlite3.Connection, latitud: str, longitud: str, categoria: str, empresa: str | None
+) -> tuple | None:
+    """
+    La celda con precios de `categoria` (y de la bandera `empresa`, si se
+    pasa) más cercana al punto pedido, entre la suya y sus 8 vecinas: con
+    menos decimales que el CSV, el punto puede caer del otro lado del
+    redondeo. None si ninguna tiene.
+    """
+    celda = (normalizar_coordenada(latitud), normalizar_coordenada(longitud))
+    if not all(isinstance(c, int) for c in celda):
+        return celda
+    escala = 10 ** DECIMALES_COORDENADAS
+    punto = (float(latitud.replace(",", ".")) * escala, float(longitud.replace(",", ".")) * escala)
+    consulta = (
+        "SELECT DISTINCT celda_lat, celda_lon FROM precios"
+        " WHERE celda_lat BETWEEN ? AND ? AND celda_lon BETWEEN ? AND ? AND categoria = ?"
+    )
+    params = [celda[0] - 1, celda[0] + 1, celda[1] - 1, celda[1] + 1, categoria]
+    if empresa is not None:
+        consulta += " AND idempresabandera = ?"
+        params.append(empresa)
+    candidatas = con.execute(consulta, params).fetchall()
+    return min(candidatas, key=lambda c: (c[0] - punto[0]) ** 2 + (c[1] - punto[1]) ** 2, default=None)
+
+
+def consultar_estacion(
+    latitud: str,
+    longitud: str,
+    categoria: str,
+    desde: str = "",
+    hasta: str = "9999-99",
+    empresa: str | None = None,
+    db_path: Path = HISTORICO_DB,
+) -> list[tuple]:
+    """
+    Precio mensual (mes, localidad, direccion, idempresabandera,
+    empresabandera, precio) de una estación y producto, del más viejo al
+    más nuevo. La estación se busca por celda, como se guardó: "-27.4677"
+    encuentra la que en el CSV figura como "-27.46775123". Si en la celda
+    hay estaciones de varias banderas salen todas, salvo que se pida una
+    con `empresa` (idempresabandera).
+    """
+    con = _conectar_lectura(db_path)
+    try:
+        celda = _celda_consultada(con, latitud, longitud, categoria, empresa)
+        if celda is None:
+            return []
+        consulta = (
+            "SELECT mes, localidad, direccion, idempresabandera, empresabandera, precio"
+            " FROM precios WHERE celda_lat = ? AND celda_lon = ? AND categoria = ?"
+            " AND mes BETWEEN ? AND ?"
+        )
+        params = [*celda, categoria, desde, hasta]
+        if empresa is not None:
+            consulta += " AND idempresabandera = ?"
+            params.append(empresa)
+        return con.execute(consulta + " ORDER BY mes, idempresabandera", params).fetchall()
+    finally:
+        con.close()
+
+
+def renderizar_resumen(filas: list[tuple]) -> bytes:
+    """Respuesta de /historico por ciudad, con el mismo separador que precios.txt."""
+    return _renderizar(
+        ["mes", "provincia", "localidad", "categoria", "minimo", "maximo", "mediana", "estaciones"],
+        (f[:4] + (f"{f[4]:.2f}", f"{f[5]:.2f}", f"{f[6]:.2f}", f[7]) for f in filas),
+    )
+
+
+def renderizar_estacion(filas: list[tuple]) -> bytes:
+    """Respuesta de /historico para una estación."""
+    return _renderizar(
+        ["mes", "localidad", "direccion", "idempresabandera", "empresabandera", "precio"],
+        (f[:5] + (f"{f[5]:.2f}",) for f in filas),
+    )
+
+
+def _renderizar(encabezado: list[str], filas) -> bytes:
+    out = io.StringIO(newline="")
+    w = csv.writer(out, delimiter="|")
+    w.writerow(encabezado)
+    w.writerows(filas)
+    return out.getvalue().encode("utf-8")
@@ -0,0 +1,148 @@
+from collections import defaultdict
+import csv
+import io
+import math
+
+from procesarPrecios import PrecioEstacion, clasificar_producto
+
+
+# Lado de cada celda de la grilla, en grados (~11 km de latitud)
+CELDA_GRADOS = 0.1
+
+# Radio máximo aceptado por consulta: acota cuántas celdas se recorren
+RADIO_MAX_KM = 50.0
+
+# Cuántas estaciones se devuelven como máximo si no se pide otro límite
+LIMITE_CERCANAS = 10
+
+_RADIO_TIERRA_KM = 6371.0088
+_KM_POR_GRADO_LAT = math.pi * _RADIO_TIERRA_KM / 180
+
+
+def _coordenadas(r: PrecioEstacion) -> tuple[float, float] | None:
+    """(lat, lon) como float, o None si no son coordenadas válidas."""
+    try:
+        lat = float(r.latitud.replace(",", "."))
+        lon = float(r.longitud.replace(",", "."))
+    except ValueError:
+        return None
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+        return None  # también descarta nan
+    return lat, lon
+
+
+def _celda(lat: float, lon: float) -> tuple[int, int]:
+    return math.floor(lat / CELDA_GRADOS), math.floor(lon / CELDA_GRADOS)
+
+
+def _distancia_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Distancia de gran círculo (haversine)."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * _RADIO_TIERRA_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class IndiceCercanas:
+    """
+    Grilla espacial en memoria del último precio de cada estación de todo
+    el país, por categoría de producto. Se arma una vez por refresco de
+    datos (con el mismo por_estacion que el índice multi-ciudad) y cada
+    consulta solo mira las celdas que toca el radio pedido, no todas las
+    estaciones.
+    """
+
+    def __init__(self, por_estacion: dict, generado: float):
+        self.generado = generado
+
+        # categoria -> (celda_lat, celda_lon) -> [(lat, lon, estación)]
+        self._grilla: dict[str, dict[tuple[int, int], list]] = defaultdict(lambda: defaultdict(list))
+        self.estaciones = 0
+        for r in por_estacion.values():
+            coords = _coordenadas(r)
+            if coords is None:
+                continue
+            lat, lon = coords
+            self._grilla[r.categoria][_celda(lat, lon)].append((lat, lon, r))
+            self.estaciones += 1
+
+    @staticmethod
+    def categoria_consulta(producto: str) -> str | None:
+        """
+        Categoría interna para el parámetro producto: acepta tanto el nombre
+        de la categoría ("NAFTA SUPER") como el texto del CSV. None si no es
+        uno de los 4 productos.
+        """
+        return clasificar_producto(producto.strip())
+
+    def cercanas(
+        self,
+        lat: float,
+        lon: float,
+        radio_km: float,
+        categoria: str,
+        limite: int = LIMITE_CERCANAS,
+    ) -> list[tuple[float, PrecioEstacion]]:
+        """
+        Estaciones de la categoría a menos de radio_km de (lat, lon), como
+        pares (distancia_km, estación), de la más barata a la más cara (a
+        igual precio, la más cercana primero).
+        """
+        celdas = self._grilla.get(categoria)
+        if not celdas:
+            return []
+        radio_km = min(radio_km, RADIO_MAX_KM)
+
+        # Rectángulo de celdas que cubre el círculo. La longitud se estira
+        # con la latitud (usamos el extremo del rectángulo más cercano al polo).
+        dlat = radio_km / _KM_POR_GRADO_LAT
+        lat_polo = min(90.0, abs(lat) + dlat)
+        cos_lat = math.cos(math.radians(lat_polo))
+        dlon = 180.0 if cos_lat < 1e-6 else min(180.0, dlat / cos_lat)
+
+        c_lat_min, c_lon_min = _celda(lat - dlat, lon - dlon)
+        c_lat_max, c_lon_max = _celda(lat + dlat, lon + dlon)
+
+        encontradas = []
+        for c_lat in range(c_lat_min, c_lat_max + 1):
+            for c_lon in range(c_lon_min, c_lon_max + 1):
+                for e_lat, e_lon, r in celdas.get((c_lat, c_lon), ()):
+                    d = _distancia_km(lat, lon, e_lat, e_lon)
+                    if d <= radio_km:
+                        encontradas.append((d, r))
+
+        encontradas.sort(key=lambda e: (e[1].precio_num, e[0]))
+        return encontradas[:limite]
+
+
+def renderizar_cercanas(encontradas: list[tuple[float, PrecioEstacion]]) -> bytes:
+    """Respuesta de /cercanas: mismo formato que precios.txt, con la distancia."""
+    out = io.StringIO(newline="")
+    w = csv.writer(out, delimiter="|")
+    w.writerow([
+        "distancia_km",
+        "indice_tiempo",
+        "direccion",
+        "localidad",
+        "producto",
+        "precio",
+        "idempresabandera",
+        "empresabandera",
+        "latitud",
+        "longitud"
+    ])
+    for distancia, r in encontradas:
+        w.writerow([
+            f"{distancia:.2f}",
+            r.indice_tiempo,
+            r.direccion,
+            r.localidad,
+            r.producto,
+            r.precio,
+            r.idempresabandera,
+            r.empresabandera,
+            r.latitud,
+            r.longitud
+        ])
+    return out.getvalue().encode("utf-8")
@@ -0,0 +1,163 @@
+from collections import OrderedDict, defaultdict
+import threading
+
+from cuantiles import BosquejoCuantiles
+from procesarPrecios import (
+    EMPRESAS_PERMITIDAS,
+    PrecioEstacion,
+    calcular_filas_finales,
+    renderizar_estadisticas,
+    renderizar_precios_txt,
+    usa_cuantiles,
+)
+
+
+# Cuántas consultas distintas (combinaciones ciudad/empresas) se guardan ya resueltas
+CACHE_CONSULTAS_MAX = 4096
+
+
+class IndicePrecios:
+    """
+    Índice en memoria del último precio de cada estación de todo el país,
+    por (provincia, localidad, empresa, categoría). Sale de una sola pasada
+    del CSV (procesar_csv_nacional) y responde cualquier combinación de
+    ciudades / empresas sin volver a tocar el CSV.
+
+    Los bosquejos de cuantiles se arman recién cuando una respuesta los
+    necesita (estadísticas, o el segundo corte con FILTRO_OUTLIERS =
+    "cuantiles"), uno por grupo y una sola vez: los de una consulta (varias
+    ciudades / empresas) salen de combinar los de sus grupos.
+
+    Cada respuesta se calcula una vez y queda en cache hasta que se
+    reemplaza el índice (o sea, hasta el próximo refresco de datos).
+    """
+
+    def __init__(self, por_estacion: dict, generado: float, envolver=None):
+        """
+        envolver: opcional, transforma el precios.txt (bytes) de cada
+        consulta antes de cachearlo (p. ej. para precalcular ETag / gzip).
+        """
+        self.generado = generado
+        self._envolver = envolver or (lambda data: data)
+
+        # localidad -> (provincia, idempresabandera, categoria) -> estaciones
+        self._por_localidad: dict[str, dict[tuple[str, str, str], list[PrecioEstacion]]] = (
+            defaultdict(lambda: defaultdict(list))
+        )
+        for r in por_estacion.values():
+            self._por_localidad[r.localidad][(r.provincia, r.idempresabandera, r.categoria)].append(r)
+        self.estaciones = len(por_estacion)
+
+        # (localidad, grupo) -> bosquejo de cuantiles de sus precios, a medida que se piden
+        self._bosquejos: dict[tuple[str, tuple[str, str, str]], BosquejoCuantiles] = {}
+
+        self._cache: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def clave_consulta(
+        localidades: str, empresas: str | None = None, provincia: str | None = None
+    ) -> tuple:
+        """
+        Normaliza los parámetros del querystring ("POSADAS,OBERA", "2,4")
+        a una clave hasheable. Sin empresas, se usan las de precios.txt.
+        """
+        locs = tuple(sorted({l.strip().upper() for l in localidades.split(",") if l.strip()}))
+        if empresas:
+            emps = tuple(sorted({e.strip() for e in empresas.split(",") if e.strip()}))
+        else:
+            emps = tuple(sorted(EMPRESAS_PERMITIDAS))
+        prov = provincia.strip().upper() if provincia else None
+        return locs, emps, prov
+
+    def localidades_ambiguas(self, clave: tuple) -> dict[str, list[str]]:
+        """
+        Localidades de la consulta que existen en más de una provincia, con
+        sus provincias, si la consulta no fija una (vacío si no hay ninguna).
+        """
+        if clave[2] is not None:
+            return {}
+        provincias: dict[str, set[str]] = defaultdict(set)
+        for loc, (prov, _emp, _cat) in self._grupos(clave):
+            provincias[loc].add(prov)
+        return {loc: sorted(provs) for loc, provs in provincias.items() if len(provs) > 1}
+
+    def consultar(self, clave: tuple):
+        """precios.txt (pasado por `envolver`) para una clave de clave_consulta()."""
+        return self._cacheado(clave, lambda: renderizar_precios_txt(calcular_filas_finales(
+            self._estaciones(clave), self._bosquejos_consulta(clave) if usa_cuantiles() else None
+        )))
+
+    def consultar_estadisticas(self, clave: tuple | None = None):
+        """
+        Estadísticas por ciudad y producto (renderizar_estadisticas, pasado
+        por `envolver`) para una clave de clave_consulta(); con None, de
+        todas las ciudades y banderas.
+        """
+        return self._cacheado(("estadisticas", clave), lambda: renderizar_estadisticas(
+            self._bosquejos_consulta(clave)
+        ))
+
+    def _cacheado(self, clave: tuple, calcular):
+        with self._lock:
+            resultado = self._cache.get(clave)
+            if resultado is not None:
+                self._cache.move_to_end(clave)
+                self.hits += 1
+                return resultado
+
+        # Fuera del lock: dos misses simultáneos de la misma clave calculan
+        # lo mismo, y cualquiera de los dos resultados sirve
+        resultado = self._envolver(calcular())
+
+        with self._lock:
+            self.misses += 1
+            self._cache[clave] = resultado
+            if len(self._cache) > CACHE_CONSULTAS_MAX:
+                self._cache.popitem(last=False)
+        return resultado
+
+    def _grupos(self, clave: tuple | None):
+        """(localidad, (provincia, empresa, categoria)) de los grupos que entran en la consulta."""
+        if clave is None:
+            for loc, grupos in self._por_localidad.items():
+                for grupo in grupos:
+                    yield loc, grupo
+            return
+        localidades, empresas, provincia = clave
+        empresas = set(empresas)
+        for loc in localidades:
+            for grupo in self._por_localidad.get(loc, {}):
+                prov, emp, _cat = grupo
+                if emp in empresas and (provincia is None or prov == provincia):
+                    yield loc, grupo
+
+    def _estaciones(self, clave: tuple):
+        for loc, grupo in self._grupos(clave):
+            yield from self._por_localidad[loc][grupo]
+
+    def _bosquejo_grupo(self, loc: str, grupo: tuple[str, str, str]) -> BosquejoCuantiles:
+        bosquejo = self._bosquejos.get((loc, grupo))
+        if bosquejo is None:
+            # Sin lock, como en _cacheado: si dos consultas lo arman a la vez, los dos sirven
+            bosquejo = BosquejoCuantiles()
+            for r in self._por_localidad[loc][grupo]:
+                bosquejo.agregar(r.precio_num)
+            self._bosquejos[(loc, grupo)] = bosquejo
+        return bosquejo
+
+    def _bosquejos_consulta(self, clave: tuple | None) -> dict[tuple[str, str, str], BosquejoCuantiles]:
+        """
+        Bosquejo por (provincia, localidad, categoria) de la consulta,
+        combinando los de sus grupos (uno por bandera).
+        """
+        bosquejos: dict[tuple[str, str, str], BosquejoCuantiles] = {}
+        for loc, grupo in self._grupos(clave):
+            prov, _emp, cat = grupo
+            combinado = bosquejos.get((prov, loc, cat))
+            if combinado is None:
+                combinado = bosquejos[(prov, loc, cat)] = BosquejoCuantiles()
+            combinado.combinar(self._bosquejo_grupo(loc, grupo))
+        return bosquejos
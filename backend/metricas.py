@@ -0,0 +1,155 @@
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+
+
+# Límites de los histogramas (segundos): requests HTTP y etapas del pipeline
+BUCKETS_LATENCIA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BUCKETS_ETAPA = (0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# Todo el estado es del proceso. Los valores se actualizan bajo _lock; el
+# costo es un dict lookup por llamada, así que no va dentro de loops por fila.
+_lock = threading.Lock()
+_descripciones: dict[str, tuple[str, str]] = {}          # nombre -> (tipo, ayuda)
+_valores: dict[tuple[str, tuple], float] = {}            # contadores y gauges
+_histogramas: dict[tuple[str, tuple], list] = {}         # [por bucket..., suma, cantidad]
+_buckets: dict[str, tuple[float, ...]] = {}
+_recolectores: list = []
+_observadores_etapa: list = []
+
+
+def describir(nombre: str, tipo: str, ayuda: str):
+    """Tipo Prometheus (counter / gauge / histogram) y ayuda de una métrica."""
+    _descripciones[nombre] = (tipo, ayuda)
+
+
+def _clave(nombre: str, etiquetas: dict) -> tuple[str, tuple]:
+    return nombre, tuple(sorted(etiquetas.items()))
+
+
+def sumar(nombre: str, valor: float = 1.0, **etiquetas):
+    """Suma a un contador."""
+    clave = _clave(nombre, etiquetas)
+    with _lock:
+        _valores[clave] = _valores.get(clave, 0.0) + valor
+
+
+def fijar(nombre: str, valor: float, **etiquetas):
+    """Pisa el valor de un gauge."""
+    with _lock:
+        _valores[_clave(nombre, etiquetas)] = valor
+
+
+def observar(nombre: str, valor: float, buckets: tuple[float, ...] = BUCKETS_LATENCIA, **etiquetas):
+    """Suma una observación a un histograma."""
+    clave = _clave(nombre, etiquetas)
+    with _lock:
+        cubetas = _buckets.setdefault(nombre, buckets)
+        h = _histogramas.get(clave)
+        if h is None:
+            h = _histogramas[clave] = [0] * len(cubetas) + [0.0, 0]
+        i = bisect_left(cubetas, valor)
+        if i < len(cubetas):
+            h[i] += 1
+        h[-2] += valor
+        h[-1] += 1
+
+
+@contextmanager
+def etapa(nombre: str):
+    """Mide la duración de una etapa del pipeline (histograma + última duración)."""
+    with ExitStack() as observadores:
+        for fn in list(_observadores_etapa):
+            observadores.enter_context(fn(nombre))
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            segundos = time.perf_counter() - t0
+            observar("precios_etapa_segundos", segundos, BUCKETS_ETAPA, etapa=nombre)
+            fijar("precios_etapa_ultima_segundos", segundos, etapa=nombre)
+
+
+def observar_etapas(fn):
+    """
+    fn(nombre) devuelve un context manager que envuelve cada etapa que
+    empiece de acá en más (lo usa el perfilado). Se saca con
+    dejar_de_observar_etapas(fn).
+    """
+    _observadores_etapa.append(fn)
+
+
+def dejar_de_observar_etapas(fn):
+    _observadores_etapa.remove(fn)
+
+
+def registrar_recolector(fn):
+    """
+    fn() se llama en cada renderizar() y devuelve [(nombre, valor, etiquetas)]:
+    para valores que ya lleva otro objeto (p. ej. hits de una cache).
+    """
+    _recolectores.append(fn)
+
+
+def _etiquetas(etiquetas: tuple, extra: str = "") -> str:
+    partes = [
+        f'{k}="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in etiquetas
+    ]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+_LE_INF = 'le="+Inf"'
+
+
+def _numero(valor: float) -> str:
+    if math.isnan(valor):
+        return "NaN"
+    if math.isinf(valor):
+        return "+Inf" if valor > 0 else "-Inf"
+    return repr(float(valor)) if not float(valor).is_integer() else str(int(valor))
+
+
+def renderizar() -> bytes:
+    """Todas las métricas en formato de texto de Prometheus (versión 0.0.4)."""
+    recolectadas = []
+    for fn in _recolectores:
+        try:
+            recolectadas.extend(fn())
+        except Exception as e:
+            print(f"[ERROR] Falló un recolector de métricas: {e!r}")
+
+    with _lock:
+        series: dict[str, list[str]] = {}
+        for (nombre, etiquetas), valor in sorted(_valores.items()):
+            series.setdefault(nombre, []).append(f"{nombre}{_etiquetas(etiquetas)} {_numero(valor)}")
+        for nombre, valor, etiquetas in sorted(recolectadas, key=lambda r: (r[0], sorted(r[2].items()))):
+            clave = tuple(sorted(etiquetas.items()))
+            series.setdefault(nombre, []).append(f"{nombre}{_etiquetas(clave)} {_numero(valor)}")
+        for (nombre, etiquetas), h in sorted(_histogramas.items()):
+            lineas = series.setdefault(nombre, [])
+            acumulado = 0
+            for limite, n in zip(_buckets[nombre], h):
+                acumulado += n
+                le = f'le="{_numero(limite)}"'
+                lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas, le)} {acumulado}")
+            lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas, _LE_INF)} {h[-1]}")
+            lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {_numero(h[-2])}")
+            lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {h[-1]}")
+
+    salida = []
+    for nombre in sorted(series):
+        if nombre in _descripciones:
+            tipo, ayuda = _descripciones[nombre]
+            salida.append(f"# HELP {nombre} {ayuda}")
+            salida.append(f"# TYPE {nombre} {tipo}")
+        salida.extend(series[nombre])
+    return ("\n".join(salida) + "\n").encode("utf-8")
+
+
+describir("precios_etapa_segundos", "histogram", "Duración de cada etapa del pipeline de precios.")
+describir("precios_etapa_ultima_segundos", "gauge", "Duración de la última ejecución de cada etapa.")
@@ -1,82 +1,1056 @@
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+
+import argparse
+import gzip
+import hashlib
+import hmac
+import os
+import socket
+import sqlite3
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
 from pathlib import Path
+from urllib.parse import parse_qs
 
 # Importamos tu lógica de procesamiento
-from procesar_precios import procesar_csv_desde_web, CSV_URL, OUTPUT_TXT
+from procesarPrecios import (
+    CHECKPOINT_JSON,
+    clasificar_producto,
+    estadisticas_cache_productos,
+    generar_precios_txt,
+    meta_descarga,
+    procesar_csv_nacional,
+    LOCAL_CSV,
+    OUTPUT_TXT,
+    PROCESOS_PARSEO,
+    REFRESH_SECONDS,
+    SNAPSHOT_NACIONAL_BIN,
+)
+from indice_precios import IndicePrecios
+from indice_cercanas import IndiceCercanas, LIMITE_CERCANAS, renderizar_cercanas
+from historico_precios import (
+    IngestaHistorico,
+    consultar_estacion,
+    consultar_resumen,
+    renderizar_estacion,
+    renderizar_resumen,
+)
+from snapshot_binario import SnapshotBinario, guardar_snapshot, huella_csv, ultima_version
+from notificador_cambios import REINTENTO_MS, NotificadorCambios
+from delta_precios import HistorialVersiones
+import metricas
+import perfilado
 
-import ssl
-import time
+try:
+    import brotli  # opcional: si está instalado, ofrecemos también "br"
+except ImportError:
+    brotli = None
 
-from procesar_precios import generar_precios_txt, OUTPUT_TXT, REFRESH_SECONDS
+try:
+    import resource  # no existe en Windows: ahí queda el límite de archivos que haya
+except ImportError:
+    resource = None
 
 
 HOST = "127.0.0.1"
 PORT = 8080
 
+# Cuánto antes del vencimiento regeneramos en segundo plano
+REFRESH_ANTICIPO_SECONDS = 300  # 5 minutos
+
+# Si una regeneración falla, cuánto esperamos antes de reintentar
+REINTENTO_SECONDS = 60
+
+# Cantidad máxima de requests atendidos en paralelo (1 = servidor secuencial)
+MAX_WORKERS = 16
+
+# Conexiones persistentes (HTTP/1.1, con el servidor con pool): cuánto se
+# espera el próximo request de una conexión inactiva, y cuántos requests
+# se atienden como máximo por conexión antes de cerrarla
+KEEPALIVE_SECONDS = 15
+MAX_REQUESTS_POR_CONEXION = 1000
+
+# Conexiones abiertas a /cambios como máximo (cada una es un socket, sin hilo)
+MAX_SUSCRIPTORES_CAMBIOS = 50_000
+
+# Procesos que parsean el CSV en cada regeneración (1 = en serie)
+PROCESOS = PROCESOS_PARSEO
+
+# Secreto compartido para las rutas /admin (POST con "Authorization: Bearer
+# <token>"). Sin la variable definida, /admin queda deshabilitado. No se mira
+# la IP de origen: detrás de un proxy todos los requests llegan desde él
+ADMIN_TOKEN_ENV = "PRECIOS_ADMIN_TOKEN"
+
+# Si True, en cada refresco también se arma el índice de todo el país para
+# responder /precios.txt?localidad=...&empresas=... sin reprocesar el CSV
+# (y /estadisticas.txt: p10 / mediana / p90 por ciudad y producto)
+INDICE_MULTICIUDAD = True
+
+# Si True, en cada refresco también se arma la grilla de estaciones para
+# responder /cercanas?lat=..&lon=..&radio_km=..&producto=..
+INDICE_CERCANAS = True
+
+# Si True, la misma pasada por el CSV de cada refresco suma al histórico
+# (SQLite) los meses nuevos, para responder /historico?localidad=..&producto=..&desde=..&hasta=..
+HISTORICO = True
+
+
+def _comprimir_variantes(data: bytes) -> dict[str, bytes]:
+    """Cuerpos precomprimidos por Content-Encoding (siempre incluye "identity")."""
+    variantes = {"identity": data}
+    # mtime=0 para que el gzip sea el mismo byte a byte entre regeneraciones
+    variantes["gzip"] = gzip.compress(data, compresslevel=9, mtime=0)
+    if brotli is not None:
+        variantes["br"] = brotli.compress(data, quality=11)
+    # Si comprimido no es más chico (archivo mínimo), no vale la pena ofrecerlo
+    return {
+        cod: cuerpo for cod, cuerpo in variantes.items()
+        if cod == "identity" or len(cuerpo) < len(data)
+    }
+
+
+# Orden de preferencia cuando el cliente acepta varias con la misma q
+_PREFERENCIA_CODIFICACION = ("br", "gzip", "identity")
+
+
+class SnapshotPrecios:
+    """
+    Contenido de precios.txt ya cargado en memoria, listo para servir.
+    ETag, Last-Modified y las variantes comprimidas se calculan una sola
+    vez, al regenerar.
+    """
+
+    def __init__(self, data: bytes, generado: float):
+        self.data = data
+        self.generado = generado  # epoch de la regeneración que lo produjo
+        self.etag = '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+        # Lo que se anuncia en /cambios: si el contenido no cambia, tampoco cambia
+        self.version = self.etag.strip('"')
+        self.last_modified = formatdate(int(generado), usegmt=True)
+        self.cuerpos = _comprimir_variantes(data)
+        # Cada representación necesita su propio ETag fuerte
+        self.etags = {
+            cod: self.etag if cod == "identity" else f'{self.etag[:-1]}-{cod}"'
+            for cod in self.cuerpos
+        }
+
+    def elegir_codificacion(self, accept_encoding: str | None) -> str:
+        """Negocia Content-Encoding según Accept-Encoding (con q-values)."""
+        if not accept_encoding:
+            return "identity"
+
+        calidades: dict[str, float] = {}
+        for parte in accept_encoding.split(","):
+            nombre, _, params = parte.partition(";")
+            nombre = nombre.strip().lower()
+            q = 1.0
+            params = params.strip()
+            if params.startswith("q="):
+                try:
+                    q = float(params[2:])
+                except ValueError:
+                    q = 0.0
+            if nombre:
+                calidades[nombre] = q
+
+        def calidad(cod: str) -> float:
+            if cod in calidades:
+                return calidades[cod]
+            if cod == "identity":
+                # Sin mención explícita, identity es aceptable pero la última opción
+                return 0.001
+            return calidades.get("*", 0.0)
+
+        disponibles = [c for c in _PREFERENCIA_CODIFICACION if c in self.cuerpos]
+        mejor = max(disponibles, key=lambda c: (calidad(c), -disponibles.index(c)))
+        return mejor if calidad(mejor) > 0 else "identity"
+
+    def no_modificado(
+        self, if_none_match: str | None, if_modified_since: str | None, codificacion: str = "identity"
+    ) -> bool:
+        """
+        True si el cliente ya tiene esta versión en la codificación que se
+        le va a mandar (corresponde responder 304).
+        """
+        # If-None-Match manda; If-Modified-Since solo se mira si no vino (RFC 9110)
+        if if_none_match is not None:
+            etags = [e.strip() for e in if_none_match.split(",")]
+            # Solo el ETag de la variante negociada: con el de otra, el 304
+            # le diría al cliente que su cuerpo es esta representación.
+            # Comparación débil: W/"x" vale lo mismo que "x"
+            propio = self.etags[codificacion]
+            return "*" in etags or any(e.removeprefix("W/") == propio for e in etags)
+
+        if if_modified_since is not None:
+            try:
+                desde = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(self.generado) <= desde
+
+        return False
+
+
+# Último snapshot bueno. Se reemplaza entero (nunca se modifica in situ),
+# así que los handlers lo leen sin lock.
+_snapshot: SnapshotPrecios | None = None
 _last_refresh = 0.0
 
-def asegurar_precios_actualizados():
+# Índice multi-ciudad; también se reemplaza entero en cada refresco
+_indice: IndicePrecios | None = None
+
+# Grilla de estaciones cercanas; ídem
+_cercanas: IndiceCercanas | None = None
+
+# Snapshot binario (mapeado en memoria) del que salieron los índices; ídem
+_binario: SnapshotBinario | None = None
+
+# Protege _snapshot/_last_refresh al publicarlos
+_estado_lock = threading.Lock()
+
+# Una sola regeneración a la vez: el que llega mientras hay una en curso
+# espera esa y se queda con su resultado (single-flight)
+_refresco_lock = threading.Lock()
+_ultimo_resultado = False
+
+# Para medir cuánto tarda, desde el arranque, la primera respuesta útil
+_arranque: float | None = None
+_primer_byte_lock = threading.Lock()
+_primer_byte_reportado = False
+
+# Ruta del reporte si el próximo refresco tiene que ir perfilado (la pide
+# POST /admin/perfilar; la consume refrescar_precios). Protegida por _estado_lock
+_perfil_pendiente: Path | None = None
+
+# Suscriptos a /cambios: se les avisa cada versión nueva de precios.txt
+_notificador = NotificadorCambios(MAX_SUSCRIPTORES_CAMBIOS)
+
+# Últimas versiones de precios.txt, para responder /precios.txt?since=<versión>
+_historial = HistorialVersiones()
+
+# Despierta al hilo de refresco antes de tiempo (lo usan los handlers
+# cuando ven el snapshot vencido, y el apagado)
+_despertar = threading.Event()
+
+
+def _cargar_snapshot_desde_disco() -> SnapshotPrecios | None:
+    """Levanta el precios.txt que haya en disco (por ejemplo, de la corrida anterior)."""
+    try:
+        data = OUTPUT_TXT.read_bytes()
+        generado = OUTPUT_TXT.stat().st_mtime
+    except FileNotFoundError:
+        return None
+    return SnapshotPrecios(data, generado)
+
+
+def refrescar_precios() -> bool:
     """
-    Si pasó más de REFRESH_SECONDS desde la última actualización
-    o no existe precios.txt, lo regeneramos.
+    Regenera precios.txt y, si salió bien, lo publica como snapshot nuevo.
+    Si falla, el snapshot anterior sigue vigente. Devuelve True si refrescó.
+
+    Si ya hay una regeneración en curso no se lanza otra: se espera a que
+    termine y se devuelve su resultado.
     """
-    global _last_refresh
-    ahora = time.time()
+    global _ultimo_resultado
 
-    if (not OUTPUT_TXT.exists()) or (ahora - _last_refresh > REFRESH_SECONDS):
-        print("[INFO] Regenerando precios.txt (trigger desde servidor HTTPS)...")
-        generar_precios_txt()
-        _last_refresh = ahora
-    else:
-        print("[INFO] Usando precios.txt en caché.")
+    if not _refresco_lock.acquire(blocking=False):
+        with _refresco_lock:
+            return _ultimo_resultado
+
+    try:
+        ruta_perfil = _tomar_perfil_pendiente()
+        if ruta_perfil is None:
+            _ultimo_resultado = _regenerar_y_publicar()
+        else:
+            with perfilado.perfilar(ruta_perfil, "refresco de la mini web"):
+                _ultimo_resultado = _regenerar_y_publicar()
+        return _ultimo_resultado
+    finally:
+        _refresco_lock.release()
+
+
+def pedir_refresco_perfilado() -> tuple[Path, bool]:
+    """
+    Hace que el próximo refresco (que se pide ya) corra con cProfile y
+    tracemalloc. Devuelve (ruta del reporte, False si ya había uno pedido
+    que todavía no corrió: en ese caso la ruta es la de ese).
+    """
+    global _perfil_pendiente
+
+    with _estado_lock:
+        nuevo = _perfil_pendiente is None
+        if nuevo:
+            _perfil_pendiente = perfilado.ruta_por_defecto()
+        ruta = _perfil_pendiente
+    solicitar_refresco()
+    return ruta, nuevo
+
+
+def _tomar_perfil_pendiente() -> Path | None:
+    global _perfil_pendiente
+
+    with _estado_lock:
+        ruta, _perfil_pendiente = _perfil_pendiente, None
+    return ruta
+
+
+def _regenerar_y_publicar() -> bool:
+    global _snapshot, _last_refresh
+
+    print("[INFO] Regenerando precios.txt en segundo plano...")
+    try:
+        # El CSV también tiene que considerarse viejo con la misma anticipación,
+        # si no regeneraríamos con los datos de la hora anterior.
+        por_estacion = generar_precios_txt(
+            max_edad_csv=REFRESH_SECONDS - REFRESH_ANTICIPO_SECONDS, procesos=PROCESOS,
+            historico=_ingesta_historico(),
+        )
+        nuevo = _cargar_snapshot_desde_disco()
+    except Exception as e:
+        print(f"[ERROR] Falló la regeneración de precios.txt: {e!r}")
+        metricas.sumar("precios_refrescos_total", resultado="error")
+        return False
+
+    if nuevo is None:
+        print("[ERROR] La regeneración no dejó precios.txt en disco.")
+        metricas.sumar("precios_refrescos_total", resultado="error")
+        return False
+    metricas.sumar("precios_refrescos_total", resultado="ok")
+
+    _historial.agregar(nuevo.version, nuevo.data)
+    with _estado_lock:
+        _snapshot = nuevo
+        _last_refresh = nuevo.generado
+    _notificador.publicar(nuevo.version)
+
+    if INDICE_MULTICIUDAD or INDICE_CERCANAS:
+        # Del mismo por_estacion que precios.txt: una sola pasada por el CSV
+        _reconstruir_indice(por_estacion)
+    return True
+
+
+def _reconstruir_indice(por_estacion: dict | None = None):
+    """
+    Arma el índice multi-ciudad y la grilla de cercanas con el por_estacion
+    de todo el país (si no se pasa, se procesa el CSV local) y deja el
+    resultado en SNAPSHOT_NACIONAL_BIN para el próximo arranque. Si falla,
+    quedan los anteriores.
+    """
+    global _binario
+
+    try:
+        # Nadie toca el CSV entre el procesamiento y esto (un solo refresco a la vez)
+        fuente = huella_csv(LOCAL_CSV)
+        if por_estacion is None:
+            por_estacion = procesar_csv_nacional(PROCESOS, _ingesta_historico())
+    except Exception as e:
+        print(f"[ERROR] Falló el armado del índice multi-ciudad: {e!r}")
+        return
+
+    generado = time.time()
+    _publicar_indices(por_estacion, generado)
+
+    try:
+        _binario = SnapshotBinario(guardar_snapshot(por_estacion, SNAPSHOT_NACIONAL_BIN, generado, fuente))
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] No se pudo guardar el snapshot binario: {e!r}")
+
+
+def _ingesta_historico() -> IngestaHistorico | None:
+    """
+    Con HISTORICO, lo que se le pasa al parseo del CSV para que sume al
+    histórico en la misma pasada. Todo parseo tiene que llevarlo: si uno
+    avanza el checkpoint sin el histórico, el siguiente reprocesa todo.
+    """
+    return IngestaHistorico() if HISTORICO else None
+
+
+def _cargar_indices_desde_binario() -> bool:
+    """
+    Arma los índices desde la última versión de SNAPSHOT_NACIONAL_BIN, sin
+    tocar el CSV. Aunque sea de un CSV anterior se usa igual (mejor que
+    nada mientras se reprocesa): _indices_al_dia() dice si hace falta
+    reconstruirlos.
+    """
+    global _binario
+
+    try:
+        binario = SnapshotBinario(ultima_version(SNAPSHOT_NACIONAL_BIN))
+    except (OSError, ValueError):
+        return False
+
+    _publicar_indices(binario.por_estacion(), binario.generado)
+    _binario = binario
+    return True
+
+
+def _indices_al_dia() -> bool:
+    """True si hay índices y salieron del LOCAL_CSV que hay ahora en disco."""
+    if (INDICE_MULTICIUDAD and _indice is None) or (INDICE_CERCANAS and _cercanas is None):
+        return False
+    if _binario is None:
+        # Se armaron del CSV pero no se pudo guardar el binario: son los últimos
+        return True
+    try:
+        return _binario.vigente_para(huella_csv(LOCAL_CSV))
+    except OSError:
+        return True  # sin CSV no hay de dónde reconstruirlos
+
+
+def _publicar_indices(por_estacion: dict, generado: float):
+    global _indice, _cercanas
+
+    if INDICE_MULTICIUDAD:
+        # Cada consulta se cachea ya con su ETag / gzip calculados
+        _indice = IndicePrecios(
+            por_estacion, generado, envolver=lambda data: SnapshotPrecios(data, generado)
+        )
+        print(f"[INFO] Índice multi-ciudad listo ({_indice.estaciones} estaciones).")
+    if INDICE_CERCANAS:
+        _cercanas = IndiceCercanas(por_estacion, generado)
+        print(f"[INFO] Grilla de cercanas lista ({_cercanas.estaciones} estaciones).")
+
+
+def _segundos_hasta_proximo_refresco() -> float:
+    with _estado_lock:
+        vence = _last_refresh + REFRESH_SECONDS - REFRESH_ANTICIPO_SECONDS
+    return max(0.0, vence - time.time())
+
+
+def solicitar_refresco():
+    """Pide al hilo de refresco que regenere ya. No bloquea y varios pedidos se juntan en uno."""
+    _despertar.set()
+
+
+def _loop_refresco(stop: threading.Event):
+    # Si arrancamos con un precios.txt vigente no hay refresco inmediato,
+    # pero si los índices no están (o son de otro CSV) hay que armarlos igual
+    if (INDICE_MULTICIUDAD or INDICE_CERCANAS) and not _indices_al_dia():
+        if _segundos_hasta_proximo_refresco() > 0:
+            _reconstruir_indice()
+
+    while not stop.is_set():
+        espera = _segundos_hasta_proximo_refresco()
+        if espera > 0:
+            _despertar.wait(espera)
+            if stop.is_set():
+                return
+        # Los pedidos que llegaron hasta acá quedan cubiertos por esta regeneración
+        _despertar.clear()
+        if not refrescar_precios():
+            # Tras un fallo esperamos sí o sí, aunque los handlers sigan pidiendo
+            stop.wait(REINTENTO_SECONDS)
+
+
+def iniciar_refresco_en_segundo_plano() -> threading.Event:
+    """
+    Carga de disco el último precios.txt y los índices del snapshot binario
+    (si hay), así se sirve desde el primer request aunque estén vencidos, y
+    arranca el hilo que los regenera. Devuelve el Event para frenarlo.
+    """
+    global _snapshot, _last_refresh, _arranque
+
+    if _arranque is None:
+        _arranque = time.perf_counter()
+
+    inicial = _cargar_snapshot_desde_disco()
+    if inicial is not None:
+        _historial.agregar(inicial.version, inicial.data)
+        with _estado_lock:
+            _snapshot = inicial
+            _last_refresh = inicial.generado
+    if INDICE_MULTICIUDAD or INDICE_CERCANAS:
+        _cargar_indices_desde_binario()
+    _informar_arranque(inicial)
+
+    stop = threading.Event()
+    hilo = threading.Thread(
+        target=_loop_refresco, args=(stop,), name="refresco-precios", daemon=True
+    )
+    hilo.start()
+    return stop
+
+
+def _informar_arranque(inicial: SnapshotPrecios | None):
+    """Con qué datos arrancó el servidor y cuánto tardó en poder servirlos."""
+    listo_ms = (time.perf_counter() - _arranque) * 1000
+    if inicial is None:
+        print(f"[INFO] Arranque en frío: no hay precios.txt en disco ({listo_ms:.0f} ms).")
+        return
+
+    edad_min = (time.time() - inicial.generado) / 60
+    meta = meta_descarga() or {}
+    print(
+        f"[INFO] Arranque en caliente en {listo_ms:.0f} ms: precios.txt de hace "
+        f"{edad_min:.1f} min, índices {'al día' if _indices_al_dia() else 'a revalidar'}, "
+        f"CSV ETag {meta.get('etag')}, checkpoint {'sí' if CHECKPOINT_JSON.exists() else 'no'}."
+    )
+
+
+def _registrar_primer_byte(path: str):
+    """Deja en el log cuánto tardó la primera respuesta desde el arranque (una sola vez)."""
+    global _primer_byte_reportado
+
+    if _primer_byte_reportado or _arranque is None:
+        return
+    with _primer_byte_lock:
+        if _primer_byte_reportado:
+            return
+        _primer_byte_reportado = True
+    ms = (time.perf_counter() - _arranque) * 1000
+    print(f"[INFO] Primera respuesta ({path}) a {ms:.0f} ms del arranque.")
+
+
+def _metricas_estado() -> list[tuple[str, float, dict]]:
+    """Recolector de /metrics: valores que ya llevan el snapshot, el índice y las caches."""
+    valores = []
+    snapshot = _snapshot
+    if snapshot is not None:
+        valores.append(("precios_snapshot_edad_segundos", time.time() - snapshot.generado, {}))
+    indice = _indice
+    if indice is not None:
+        valores.append(("precios_indice_consultas_total", indice.hits, {"resultado": "hit"}))
+        valores.append(("precios_indice_consultas_total", indice.misses, {"resultado": "miss"}))
+    valores.append(("precios_cambios_suscriptores", _notificador.suscriptores, {}))
+    cache = estadisticas_cache_productos()
+    valores.append(("precios_cache_productos_total", cache["hits"], {"resultado": "hit"}))
+    valores.append(("precios_cache_productos_total", cache["misses"], {"resultado": "miss"}))
+    return valores
+
+
+metricas.registrar_recolector(_metricas_estado)
+metricas.describir("precios_refrescos_total", "counter", "Regeneraciones de precios.txt, por resultado.")
+metricas.describir("precios_snapshot_edad_segundos", "gauge", "Antigüedad del precios.txt que se sirve.")
+metricas.describir("precios_cambios_suscriptores", "gauge", "Conexiones abiertas a /cambios.")
+metricas.describir(
+    "precios_indice_consultas_total", "counter",
+    "Consultas al índice multi-ciudad resueltas desde su cache (hit) o calculadas (miss).",
+)
+metricas.describir(
+    "precios_cache_productos_total", "counter",
+    "Clasificaciones de producto resueltas por la cache (hit) o calculadas (miss).",
+)
+metricas.describir("precios_http_request_segundos", "histogram", "Duración de los requests, por ruta y estado.")
+
+# Rutas conocidas: cualquier otra se cuenta como "otra" (que el path no
+# sea una etiqueta, si no cada URL inventada crea una serie nueva)
+_RUTAS_METRICAS = frozenset((
+    "/", "/precios.txt", "/precios.bin", "/estadisticas.txt", "/historico", "/cercanas", "/cambios",
+    "/health", "/metrics", "/admin/perfilar",
+))
+
+
+def detener_refresco(stop: threading.Event):
+    stop.set()
+    _despertar.set()
+
+
+class ServidorPreciosConcurrente(ThreadingHTTPServer):
+    """
+    ThreadingHTTPServer con un pool fijo de hilos en vez de un hilo nuevo
+    por conexión. Si todos los workers están ocupados, las conexiones
+    nuevas esperan en la cola del pool.
+
+    Con keep-alive cada conexión ocupa su worker mientras está abierta,
+    también entre requests. Para que unas pocas conexiones inactivas no
+    dejen esperando a las nuevas, cuando hay conexiones en cola se cierra
+    una inactiva (el cliente reabre y reintenta, como con cualquier
+    conexión keep-alive que cierra el servidor).
+    """
+
+    # Conexiones pendientes del listen() (el kernel lo recorta a somaxconn):
+    # con las 5 de socketserver, una ráfaga de conexiones nuevas (p. ej. los
+    # suscriptos de /cambios reconectando) desborda la cola y cada cliente
+    # que queda afuera tarda ~1 s en reintentar el SYN
+    request_queue_size = 1024
+
+    keep_alive = True
+
+    def __init__(self, server_address, handler_class, max_workers: int = MAX_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="http")
+        self._max_workers = max_workers
+        # Conexiones entregadas al pool (atendiéndose, inactivas o en cola)
+        # y handlers inactivos esperando su próximo request
+        self._conexiones = 0
+        self._inactivas: set = set()
+        self._conexiones_lock = threading.Lock()
+        super().__init__(server_address, handler_class)
+
+    def process_request(self, request, client_address):
+        with self._conexiones_lock:
+            self._conexiones += 1
+            if self._conexiones > self._max_workers and self._inactivas:
+                self._inactivas.pop().cerrar_inactiva()
+        self._pool.submit(self._atender, request, client_address)
+
+    def _atender(self, request, client_address):
+        try:
+            self.process_request_thread(request, client_address)
+        finally:
+            with self._conexiones_lock:
+                self._conexiones -= 1
+
+    def hay_conexiones_en_cola(self) -> bool:
+        return self._conexiones > self._max_workers
+
+    def marcar_inactiva(self, handler, inactiva: bool) -> bool:
+        """
+        Anota (o saca) un handler que espera el próximo request de su
+        conexión. Devuelve False si no conviene esperarlo porque hay
+        conexiones en cola: el handler tiene que cerrar la suya.
+        """
+        with self._conexiones_lock:
+            if not inactiva:
+                self._inactivas.discard(handler)
+                return True
+            if self._conexiones > self._max_workers:
+                return False
+            self._inactivas.add(handler)
+            return True
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=False, cancel_futures=True)
 
 
 class PreciosHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1: la conexión queda abierta para los próximos requests salvo
+    # que el cliente o el servidor manden "Connection: close"
+    protocol_version = "HTTP/1.1"
+
+    # Timeout de cada lectura del socket; entre requests es el tiempo
+    # máximo que una conexión keep-alive queda inactiva
+    timeout = KEEPALIVE_SECONDS
+
+    # Headers y cuerpo van en dos send(): sin esto, en una conexión
+    # reusada Nagle retiene el cuerpo hasta el ACK (diferido) del cliente
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self._requests = 0
+        self._inactiva = False
+
+    def handle_one_request(self):
+        if self._requests:
+            # Conexión keep-alive esperando su próximo request
+            self._inactiva = True
+            if not self.server.marcar_inactiva(self, True):
+                self._inactiva = False
+                self.close_connection = True
+                return
+        try:
+            super().handle_one_request()
+        finally:
+            self._salir_de_inactiva()
+
+    def parse_request(self):
+        # Ya llegó la línea del request: la conexión deja de estar inactiva
+        self._salir_de_inactiva()
+        self._requests += 1
+        return super().parse_request()
+
+    def _salir_de_inactiva(self):
+        if self._inactiva:
+            self._inactiva = False
+            self.server.marcar_inactiva(self, False)
+
+    def cerrar_inactiva(self):
+        """
+        Corta la espera del próximo request (la llama el servidor): la
+        lectura vuelve vacía, como si el cliente hubiera cerrado.
+        """
+        try:
+            self.connection.shutdown(socket.SHUT_RD)
+        except OSError:
+            pass
+
     def do_GET(self):
-        # Normalizamos path (ignoramos querystring)
-        path = self.path.split("?", 1)[0]
+        self._medir(self._despachar)
 
-        if path in ("/", "/precios.txt"):
-            # Intentamos actualizar (si falla, por lo menos servimos lo último que haya)
-            asegurar_precios_actualizados()
+    def do_POST(self):
+        self._medir(self._despachar_post)
 
-            try:
-                data = OUTPUT_TXT.read_bytes()
-            except FileNotFoundError:
-                self.send_response(503)
-                self.send_header("Content-Type", "text/plain; charset=utf-8")
-                self.end_headers()
-                self.wfile.write(b"No hay precios.txt disponible\n")
+    def _medir(self, despachar):
+        t0 = time.perf_counter()
+        self._estado = None
+        try:
+            despachar()
+        finally:
+            path = self.path.partition("?")[0]
+            metricas.observar(
+                "precios_http_request_segundos", time.perf_counter() - t0,
+                ruta=path if path in _RUTAS_METRICAS else "otra",
+                estado=str(self._estado or 500),
+            )
+
+    def _despachar(self):
+        # Normalizamos path (el querystring solo se usa para consultas al índice)
+        path, _, query = self.path.partition("?")
+        params = parse_qs(query)
+
+        if path in ("/", "/precios.txt") and "localidad" in params:
+            self._servir_consulta(params)
+
+        elif path in ("/", "/precios.txt"):
+            # Nunca regeneramos acá: servimos el último snapshot bueno
+            snapshot = _snapshot
+            if snapshot is None or time.time() - snapshot.generado > REFRESH_SECONDS:
+                # Vencido (p. ej. porque falló el último refresco): pedimos
+                # otro al hilo de fondo, pero no lo esperamos
+                solicitar_refresco()
+            if snapshot is None:
+                self._responder_texto(503, b"No hay precios.txt disponible\n", reintentar=True)
+                return
+
+            if "since" in params and self._servir_delta(params["since"][0], snapshot):
                 return
+            self._servir_snapshot(snapshot)
 
+        elif path == "/precios.bin":
+            self._servir_binario()
+
+        elif path == "/estadisticas.txt":
+            self._servir_estadisticas(params)
+
+        elif path == "/historico":
+            self._servir_historico(params)
+
+        elif path == "/cercanas":
+            self._servir_cercanas(params)
+
+        elif path == "/cambios":
+            self._servir_cambios(params)
+
+        elif path == "/health":
+            self._responder_texto(200, b"OK\n")
+
+        elif path == "/metrics":
+            data = metricas.renderizar()
             self.send_response(200)
-            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
             self.send_header("Content-Length", str(len(data)))
             self.end_headers()
             self.wfile.write(data)
 
-        elif path == "/health":
-            self.send_response(200)
-            self.send_header("Content-Type", "text/plain; charset=utf-8")
-            self.end_headers()
-            self.wfile.write(b"OK\n")
+        else:
+            self._responder_texto(404, b"Not found\n")
 
+    def _despachar_post(self):
+        path = self.path.partition("?")[0]
+        if path != "/admin/perfilar":
+            self._responder_texto(404, b"Not found\n")
+        elif not self._admin_autorizado():
+            # Un refresco perfilado es caro: solo con el token de administración
+            self._responder_texto(403, b"Falta el token de administracion o no coincide\n")
         else:
-            self.send_response(404)
-            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            ruta, nuevo = pedir_refresco_perfilado()
+            mensaje = "Refresco perfilado pedido" if nuevo else "Ya había un refresco perfilado pedido"
+            self._responder_texto(202 if nuevo else 409, f"{mensaje}; reporte en {ruta}\n".encode("utf-8"))
+
+    def _admin_autorizado(self) -> bool:
+        """True si el request trae el token de ADMIN_TOKEN_ENV (y la variable está definida)."""
+        token = os.environ.get(ADMIN_TOKEN_ENV)
+        if not token:
+            return False
+        esquema, _, recibido = self.headers.get("Authorization", "").partition(" ")
+        # compare_digest: el tiempo de la comparación no dice cuántos caracteres coinciden
+        return esquema.lower() == "bearer" and hmac.compare_digest(recibido.encode(), token.encode())
+
+    def _responder_texto(self, code: int, data: bytes, reintentar: bool = False):
+        """Respuesta corta en texto plano; reintentar agrega Retry-After (para los 503)."""
+        self.send_response(code)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        if reintentar:
+            self.send_header("Retry-After", str(REINTENTO_SECONDS))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _servir_consulta(self, params: dict[str, list[str]]):
+        """precios.txt para otras ciudades / empresas, resuelto desde el índice."""
+        indice = _indice
+        if indice is None:
+            self._responder_texto(503, b"Indice multi-ciudad no disponible todavia\n", reintentar=True)
+            return
+
+        clave = IndicePrecios.clave_consulta(
+            params["localidad"][0],
+            params.get("empresas", [None])[0],
+            params.get("provincia", [None])[0],
+        )
+        ambiguas = indice.localidades_ambiguas(clave)
+        if ambiguas:
+            # precios.txt no tiene columna provincia: sin ella no se distinguen
+            detalle = "; ".join(f"{loc}: {', '.join(provs)}" for loc, provs in ambiguas.items())
+            self._responder_texto(
+                400, f"Localidad en varias provincias ({detalle}), agregar &provincia=..\n".encode("utf-8")
+            )
+            return
+        self._servir_snapshot(indice.consultar(clave))
+
+    def _servir_estadisticas(self, params: dict[str, list[str]]):
+        """
+        Cuantiles de precio por ciudad y producto, desde el índice: de todo
+        el país y todas las banderas, o filtrado como /precios.txt?localidad=..
+        """
+        indice = _indice
+        if indice is None:
+            self._responder_texto(503, b"Indice multi-ciudad no disponible todavia\n", reintentar=True)
+            return
+
+        clave = None
+        if "localidad" in params:
+            clave = IndicePrecios.clave_consulta(
+                params["localidad"][0],
+                params.get("empresas", [None])[0],
+                params.get("provincia", [None])[0],
+            )
+        self._servir_snapshot(indice.consultar_estadisticas(clave))
+
+    def _servir_binario(self):
+        """El snapshot binario de todo el país, directo desde el mmap (sin copiarlo)."""
+        binario = _binario
+        if binario is None:
+            self._responder_texto(503, b"Snapshot binario no disponible todavia\n", reintentar=True)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(binario.datos)))
+        self.send_header("Last-Modified", formatdate(int(binario.generado), usegmt=True))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(binario.datos)
+
+    def _servir_historico(self, params: dict[str, list[str]]):
+        """Serie mensual de una ciudad (resúmenes) o de una estación, desde el histórico."""
+        def param(nombre, defecto=None):
+            return params.get(nombre, [defecto])[0]
+
+        categoria = clasificar_producto(param("producto", ""))
+        desde, hasta = param("desde", ""), param("hasta", "9999-99")
+        try:
+            if categoria is not None and "lat" in params and "lon" in params:
+                data = renderizar_estacion(
+                    consultar_estacion(param("lat"), param("lon"), categoria, desde, hasta, param("empresa"))
+                )
+            elif categoria is not None and "localidad" in params:
+                provincia = param("provincia")
+                data = renderizar_resumen(consultar_resumen(
+                    param("localidad").strip().upper(), categoria, desde, hasta,
+                    provincia.strip().upper() if provincia else None,
+                ))
+            else:
+                data = None
+        except sqlite3.Error as e:
+            print(f"[ERROR] Consulta al histórico: {e!r}")
+            self._responder_texto(503, b"Historico no disponible todavia\n", reintentar=True)
+            return
+
+        if data is None:
+            self._responder_texto(
+                400,
+                b"Uso: /historico?localidad=..&producto=..[&provincia=..]"
+                b" o /historico?lat=..&lon=..&producto=..[&empresa=..], con &desde=AAAA-MM&hasta=AAAA-MM\n",
+            )
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _servir_cercanas(self, params: dict[str, list[str]]):
+        """Estaciones más baratas de un producto dentro de un radio, desde la grilla."""
+        cercanas = _cercanas
+        if cercanas is None:
+            self._responder_texto(503, b"Indice de estaciones cercanas no disponible todavia\n", reintentar=True)
+            return
+
+        try:
+            lat = float(params["lat"][0])
+            lon = float(params["lon"][0])
+            radio_km = float(params.get("radio_km", ["5"])[0])
+            limite = int(params.get("limite", [str(LIMITE_CERCANAS)])[0])
+            categoria = IndiceCercanas.categoria_consulta(params["producto"][0])
+        except (KeyError, ValueError):
+            categoria = None
+        if categoria is None or not (-90 <= lat <= 90 and -180 <= lon <= 180) or not radio_km > 0 or limite <= 0:
+            self._responder_texto(400, b"Uso: /cercanas?lat=..&lon=..&radio_km=..&producto=..[&limite=..]\n")
+            return
+
+        data = renderizar_cercanas(cercanas.cercanas(lat, lon, radio_km, categoria, limite))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Last-Modified", formatdate(int(cercanas.generado), usegmt=True))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _servir_cambios(self, params: dict[str, list[str]]):
+        """
+        Server-Sent Events con la versión de precios.txt: una apenas se
+        conecta si el cliente no la tiene (Last-Event-ID o ?version=), y
+        otra cada vez que una regeneración cambia el contenido. La conexión
+        se le cede al notificador: no se queda con un worker.
+        """
+        if not _notificador.hay_lugar():
+            self._responder_texto(503, b"Demasiados suscriptos a /cambios\n", reintentar=True)
+            return
+        snapshot = _snapshot
+        if snapshot is not None:
+            _notificador.publicar(snapshot.version)  # por si todavía no la conoce
+        version_cliente = self.headers.get("Last-Event-ID") or params.get("version", [None])[0]
+
+        # Sin Content-Length: el cuerpo dura lo que dure la conexión
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        # Que un proxy (p. ej. nginx) no retenga los eventos en su buffer
+        self.send_header("X-Accel-Buffering", "no")
+        self.end_headers()
+        self.wfile.write(f"retry: {REINTENTO_MS}\n\n".encode("ascii"))
+
+        # Desprendido, el socket ya no lo cierra el servidor al terminar este handler
+        _notificador.suscribir(socket.socket(fileno=self.connection.detach()), version_cliente)
+
+    def _servir_delta(self, since: str, snapshot: SnapshotPrecios) -> bool:
+        """
+        Solo las filas que cambiaron desde la versión `since` (ver
+        delta_precios). Devuelve False, sin responder, si no hay delta para
+        esa versión (desconocida o ya olvidada): ahí va el archivo entero.
+        """
+        delta = _historial.delta_desde(since.strip().strip('"'))
+        if delta is None:
+            return False
+        version, data = delta
+        if version != snapshot.version:
+            return False  # el historial ya tiene una versión que _snapshot todavía no
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("X-Precios-Version", version)
+        self.send_header("X-Precios-Delta-Desde", since)
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(data)
+        return True
+
+    def _servir_snapshot(self, snapshot: SnapshotPrecios):
+        codificacion = snapshot.elegir_codificacion(self.headers.get("Accept-Encoding"))
+
+        if snapshot.no_modificado(
+            self.headers.get("If-None-Match"),
+            self.headers.get("If-Modified-Since"),
+            codificacion,
+        ):
+            self.send_response(304)
+            self._headers_validacion(snapshot, codificacion)
             self.end_headers()
-            self.wfile.write(b"Not found\n")
+            return
+
+        data = snapshot.cuerpos[codificacion]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        if codificacion != "identity":
+            self.send_header("Content-Encoding", codificacion)
+        self.send_header("Content-Length", str(len(data)))
+        self._headers_validacion(snapshot, codificacion)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _headers_validacion(self, snapshot: SnapshotPrecios, codificacion: str):
+        self.send_header("ETag", snapshot.etags[codificacion])
+        # Para pedir después solo lo que cambió: ?since=<versión>
+        self.send_header("X-Precios-Version", snapshot.version)
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Last-Modified", snapshot.last_modified)
+        # Que los clientes y proxies revaliden siempre (y reciban 304 si no cambió)
+        self.send_header("Cache-Control", "no-cache")
+
+    def send_response(self, code, message=None):
+        super().send_response(code, message)
+        self._estado = code
+        if (
+            self.close_connection  # lo pidió el cliente, o es HTTP/1.0
+            or not getattr(self.server, "keep_alive", False)
+            or self._requests >= MAX_REQUESTS_POR_CONEXION
+            or self.server.hay_conexiones_en_cola()
+        ):
+            # Avisamos que cerramos (send_header también marca close_connection)
+            self.send_header("Connection", "close")
+        if code < 400:
+            _registrar_primer_byte(self.path)
+
+    def log_error(self, format, *args):
+        # Que venza o se cierre una conexión keep-alive inactiva no es un error
+        if not self._inactiva:
+            super().log_error(format, *args)
 
     # Para que no spamee logs feos
     def log_message(self, format, *args):
         print(f"[HTTP] {self.address_string()} {self.requestline} -> {format % args}")
 
 
-def run():
-    server = HTTPServer((HOST, PORT), PreciosHandler)
-    print(f"[INFO] Mini web levantada en http://{HOST}:{PORT}/precios.txt")
+def crear_servidor(host: str = HOST, port: int = PORT, max_workers: int = MAX_WORKERS) -> HTTPServer:
+    """
+    Servidor secuencial si max_workers <= 1, si no uno con pool de
+    max_workers hilos. El secuencial cierra cada conexión después de
+    responder: una conexión keep-alive lo dejaría tomado.
+    """
+    if max_workers <= 1:
+        return HTTPServer((host, port), PreciosHandler)
+    return ServidorPreciosConcurrente((host, port), PreciosHandler, max_workers=max_workers)
+
+
+def subir_limite_de_archivos(necesarios: int | None = None):
+    """
+    Cada suscripto de /cambios es un socket abierto: el límite blando de
+    descriptores queda corto. Lo sube (sin pasar el duro) a `necesarios`;
+    con None, lo que hace falta para MAX_SUSCRIPTORES_CAMBIOS.
+    """
+    if resource is None:
+        return
+    blando, duro = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if necesarios is None:
+        necesarios = MAX_SUSCRIPTORES_CAMBIOS + 1024
+    objetivo = necesarios if duro == resource.RLIM_INFINITY else min(duro, necesarios)
+    if blando != resource.RLIM_INFINITY and blando < objetivo:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (objetivo, duro))
+        except (ValueError, OSError) as e:
+            print(f"[WARN] No se pudo subir el límite de archivos abiertos ({blando}): {e!r}")
+
+
+def run(max_workers: int = MAX_WORKERS, procesos: int = PROCESOS_PARSEO):
+    global PROCESOS, _arranque
+
+    _arranque = time.perf_counter()
+    PROCESOS = procesos
+    subir_limite_de_archivos()
+    iniciar_refresco_en_segundo_plano()
+    server = crear_servidor(HOST, PORT, max_workers)
+    print(f"[INFO] Mini web levantada en http://{HOST}:{PORT}/precios.txt ({max_workers} workers)")
     server.serve_forever()
 
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="Mini web que sirve precios.txt")
+    parser.add_argument(
+        "--workers", type=int, default=MAX_WORKERS,
+        help="requests atendidos en paralelo (1 = secuencial)",
+    )
+    parser.add_argument(
+        "--procesos", type=int, default=PROCESOS_PARSEO,
+        help="procesos que parsean el CSV en cada regeneración (1 = en serie)",
+    )
+    args = parser.parse_args()
+    run(max_workers=args.workers, procesos=args.procesos)
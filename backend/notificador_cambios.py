@@ -0,0 +1,186 @@
+import collections
+import selectors
+import socket
+import threading
+import time
+
+
+# Cada cuánto se manda un comentario SSE a cada suscripto: mantiene viva
+# la conexión a través de proxies y descubre los clientes que se fueron
+LATIDO_SECONDS = 30
+
+# Lo que puede quedar sin enviar a un cliente lento antes de cortarlo
+MAX_PENDIENTE_BYTES = 1 << 16
+
+# Cuánto espera un cliente EventSource antes de reconectarse
+REINTENTO_MS = 5000
+
+_LATIDO = b":\n\n"
+
+
+def evento_version(version: str) -> bytes:
+    """Evento SSE con la versión nueva (id también, para Last-Event-ID al reconectar)."""
+    return f"id: {version}\nevent: version\ndata: {version}\n\n".encode("ascii")
+
+
+class NotificadorCambios:
+    """
+    Conexiones abiertas de /cambios (Server-Sent Events), todas en un solo
+    hilo con un selector (epoll / kqueue): un suscripto inactivo cuesta un
+    socket y una entrada en el selector, no un hilo. El handler HTTP
+    responde los headers y le cede el socket con suscribir().
+
+    Cuando publicar() recibe una versión distinta de la anterior, se la
+    manda a todos los suscriptos; el que se suscribe con una versión vieja
+    (o sin versión) la recibe enseguida.
+    """
+
+    def __init__(self, max_suscriptores: int):
+        self.max_suscriptores = max_suscriptores
+        self.suscriptores = 0
+        self.version: str | None = None
+
+        self._lock = threading.Lock()
+        self._entrantes: collections.deque = collections.deque()   # (socket, versión del cliente)
+        self._hilo: threading.Thread | None = None
+
+        # Solo los usa el hilo del selector
+        self._selector = selectors.DefaultSelector()
+        self._pendientes: dict[socket.socket, bytes] = {}
+        self._version_enviada: str | None = None
+
+        # Para despertar al selector desde otros hilos
+        self._despertador, self._aviso = socket.socketpair()
+        self._despertador.setblocking(False)
+        self._aviso.setblocking(False)
+
+    def hay_lugar(self) -> bool:
+        return self.suscriptores + len(self._entrantes) < self.max_suscriptores
+
+    def suscribir(self, sock: socket.socket, version_cliente: str | None):
+        """Se queda con sock (ya con los headers enviados) hasta que el cliente se vaya."""
+        self._iniciar()
+        with self._lock:
+            self._entrantes.append((sock, version_cliente))
+        self._despertar()
+
+    def publicar(self, version: str):
+        """Anuncia una versión nueva (si es la misma que la anterior, no hace nada)."""
+        with self._lock:
+            if version == self.version:
+                return
+            self.version = version
+        self._despertar()
+
+    def _iniciar(self):
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._loop, name="cambios", daemon=True)
+                self._hilo.start()
+
+    def _despertar(self):
+        try:
+            self._aviso.send(b"\0")
+        except BlockingIOError:
+            pass  # ya hay avisos sin leer: el selector se va a despertar igual
+
+    def _loop(self):
+        self._selector.register(self._despertador, selectors.EVENT_READ)
+        proximo_latido = time.monotonic() + LATIDO_SECONDS
+        while True:
+            espera = max(0.0, proximo_latido - time.monotonic())
+            for clave, eventos in self._selector.select(espera):
+                sock = clave.fileobj
+                if sock is self._despertador:
+                    self._vaciar_despertador()
+                elif self._registrado(sock):  # pudo cerrarse por un evento anterior de esta vuelta
+                    if eventos & selectors.EVENT_READ:
+                        self._leer(sock)
+                    if eventos & selectors.EVENT_WRITE and self._registrado(sock):
+                        self._enviar(sock, b"")
+
+            self._atender_entrantes()
+
+            if time.monotonic() >= proximo_latido:
+                for sock in self._clientes():
+                    self._enviar(sock, _LATIDO)
+                proximo_latido = time.monotonic() + LATIDO_SECONDS
+
+    def _registrado(self, sock: socket.socket) -> bool:
+        try:
+            self._selector.get_key(sock)
+        except (KeyError, ValueError):
+            return False
+        return True
+
+    def _clientes(self) -> list[socket.socket]:
+        return [c.fileobj for c in self._selector.get_map().values() if c.fileobj is not self._despertador]
+
+    def _vaciar_despertador(self):
+        try:
+            while self._despertador.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _atender_entrantes(self):
+        with self._lock:
+            entrantes = list(self._entrantes)
+            self._entrantes.clear()
+            version = self.version
+
+        for sock, version_cliente in entrantes:
+            sock.setblocking(False)
+            self._selector.register(sock, selectors.EVENT_READ)
+            self.suscriptores += 1
+            if version is not None and version != version_cliente:
+                self._enviar(sock, evento_version(version))
+
+        if version is not None and version != self._version_enviada:
+            self._version_enviada = version
+            evento = evento_version(version)
+            nuevos = {sock for sock, _ in entrantes}
+            for sock in self._clientes():
+                if sock not in nuevos:
+                    self._enviar(sock, evento)
+
+    def _leer(self, sock: socket.socket):
+        # El cliente no tiene nada que mandar: lo que llegue se descarta, y
+        # una lectura vacía es que cerró
+        try:
+            datos = sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            datos = b""
+        if not datos:
+            self._cerrar(sock)
+
+    def _enviar(self, sock: socket.socket, datos: bytes):
+        datos = self._pendientes.pop(sock, b"") + datos
+        if not datos:
+            return
+        try:
+            enviados = sock.send(datos)
+        except BlockingIOError:
+            enviados = 0
+        except OSError:
+            self._cerrar(sock)
+            return
+
+        resto = datos[enviados:]
+        if len(resto) > MAX_PENDIENTE_BYTES:
+            self._cerrar(sock)
+        elif resto:
+            self._pendientes[sock] = resto
+            self._selector.modify(sock, selectors.EVENT_READ | selectors.EVENT_WRITE)
+        elif enviados and self._selector.get_key(sock).events & selectors.EVENT_WRITE:
+            self._selector.modify(sock, selectors.EVENT_READ)
+
+    def _cerrar(self, sock: socket.socket):
+        if not self._registrado(sock):
+            return
+        self._selector.unregister(sock)
+        self._pendientes.pop(sock, None)
+        self.suscriptores -= 1
+        sock.close()
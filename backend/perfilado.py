@@ -0,0 +1,179 @@
+"""
+Perfilado opcional del pipeline: cProfile de todo lo que corre dentro de
+perfilar() y, por cada etapa de metricas.etapa, memoria al entrar / salir,
+pico y las líneas que más memoria asignaron (tracemalloc).
+
+Deja dos archivos: el reporte de texto en la ruta pedida y, al lado, las
+estadísticas crudas de cProfile (.prof, para pstats / snakeviz).
+
+Solo mide el hilo que llama a perfilar(); con procesos > 1 el parseo de
+los procesos hijos no aparece en el perfil (sí su tiempo, en la etapa).
+tracemalloc hace bastante más lento todo: no dejarlo prendido.
+"""
+import contextlib
+import cProfile
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+import metricas
+
+
+# Dónde quedan los reportes si no se pide una ruta
+PERFILES_DIR = Path("perfiles")
+
+# Cuántos reportes (cada uno con su .prof) se guardan en PERFILES_DIR; al
+# escribir uno nuevo se borran los más viejos
+PERFILES_MAX = 20
+
+# Cuántas funciones (cProfile) y líneas (tracemalloc, por etapa) se listan
+TOP_FUNCIONES = 40
+TOP_ASIGNACIONES = 10
+
+# No se puede tener más de un perfilado a la vez (cProfile no se anida)
+_en_curso = threading.Lock()
+
+# Lo que asigna el propio perfilado no interesa
+_FILTROS_TRACEMALLOC = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, metricas.__file__),
+    tracemalloc.Filter(False, contextlib.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def ruta_por_defecto() -> Path:
+    # Con milisegundos: dos refrescos perfilados seguidos no se pisan el reporte
+    ahora = time.time()
+    fecha = time.strftime("%Y%m%d_%H%M%S", time.localtime(ahora))
+    return PERFILES_DIR / f"perfil_{fecha}_{int(ahora * 1000) % 1000:03d}.txt"
+
+
+class _Etapas:
+    """Observador de metricas.etapa: memoria y asignaciones de cada etapa del hilo perfilado."""
+
+    def __init__(self):
+        self._hilo = threading.get_ident()
+        self._pila: list[list] = []   # [pico visto hasta ahora] por etapa abierta
+        self.resultados: list[tuple] = []
+
+    @contextmanager
+    def __call__(self, nombre: str):
+        if threading.get_ident() != self._hilo:
+            yield
+            return
+
+        actual, pico = tracemalloc.get_traced_memory()
+        # Las etapas se anidan: el pico de la de afuera incluye el de las de adentro
+        if self._pila:
+            self._pila[-1][0] = max(self._pila[-1][0], pico)
+        tracemalloc.reset_peak()
+        antes = tracemalloc.take_snapshot().filter_traces(_FILTROS_TRACEMALLOC)
+        self._pila.append([0])
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            segundos = time.perf_counter() - t0
+            final, pico = tracemalloc.get_traced_memory()
+            pico = max(self._pila.pop()[0], pico)
+            if self._pila:
+                self._pila[-1][0] = max(self._pila[-1][0], pico)
+            despues = tracemalloc.take_snapshot().filter_traces(_FILTROS_TRACEMALLOC)
+            top = despues.compare_to(antes, "lineno")[:TOP_ASIGNACIONES]
+            self.resultados.append((nombre, len(self._pila), segundos, actual, final, pico, top))
+
+
+@contextmanager
+def perfilar(ruta: Path | None = None, titulo: str = "generar_precios_txt"):
+    """
+    Perfila lo que corre adentro del with y escribe el reporte en ruta
+    (ruta_por_defecto() si es None). Si ya hay un perfilado en curso,
+    RuntimeError.
+    """
+    if not _en_curso.acquire(blocking=False):
+        raise RuntimeError("Ya hay un perfilado en curso")
+    ruta = Path(ruta) if ruta is not None else ruta_por_defecto()
+
+    etapas = _Etapas()
+    ya_trazaba = tracemalloc.is_tracing()
+    if not ya_trazaba:
+        tracemalloc.start()
+    perfil = cProfile.Profile()
+    metricas.observar_etapas(etapas)
+    t0 = time.perf_counter()
+    try:
+        perfil.enable()
+        try:
+            yield ruta
+        finally:
+            perfil.disable()
+    finally:
+        total = time.perf_counter() - t0
+        metricas.dejar_de_observar_etapas(etapas)
+        if not ya_trazaba:
+            tracemalloc.stop()
+        try:
+            _escribir_reporte(ruta, titulo, total, perfil, etapas.resultados)
+            print(f"[INFO] Perfil de {titulo} en {ruta.resolve()}")
+            if ruta.parent == PERFILES_DIR:
+                _podar_perfiles()
+        except OSError as e:
+            print(f"[ERROR] No se pudo escribir el perfil en {ruta}: {e!r}")
+        finally:
+            _en_curso.release()
+
+
+def _podar_perfiles():
+    """Deja en PERFILES_DIR solo los PERFILES_MAX reportes más nuevos (ruta_por_defecto ordena por fecha)."""
+    reportes = sorted(PERFILES_DIR.glob("perfil_*.txt"))
+    for viejo in reportes[:-PERFILES_MAX]:
+        viejo.unlink(missing_ok=True)
+        viejo.with_suffix(".prof").unlink(missing_ok=True)
+
+
+def _mib(n: int) -> str:
+    return f"{n / (1 << 20):8.1f} MiB"
+
+
+def _escribir_reporte(ruta: Path, titulo: str, total: float, perfil: cProfile.Profile, etapas: list):
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    crudo = ruta.with_suffix(".prof")
+    perfil.dump_stats(crudo)
+
+    out = io.StringIO()
+    out.write(f"# Perfil de {titulo}: {time.strftime('%Y-%m-%d %H:%M:%S')}, {total:.3f} s en total\n")
+    out.write(f"# Estadísticas crudas de cProfile: {crudo.name}\n\n")
+
+    out.write("## Etapas (tracemalloc; en el orden en que terminaron)\n\n")
+    if not etapas:
+        out.write("(ninguna etapa medida)\n")
+    for nombre, nivel, segundos, antes, despues, pico, top in etapas:
+        sangria = "  " * nivel
+        out.write(
+            f"{sangria}{nombre}: {segundos:.3f} s, memoria {_mib(antes).strip()} -> "
+            f"{_mib(despues).strip()}, pico {_mib(pico).strip()}\n"
+        )
+        for diferencia in top:
+            if diferencia.size_diff == 0:
+                continue
+            frame = diferencia.traceback[0]
+            out.write(
+                f"{sangria}    {diferencia.size_diff / 1024:+12.1f} KiB {diferencia.count_diff:+9d} bloques"
+                f"  {frame.filename}:{frame.lineno}\n"
+            )
+    out.write("\n")
+
+    out.write(f"## cProfile (tiempo acumulado, top {TOP_FUNCIONES})\n\n")
+    stats = pstats.Stats(perfil, stream=out)
+    stats.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCIONES)
+    out.write(f"## cProfile (tiempo propio, top {TOP_FUNCIONES})\n\n")
+    stats.sort_stats(pstats.SortKey.TIME).print_stats(TOP_FUNCIONES)
+
+    ruta.write_text(out.getvalue(), encoding="utf-8")
@@ -1,8 +1,26 @@
+import argparse
 import csv
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
 import time
+import urllib.error
 import urllib.request
 from pathlib import Path
-from collections import defaultdict
+from collections import Counter, defaultdict
+from collections.abc import Collection
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from typing import Iterable, NamedTuple
+
+import metricas
+from cuantiles import BosquejoCuantiles
+from historico_precios import IngestaHistorico, celda_de, desempate
+from registro_estaciones import RegistroEstaciones
 
 # URL DIRECTA de descarga del CSV (link "DESCARGAR" del dataset oficial)
 CSV_DOWNLOAD_URL = (
@@ -18,6 +36,57 @@ OUTPUT_TXT = Path("precios.txt")
 # Tiempo máximo de vida del CSV local (en segundos)
 REFRESH_SECONDS = 3600  # 1 hora
 
+# Si True, el CSV se procesa a medida que baja (y se copia a disco al vuelo)
+# en vez de bajarlo entero y después releerlo
+DESCARGA_STREAMING = True
+
+# Tamaño de los bloques que se leen de la red / disco
+CHUNK_BYTES = 1 << 16
+
+# ETag / Last-Modified / tamaño de la última descarga (para pedir solo lo nuevo)
+CSV_META_JSON = Path(LOCAL_CSV.name + ".meta.json")
+
+# Bytes ya descargados que se vuelven a pedir para verificar que el
+# remoto sea el mismo archivo con filas agregadas al final: los últimos
+# (el solape con la cola nueva) y los primeros (una muestra del principio)
+RANGE_SOLAPE_BYTES = 1 << 12
+
+# Las muestras solo verifican el principio y la cola: cada tanto bajamos todo
+# igual, por si corrigieron filas del medio sin cambiar el tamaño de lo ya descargado
+DESCARGA_COMPLETA_CADA_SECONDS = 24 * 3600
+
+# Descartar por texto las líneas sin "Diurno" antes de parsearlas como CSV
+PREFILTRO_RAPIDO = True
+
+# Procesos que parsean LOCAL_CSV en paralelo, cada uno un rango de bytes
+# (1 = todo en este proceso). Se puede pisar con --workers.
+PROCESOS_PARSEO = 1
+
+# Con menos bytes que esto por proceso, repartir cuesta más de lo que ahorra
+MIN_BYTES_POR_PROCESO = 1 << 22
+
+# Estado persistido entre corridas para procesar solo las filas nuevas (el
+# por_estacion de todo el país: de él salen precios.txt y el índice multi-ciudad)
+CHECKPOINT_JSON = Path("precios_checkpoint.json")
+PROCESAMIENTO_INCREMENTAL = True
+_VERSION_CHECKPOINT = 5
+
+# Id estable de cada estación (ver registro_estaciones.py); se guarda con el checkpoint
+REGISTRO_ESTACIONES_JSON = Path("precios_estaciones.json")
+
+# Resultado del procesamiento de todo el país en binario (ver snapshot_binario.py):
+# con él, la mini web arranca con los índices armados sin releer el CSV. Cada
+# guardado es una versión aparte (precios_nacional.<ms>.bin)
+SNAPSHOT_NACIONAL_BIN = Path("precios_nacional.bin")
+
+# Filas del CSV que se juntan por estación, producto y mes antes de pasarlas
+# al histórico (ver _reducir_con_historico): acota la memoria de la ingesta
+LOTE_HISTORICO = 200_000
+
+# Si está definida, `python procesarPrecios.py` perfila la corrida (como
+# --perfilar): vacía o "1" deja el reporte en perfiles/, si no es la ruta
+PERFIL_ENV = "PRECIOS_PERFIL"
+
 # Filtros de negocio
 LOCALIDADES_PERMITIDAS = {"CORRIENTES", "PASO DE LOS LIBRES"}
 EMPRESAS_PERMITIDAS = {"2", "4", "28"}  # 2=YPF, 4=Shell, 28=PUMA
@@ -25,15 +94,58 @@ EMPRESAS_PERMITIDAS = {"2", "4", "28"}  # 2=YPF, 4=Shell, 28=PUMA
 # Desviación máxima razonable entre precios de un mismo producto en una ciudad
 MAX_DESVIACION = 150.0
 
+# Qué precios de una ciudad y producto se descartan antes de elegir MAX/MIN:
+# "banda" (los que están más de MAX_DESVIACION por debajo del máximo) o
+# "cuantiles" (los que caen lejos del rango p10-p90, para abajo o para arriba)
+FILTRO_OUTLIERS = "banda"
+
+# Con "cuantiles": se aceptan hasta MARGEN_CUANTILES x (p90 - p10) por debajo
+# del p10 o por encima del p90, pero nunca menos de MARGEN_MINIMO_CUANTILES
+# pesos (si casi todas las estaciones cobran lo mismo, p90 - p10 es 0)
+MARGEN_CUANTILES = 1.0
+MARGEN_MINIMO_CUANTILES = 50.0
+
+# Cuantiles de cada ciudad y producto que se publican (ver renderizar_estadisticas)
+CUANTILES_PUBLICADOS = (0.1, 0.5, 0.9)
+
+# Salida de `python procesarPrecios.py --estadisticas`: las de todo el país,
+# como /estadisticas.txt de la mini web sin filtros
+ESTADISTICAS_TXT = Path("estadisticas.txt")
+
+
+class FiltroProceso(NamedTuple):
+    """Qué localidades / empresas se procesan. None = todas."""
+    localidades: frozenset[str] | None
+    empresas: frozenset[str] | None
+
+
+# Todo el país, todas las banderas: lo que procesa el pipeline (precios.txt
+# es el segundo corte sobre las estaciones de _filtro_configurado())
+FILTRO_NACIONAL = FiltroProceso(None, None)
+
+
+def _filtro_configurado() -> FiltroProceso:
+    """El filtro de precios.txt, leído de los globales al momento de usarlo."""
+    return FiltroProceso(frozenset(LOCALIDADES_PERMITIDAS), frozenset(EMPRESAS_PERMITIDAS))
+
 
 # ------------ HELPERS PARA PRODUCTOS Y PRECIOS ------------
 
+# Se arma una sola vez (antes se rearmaba en cada llamada)
+_SIN_TILDES = str.maketrans("ÁÉÍÓÚ", "AEIOU")
+
+# Hay pocas decenas de textos de producto distintos en todo el dataset:
+# cacheamos la clasificación por texto crudo. El límite es por seguridad.
+CACHE_PRODUCTOS_MAX = 1024
+
+
+@lru_cache(maxsize=CACHE_PRODUCTOS_MAX)
 def _normalizar_texto(nombre: str) -> str:
     """Mayúsculas, sin tildes, espacios normalizados, y GASOIL unificado."""
     if not nombre:
         return ""
     nombre = nombre.upper()
-    nombre = nombre.translate(str.maketrans("ÁÉÍÓÚ", "AEIOU"))
+    nombre = nombre.translate(_SIN_TILDES)
     # Unificar GASOIL / GAS OIL
     nombre = nombre.replace("GASOIL", "GAS OIL")
     # Compactar espacios múltiples
@@ -41,54 +153,93 @@ def _normalizar_texto(nombre: str) -> str:
     return nombre
 
 
-def _clasificar_producto(producto: str) -> str | None:
+def clasificar_producto(producto: str) -> str | None:
     """
     Devuelve una categoría interna para los 4 productos que te interesan.
-    Si no es uno de esos 4, devuelve None (lo descartamos).
+    Si no es uno de esos 4, devuelve None (lo descartamos). Acepta tanto
+    el texto del CSV como el nombre de la categoría ("NAFTA SUPER"), así
+    sirve también para el parámetro producto de la mini web.
+    """
+    clasificacion = _categoria_y_minimo(producto)
+    return clasificacion[0] if clasificacion is not None else None
+
+
+@lru_cache(maxsize=CACHE_PRODUCTOS_MAX)
+def _categoria_y_minimo(producto: str) -> tuple[str, float] | None:
+    """
+    (categoría, precio mínimo aceptado) para el texto crudo del producto,
+    o None si no es uno de los 4 que nos interesan.
+
+    Gas Oil Grado 2 / 3 -> mínimo 1600
+    Nafta Super / Premium -> mínimo 1500
     """
     p = _normalizar_texto(producto)
 
     if "GAS OIL" in p and "GRADO 2" in p:
-        return "GAS OIL GRADO 2"
+        return "GAS OIL GRADO 2", 1600.0
     if "GAS OIL" in p and "GRADO 3" in p:
-        return "GAS OIL GRADO 3"
+        return "GAS OIL GRADO 3", 1600.0
     if "NAFTA" in p and "SUPER" in p:
-        return "NAFTA SUPER"
+        return "NAFTA SUPER", 1500.0
     if "NAFTA" in p and "PREMIUM" in p:
-        return "NAFTA PREMIUM"
+        return "NAFTA PREMIUM", 1500.0
 
     return None
 
 
-def _filtrar_y_parsear_precio(producto: str, precio_str: str) -> float | None:
+# Uso de la cache de _categoria_y_minimo en los procesos de _procesar_en_paralelo:
+# cada uno tiene la suya y devuelve lo que hizo con ella (ver _uso_cache_productos)
+_cache_productos_procesos = Counter()
+
+
+def estadisticas_cache_productos() -> dict[str, int]:
     """
-    Aplica los mínimos por producto y devuelve el precio como float.
-    Si el precio es inválido o está por debajo del mínimo, devuelve None.
+    Hits/misses de la cache de clasificación (para confirmar que no cuesta
+    nada), contando también los de los procesos de _procesar_en_paralelo.
+    tamano es el de la cache más grande.
+    """
+    info = _categoria_y_minimo.cache_info()
+    procesos = _cache_productos_procesos
+    return {
+        "hits": info.hits + procesos["hits"],
+        "misses": info.misses + procesos["misses"],
+        "tamano": max(info.currsize, procesos["tamano"]),
+    }
 
-    Gas Oil Grado 2 / 3 -> mínimo 1600
-    Nafta Super / Premium -> mínimo 1500
-    Otros productos -> se descartan (no nos interesan).
+
+def _uso_cache_productos(antes) -> dict[str, int]:
+    """
+    Hits/misses de la cache de clasificación desde `antes` (un cache_info()
+    anterior) y su tamaño: lo que un proceso hizo con su copia, que hereda
+    los contadores del padre al arrancar.
     """
+    info = _categoria_y_minimo.cache_info()
+    return {"hits": info.hits - antes.hits, "misses": info.misses - antes.misses, "tamano": info.currsize}
+
+
+def _parsear_precio(precio_str: str) -> float | None:
+    """Precio del CSV (a veces con coma decimal) como float, o None si es inválido."""
     if not precio_str:
         return None
-
-    precio_str = precio_str.replace(",", ".")
     try:
-        precio = float(precio_str)
+        return float(precio_str.replace(",", "."))
     except ValueError:
         return None
 
-    categoria = _clasificar_producto(producto)
-    if categoria is None:
+
+def _filtrar_y_parsear_precio(producto: str, precio_str: str) -> float | None:
+    """
+    Aplica los mínimos por producto y devuelve el precio como float.
+    Si el precio es inválido o está por debajo del mínimo, devuelve None.
+    Otros productos -> se descartan (no nos interesan).
+    """
+    clasificacion = _categoria_y_minimo(producto)
+    if clasificacion is None:
         # Producto que no es uno de los 4 que queremos.
         return None
 
-    if categoria in ("GAS OIL GRADO 2", "GAS OIL GRADO 3"):
-        minimo = 1600.0
-    else:  # NAFTA SUPER / NAFTA PREMIUM
-        minimo = 1500.0
-
-    if precio < minimo:
+    precio = _parsear_precio(precio_str)
+    if precio is None or precio < clasificacion[1]:
         return None
 
     return precio
@@ -96,218 +247,1312 @@ def _filtrar_y_parsear_precio(producto: str, precio_str: str) -> float | None:
 
 # ------------ DESCARGA DEL CSV ------------
 
-def descargar_csv_si_necesario():
-    """Si el CSV local no existe o tiene más de 1 hora, lo descarga de nuevo."""
-    ahora = time.time()
+def _csv_local_vigente(max_edad: float) -> bool:
+    """True si el CSV local existe y tiene menos de max_edad segundos."""
+    if not LOCAL_CSV.exists():
+        return False
+
+    edad = time.time() - LOCAL_CSV.stat().st_mtime
+    minutos = edad / 60.0
+    if edad < max_edad:
+        print(f"[INFO] CSV local vigente ({minutos:.1f} min). No se descarga de nuevo.")
+        return True
+
+    print(f"[INFO] CSV local viejo ({minutos:.1f} min). Se refresca desde la web.")
+    return False
 
-    if LOCAL_CSV.exists():
-        edad = ahora - LOCAL_CSV.stat().st_mtime
-        minutos = edad / 60.0
-        if edad < REFRESH_SECONDS:
-            print(f"[INFO] CSV local vigente ({minutos:.1f} min). No se descarga de nuevo.")
-            return
-        else:
-            print(f"[INFO] CSV local viejo ({minutos:.1f} min). Se refresca desde la web.")
-            try:
-                LOCAL_CSV.unlink()
-            except OSError:
-                pass
 
-    print(f"[INFO] Descargando CSV desde {CSV_DOWNLOAD_URL}")
+def _abrir_csv_remoto(method: str = "GET", headers: dict | None = None):
+    if method == "GET":
+        print(f"[INFO] Descargando CSV desde {CSV_DOWNLOAD_URL}")
     req = urllib.request.Request(
         CSV_DOWNLOAD_URL,
-        headers={"User-Agent": "Mozilla/5.0 WidgetViaje"}
+        headers={"User-Agent": "Mozilla/5.0 WidgetViaje", **(headers or {})},
+        method=method,
     )
+    return urllib.request.urlopen(req, timeout=120)
+
+
+def meta_descarga() -> dict | None:
+    """ETag / Last-Modified / tamaño de la última descarga del CSV, o None si no hay."""
+    try:
+        with CSV_META_JSON.open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
 
-    with urllib.request.urlopen(req, timeout=120) as resp, LOCAL_CSV.open("wb") as f:
-        data = resp.read()
-        f.write(data)
+
+def _guardar_meta_descarga(headers, tamano: int, ultima_completa: float | None = None):
+    """Guarda ETag / Last-Modified del servidor para la próxima descarga condicional."""
+    meta = {
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "tamano": tamano,
+        "ultima_completa": time.time() if ultima_completa is None else ultima_completa,
+    }
+    tmp = CSV_META_JSON.with_name(CSV_META_JSON.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as out:
+        json.dump(meta, out)
+    os.replace(tmp, CSV_META_JSON)
+
+
+def _hay_descarga_previa() -> bool:
+    """True si tenemos CSV local + metadatos, o sea, si se puede pedir solo lo que cambió."""
+    return LOCAL_CSV.exists() and CSV_META_JSON.exists()
+
+
+def descargar_csv_si_necesario(max_edad: float = REFRESH_SECONDS):
+    """Si el CSV local no existe o tiene más de max_edad segundos, lo descarga de nuevo."""
+    if not _csv_local_vigente(max_edad):
+        descargar_csv()
+
+
+def descargar_csv():
+    """
+    Trae el CSV del gobierno. Si ya hay una copia local, primero pregunta
+    si cambió (HEAD condicional) y, si solo le agregaron filas, baja la
+    cola con un Range. Ante cualquier duda, descarga completa.
+    """
+    with metricas.etapa("descarga"):
+        _descargar_csv()
+
+
+def _descargar_csv():
+    meta = meta_descarga()
+    completa_vencida = (
+        meta is None
+        or time.time() - meta.get("ultima_completa", 0.0) > DESCARGA_COMPLETA_CADA_SECONDS
+    )
+    if not completa_vencida and LOCAL_CSV.exists():
+        try:
+            if _actualizar_csv_parcial(meta):
+                return
+        except (OSError, ValueError) as e:  # urllib.error.URLError es OSError
+            print(f"[WARN] Falló la actualización parcial del CSV ({e!r}). Se baja completo.")
+
+    _descargar_csv_completo()
+
+
+def _descargar_csv_completo():
+    # Bajamos a un temporal de a bloques (memoria constante) y recién al
+    # final reemplazamos: si la descarga se corta, el CSV anterior queda.
+    tmp = LOCAL_CSV.with_name(LOCAL_CSV.name + ".part")
+    with _abrir_csv_remoto() as resp, tmp.open("wb") as f:
+        shutil.copyfileobj(resp, f, CHUNK_BYTES)
+        headers = resp.headers
+    os.replace(tmp, LOCAL_CSV)
+    _guardar_meta_descarga(headers, LOCAL_CSV.stat().st_size)
+    metricas.sumar("precios_descarga_bytes_total", LOCAL_CSV.stat().st_size, tipo="completa")
 
     print(f"[INFO] CSV descargado en {LOCAL_CSV.resolve()}")
 
 
+def _actualizar_csv_parcial(meta: dict) -> bool:
+    """
+    Intenta poner al día LOCAL_CSV sin bajarlo entero. Devuelve True si
+    lo logró (sin cambios o cola agregada), False si hace falta descarga completa.
+    """
+    condicionales = {}
+    if meta.get("etag"):
+        condicionales["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        condicionales["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        with _abrir_csv_remoto("HEAD", condicionales) as resp:
+            headers = resp.headers
+    except urllib.error.HTTPError as e:
+        if e.code != 304:
+            raise
+        headers = None
+
+    tamano_local = LOCAL_CSV.stat().st_size
+    if headers is None:
+        sin_cambios = True
+    elif headers.get("ETag") is not None:
+        sin_cambios = headers.get("ETag") == meta.get("etag")
+    else:
+        # Servidor sin ETag que además ignora If-Modified-Since en el HEAD
+        sin_cambios = (
+            headers.get("Last-Modified") is not None
+            and headers.get("Last-Modified") == meta.get("last_modified")
+            and int(headers.get("Content-Length") or -1) == meta.get("tamano")
+        )
+    if sin_cambios and tamano_local == meta.get("tamano"):
+        print("[INFO] El CSV remoto no cambió (304). Se reusa el local.")
+        os.utime(LOCAL_CSV)  # vuelve a contar como recién bajado
+        return True
+    if headers is None:
+        return False
+
+    tamano_remoto = int(headers.get("Content-Length") or -1)
+    if headers.get("Accept-Ranges", "").lower() != "bytes" or tamano_remoto <= tamano_local:
+        # Sin Range, o el archivo no creció (lo reescribieron): completa
+        return False
+
+    return _bajar_cola_csv(meta, headers, tamano_local, tamano_remoto)
+
+
+def _muestra_coincide(desde: int, esperado: bytes, etag: str | None) -> bool:
+    """True si el CSV remoto tiene `esperado` a partir del byte `desde` (GET con Range)."""
+    pedido = {"Range": f"bytes={desde}-{desde + len(esperado) - 1}"}
+    if etag:
+        pedido["If-Range"] = etag
+    with _abrir_csv_remoto("GET", pedido) as resp:
+        if resp.status != 206 or not resp.headers.get("Content-Range", "").startswith(f"bytes {desde}-"):
+            return False
+        return resp.read(len(esperado)) == esperado
+
+
+def _bajar_cola_csv(meta_previa: dict, headers_head, tamano_local: int, tamano_remoto: int) -> bool:
+    """
+    Pide con Range los bytes nuevos más un solape con lo que ya tenemos,
+    después de comparar también una muestra del principio del archivo. Si
+    alguna de las dos no coincide, no era un simple agregado: devuelve False.
+    """
+    solape = min(RANGE_SOLAPE_BYTES, tamano_local)
+    desde = tamano_local - solape
+    pedido = {"Range": f"bytes={desde}-"}
+    if headers_head.get("ETag"):
+        # Si cambió entre el HEAD y este GET, el servidor manda 200 completo
+        pedido["If-Range"] = headers_head["ETag"]
+
+    with LOCAL_CSV.open("rb") as f:
+        cabeza_local = f.read(min(RANGE_SOLAPE_BYTES, desde))
+        f.seek(desde)
+        cola_local = f.read(solape)
+
+    # El solape con la cola no ve cambios más atrás (p. ej. un precio corregido
+    # en las primeras filas, del mismo largo, más una fila agregada)
+    if cabeza_local and not _muestra_coincide(0, cabeza_local, headers_head.get("ETag")):
+        print("[INFO] El principio del CSV remoto cambió. Se baja completo.")
+        return False
+
+    with _abrir_csv_remoto("GET", pedido) as resp:
+        rango = resp.headers.get("Content-Range", "")
+        if resp.status != 206 or not rango.startswith(f"bytes {desde}-"):
+            return False
+        total = int(rango.rsplit("/", 1)[1]) if not rango.endswith("/*") else tamano_remoto
+
+        if resp.read(solape) != cola_local:
+            print("[INFO] El CSV remoto no es un agregado del local. Se baja completo.")
+            return False
+
+        # Agregamos sobre el mismo archivo; si algo falla, lo dejamos como estaba
+        with LOCAL_CSV.open("r+b") as f:
+            f.seek(tamano_local)
+            try:
+                shutil.copyfileobj(resp, f, CHUNK_BYTES)
+                f.flush()
+                if f.tell() != total:
+                    raise ValueError(f"tamaño final {f.tell()} != {total}")
+            except BaseException:
+                f.truncate(tamano_local)
+                raise
+
+    _guardar_meta_descarga(headers_head, total, meta_previa["ultima_completa"])
+    metricas.sumar("precios_descarga_bytes_total", len(cabeza_local) + total - desde, tipo="rango")
+    print(f"[INFO] CSV actualizado con {total - tamano_local} bytes nuevos (Range).")
+    return True
+
+
+class _LectorTee(io.RawIOBase):
+    """
+    Lee de `origen` y copia cada bloque leído en `copia` (si no es None);
+    si se pasa huella (un _HuellaPrefijo), además le suma cada bloque.
+    """
+
+    def __init__(self, origen, copia=None, huella: "_HuellaPrefijo | None" = None):
+        self.origen = origen
+        self.copia = copia
+        self.huella = huella
+        self.bytes_leidos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self.origen.readinto(buffer)
+        if n:
+            self.bytes_leidos += n
+            if self.copia is not None:
+                self.copia.write(memoryview(buffer)[:n])
+            if self.huella is not None:
+                self.huella.actualizar(memoryview(buffer)[:n])
+        return n
+
+
+class _LectorAcotado(io.RawIOBase):
+    """Lee de `origen` a lo sumo `limite` bytes; después, fin de archivo."""
+
+    def __init__(self, origen, limite: int):
+        self.origen = origen
+        self.restantes = limite
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.restantes <= 0:
+            return 0
+        n = self.origen.readinto(memoryview(buffer)[:self.restantes])
+        if n:
+            self.restantes -= n
+        return n
+
+
+def _procesar_descarga_en_streaming(
+    guardar_copia: bool = True, historico: IngestaHistorico | None = None
+) -> dict:
+    """
+    Baja el CSV y lo va parseando a medida que llegan los bytes: nunca
+    está entero en memoria. Si guardar_copia, además lo escribe al vuelo
+    en LOCAL_CSV (vía temporal, se reemplaza solo si todo salió bien).
+    Con historico, el histórico se rearma con esta misma pasada.
+    Devuelve el por_estacion de todo el país.
+    """
+    tmp = LOCAL_CSV.with_name(LOCAL_CSV.name + ".part")
+    copia = tmp.open("wb") if guardar_copia else None
+    # El checkpoint necesita el hash de todo lo bajado: se calcula al vuelo
+    huella = _HuellaPrefijo() if guardar_copia and PROCESAMIENTO_INCREMENTAL else None
+    tee = None
+    if historico is not None:
+        historico.reiniciar()
+    try:
+        with _abrir_csv_remoto() as resp:
+            headers = resp.headers
+            tee = _LectorTee(resp, copia, huella)
+            texto = io.TextIOWrapper(
+                io.BufferedReader(tee, CHUNK_BYTES), encoding="utf-8", newline=""
+            )
+            por_estacion = _procesar_stream_csv(texto, filtro=FILTRO_NACIONAL, historico=historico)
+            # Por si el parser cortó antes del final: que la copia quede completa
+            while texto.read(CHUNK_BYTES):
+                pass
+    except BaseException:
+        if copia is not None:
+            copia.close()
+            tmp.unlink(missing_ok=True)
+        raise
+    finally:
+        metricas.sumar("precios_descarga_bytes_total", tee.bytes_leidos if tee else 0, tipo="streaming")
+
+    estado = None
+    if copia is not None:
+        copia.close()
+        os.replace(tmp, LOCAL_CSV)
+        _guardar_meta_descarga(headers, tee.bytes_leidos)
+        print(f"[INFO] CSV descargado en {LOCAL_CSV.resolve()} ({tee.bytes_leidos} bytes)")
+        if PROCESAMIENTO_INCREMENTAL:
+            with metricas.etapa("checkpoint_guardado"):
+                estado = _guardar_checkpoint(por_estacion, huella)
+    if historico is not None:
+        with metricas.etapa("historico"):
+            historico.terminar(estado)
+    return por_estacion
+
+
 # ------------ PROCESAMIENTO DEL CSV Y GENERACIÓN DE precios.txt ------------
 
-def _procesar_stream_csv(f, output_path: Path):
-    reader = csv.DictReader(f)
+class PrecioEstacion(NamedTuple):
+    """Último precio de una estación para una categoría: solo lo que se escribe."""
+    indice_tiempo: str
+    direccion: str
+    localidad: str
+    producto: str          # texto original del CSV
+    categoria: str         # categoría normalizada (1 de los 4)
+    precio: str            # texto para escribir
+    precio_num: float      # número para comparar
+    idempresabandera: str
+    empresabandera: str
+    latitud: str
+    longitud: str
+    provincia: str = ""    # no se escribe: la usa el índice multi-ciudad
+
+
+# Campos de PrecioEstacion que se repiten mucho entre estaciones (localidad,
+# fecha, bandera...): se internan para tener una sola copia de cada texto
+_CAMPOS_REPETIDOS = frozenset(
+    PrecioEstacion._fields.index(c)
+    for c in ("indice_tiempo", "localidad", "producto", "categoria",
+              "idempresabandera", "empresabandera", "provincia")
+)
 
-    # limpiar posible BOM en el primer encabezado
-    if reader.fieldnames and reader.fieldnames[0].startswith("\ufeff"):
-        reader.fieldnames[0] = reader.fieldnames[0].lstrip("\ufeff")
 
-    filas = []
+def _precio_estacion_internado(campos) -> PrecioEstacion:
+    """PrecioEstacion a partir de sus campos (p. ej. leídos de JSON), con los repetidos internados."""
+    return PrecioEstacion(*(
+        sys.intern(c) if i in _CAMPOS_REPETIDOS else c for i, c in enumerate(campos)
+    ))
+
+
+# Columnas del CSV que usa el pipeline, en el orden de _indices_columnas()
+_COLUMNAS_USADAS = (
+    "indice_tiempo",
+    "direccion",
+    "localidad",
+    "producto",
+    "tipohorario",
+    "precio",
+    "idempresabandera",
+    "empresabandera",
+    "latitud",
+    "longitud",
+    "provincia",
+)
+
+
+def _indices_columnas(fieldnames: list[str]) -> tuple[tuple[int, ...], int]:
+    """
+    Posición de cada columna de _COLUMNAS_USADAS, resuelta una sola vez
+    desde el encabezado. Las que falten apuntan a una columna extra vacía
+    (el equivalente al row.get(col, "") de antes). Devuelve (indices, ancho):
+    toda fila se rellena con "" hasta `ancho` columnas.
+    """
+    nombres = [n.lstrip("\ufeff") for n in fieldnames]
+    extra = len(nombres)
+    indices = tuple(
+        nombres.index(col) if col in nombres else extra
+        for col in _COLUMNAS_USADAS
+    )
+    return indices, extra + 1
 
-    for row in reader:
-        # BOM en el dato
-        if "indice_tiempo" not in row and "\ufeffindice_tiempo" in row:
-            row["indice_tiempo"] = row.pop("\ufeffindice_tiempo")
+
+def _registros_crudos(f):
+    """
+    Junta líneas físicas en registros CSV completos: una línea con comillas
+    desbalanceadas sigue en la próxima (campo entre comillas con salto de línea).
+    Las comillas escapadas ("") no cambian la paridad, así que alcanza con contar.
+    """
+    pendiente = []
+    for linea in f:
+        if pendiente:
+            pendiente.append(linea)
+            if linea.count('"') % 2:
+                yield "".join(pendiente)
+                pendiente = []
+        elif linea.count('"') % 2:
+            pendiente.append(linea)
+        else:
+            yield linea
+    if pendiente:
+        yield "".join(pendiente)
+
+
+def _prefiltrar_registros(registros, conteo: Counter | None = None):
+    """
+    Descarta sin parsear los registros que seguro no pasan el filtro de
+    horario: si "Diurno" no aparece en el texto, la fila no puede cumplirlo.
+    Los que pasan se parsean igual entero y se vuelven a chequear campo por
+    campo (puede haber falsos positivos, nunca falsos negativos). Si se pasa
+    conteo, al terminar suma en conteo["leidas"] cuántos registros entraron.
+    """
+    leidas = 0
+    try:
+        for registro in registros:
+            leidas += 1
+            if "Diurno" in registro:
+                yield registro
+    finally:
+        if conteo is not None:
+            conteo["leidas"] += leidas
+
+
+def _reducir_por_estacion(
+    filas,
+    indices: tuple[int, ...],
+    ancho: int,
+    por_estacion: dict,
+    filtro: FiltroProceso,
+    registro: RegistroEstaciones,
+    por_mes: dict | None = None,
+):
+    """
+    Filtros de negocio + PRIMER CORTE (precio más nuevo POR ESTACIÓN y
+    PRODUCTO) en una sola pasada. `filas` son listas de campos (csv.reader)
+    y se leen por posición según `indices`; `filtro` dice qué localidades y
+    empresas se aceptan. Actualiza por_estacion in situ,
+    así se puede seguir sumando filas nuevas sobre un estado anterior.
+    Las estaciones nuevas se dan de alta en `registro`.
+
+    clave = (id de estación en el registro, categoria)
+    valor = PrecioEstacion con:
+      - indice_tiempo más reciente
+      - si empate de fecha, precio más alto
+      - si empata todo, el registro mayor (así no depende del orden de las filas)
+
+    Si se pasa por_mes, en la misma pasada se actualiza también con la
+    clave del histórico, (celda lat, celda lon, idempresabandera, categoria,
+    indice_tiempo): un registro por celda, bandera, producto y mes (el de
+    precio más alto; con empate, el de mayor historico_precios.desempate()).
+
+    Devuelve cuántas filas terminaron en cada resultado: descartadas por
+    cada filtro, "desplazada" (no ganó en ninguno de los dos) o "ganadora".
+    """
+    (i_tiempo, i_direccion, i_localidad, i_producto, i_horario,
+     i_precio, i_idempresa, i_empresa, i_lat, i_lon, i_provincia) = indices
+    localidades, empresas = filtro
+    categoria_y_minimo = _categoria_y_minimo  # lookup local: va por cada fila
+    ids_por_texto = registro.por_texto
+    id_estacion = registro.id_estacion
+    celda = celda_de
+    intern = sys.intern
+
+    # Contadores locales (un += por fila); se devuelven recién al final
+    n_localidad = n_horario = n_empresa = n_producto = n_precio = n_coordenadas = 0
+    n_desplazada = n_ganadora = 0
+
+    for row in filas:
+        if len(row) < ancho:
+            # Fila corta (o columna ausente en el encabezado): faltantes = ""
+            row.extend([""] * (ancho - len(row)))
 
         # --- FILTROS DE NEGOCIO BÁSICOS ---
 
         # Localidad
-        loc = row.get("localidad")
-        if not loc or loc not in LOCALIDADES_PERMITIDAS:
+        loc = row[i_localidad]
+        if not loc or (localidades is not None and loc not in localidades):
+            n_localidad += 1
             continue
 
         # Horario
-        if row.get("tipohorario") != "Diurno":
+        if row[i_horario] != "Diurno":
+            n_horario += 1
             continue
 
         # Empresa
-        if row.get("idempresabandera") not in EMPRESAS_PERMITIDAS:
+        if empresas is not None and row[i_idempresa] not in empresas:
+            n_empresa += 1
             continue
 
-        producto = row.get("producto", "")
-        precio_str = row.get("precio", "")
+        producto = row[i_producto]
 
         # --- FILTRO POR PRODUCTO INTERESANTE + PRECIO MÍNIMO ---
-        precio_num = _filtrar_y_parsear_precio(producto, precio_str)
-        if precio_num is None:
-            continue  # o no es uno de los 4 productos, o el precio es inválido/bajo
-
-        categoria = _clasificar_producto(producto)
-        if categoria is None:
-            continue  # seguridad extra
-
-        filas.append({
-            "indice_tiempo": row.get("indice_tiempo", ""),
-            "direccion": row.get("direccion", ""),
-            "localidad": loc,
-            "producto": producto,          # texto original del CSV
-            "categoria": categoria,        # categoría normalizada (1 de los 4)
-            "tipohorario": row.get("tipohorario", ""),
-            "precio": f"{precio_num:.2f}", # texto para escribir
-            "precio_num": precio_num,      # número para comparar
-            "idempresabandera": row.get("idempresabandera", ""),
-            "empresabandera": row.get("empresabandera", ""),
-            "latitud": row.get("latitud", ""),
-            "longitud": row.get("longitud", "")
-        })
-
-    # --- PRIMER CORTE: precio más nuevo POR ESTACIÓN (lat+long) Y PRODUCTO ---
-
-    # clave1 = (latitud, longitud, categoria)
-    # valor = fila con:
-    #   - indice_tiempo más reciente
-    #   - si empate de fecha, precio más alto
-    por_estacion = {}
+        clasificacion = categoria_y_minimo(producto)
+        if clasificacion is None:
+            n_producto += 1
+            continue  # no es uno de los 4 productos
+        categoria, minimo = clasificacion
+
+        precio_num = _parsear_precio(row[i_precio])
+        if precio_num is None or precio_num < minimo:
+            n_precio += 1
+            continue  # precio inválido o demasiado bajo
+
+        lat = row[i_lat]
+        lon = row[i_lon]
+        indice = row[i_tiempo]
+        if not lat or not lon or not indice:
+            n_coordenadas += 1
+            continue
 
-    for r in filas:
-        lat = r["latitud"]
-        lon = r["longitud"]
-        cat = r["categoria"]
-        indice = r["indice_tiempo"]
-        precio_num = r["precio_num"]
+        direccion = row[i_direccion]
+        idempresa = row[i_idempresa]
+        estacion = ids_por_texto.get((lat, lon, direccion, idempresa))
+        if estacion is None:
+            estacion = id_estacion(lat, lon, direccion, idempresa)
+
+        clave = (estacion, categoria)
+        actual = por_estacion.get(clave)
+        # Comparamos primero por fecha (AAAA-MM); si empata, gana el precio más
+        # alto. Con empate total (None) decide el registro, no el orden de las filas
+        if actual is None or indice > actual.indice_tiempo:
+            gana = True
+        elif indice < actual.indice_tiempo or precio_num < actual.precio_num:
+            gana = False
+        else:
+            gana = None if precio_num == actual.precio_num else True
+        gana_mes = False
+        if por_mes is not None:
+            clave_mes = (*celda(lat, lon), idempresa, categoria, indice)
+            del_mes = por_mes.get(clave_mes)
+            if del_mes is None or precio_num > del_mes.precio_num:
+                gana_mes = True
+            elif precio_num == del_mes.precio_num:
+                gana_mes = None
+        if gana is False and gana_mes is False:
+            n_desplazada += 1
+            continue
 
-        if not lat or not lon or not indice or not cat:
+        # Solo armamos el registro cuando la fila puede ganar. Los textos que se
+        # repiten entre estaciones se internan: csv.reader da una copia por fila
+        ganador = PrecioEstacion(
+            intern(indice),
+            direccion,
+            intern(loc),
+            intern(producto),
+            categoria,
+            f"{precio_num:.2f}",
+            precio_num,
+            intern(idempresa),
+            intern(row[i_empresa]),
+            lat,
+            lon,
+            intern(row[i_provincia]),
+        )
+        if gana is None:
+            gana = ganador > actual
+        if gana_mes is None:
+            gana_mes = desempate(ganador) > desempate(del_mes)
+        if not gana and not gana_mes:
+            n_desplazada += 1
             continue
+        n_ganadora += 1
+        if gana:
+            por_estacion[clave] = ganador
+        if gana_mes:
+            por_mes[clave_mes] = ganador
+
+    return {
+        "localidad": n_localidad,
+        "horario": n_horario,
+        "empresa": n_empresa,
+        "producto": n_producto,
+        "precio": n_precio,
+        "coordenadas": n_coordenadas,
+        "desplazada": n_desplazada,
+        "ganadora": n_ganadora,
+    }
+
+
+def _reducir_con_historico(
+    filas,
+    indices: tuple[int, ...],
+    ancho: int,
+    por_estacion: dict,
+    filtro: FiltroProceso,
+    registro: RegistroEstaciones,
+    historico: IngestaHistorico,
+) -> Counter:
+    """
+    _reducir_por_estacion de a LOTE_HISTORICO filas, juntando además el
+    precio de cada estación, producto y mes: al terminar cada lote se pasa
+    al histórico y se descarta. Así la memoria del histórico queda acotada
+    por el lote, no por el CSV. Devuelve el conteo sumado de los lotes.
+    """
+    filas = iter(filas)
+    resultados = Counter()
+    while True:
+        por_mes: dict = {}
+        lote = _reducir_por_estacion(
+            islice(filas, LOTE_HISTORICO), indices, ancho, por_estacion, filtro, registro, por_mes
+        )
+        if por_mes:
+            historico.agregar(por_mes.values())
+        resultados.update(lote)
+        # Cada fila cae en exactamente un resultado: si faltaron, se acabó el CSV
+        if sum(lote.values()) < LOTE_HISTORICO:
+            return resultados
 
-        clave1 = (lat, lon, cat)
-        actual = por_estacion.get(clave1)
 
-        if actual is None:
-            por_estacion[clave1] = r
-        else:
-            # Comparamos primero por fecha (AAAA-MM)
-            if indice > actual["indice_tiempo"]:
-                por_estacion[clave1] = r
-            elif indice == actual["indice_tiempo"] and precio_num > actual["precio_num"]:
-                # misma fecha, preferimos el precio más alto
-                por_estacion[clave1] = r
-
-    filas_por_estacion = list(por_estacion.values())
-
-    # --- SEGUNDO CORTE: MIN y MAX POR CIUDAD Y PRODUCTO, CONTROLANDO DESVIACIÓN ---
-
-    # Agrupamos todas las estaciones por (localidad, categoria)
-    grupos_ciudad_prod: dict[tuple[str, str], list[dict]] = defaultdict(list)
-    for r in filas_por_estacion:
-        loc = r["localidad"]
-        cat = r["categoria"]
-        if not loc or not cat:
-            continue
-        grupos_ciudad_prod[(loc, cat)].append(r)
+def usa_cuantiles() -> bool:
+    """True si el segundo corte filtra con bosquejos de cuantiles (FILTRO_OUTLIERS), no con la banda."""
+    return FILTRO_OUTLIERS == "cuantiles"
 
-    filas_finales = []
 
-    for (loc, cat), lista in grupos_ciudad_prod.items():
-        if not lista:
-            continue
+def calcular_filas_finales(
+    estaciones: Iterable[PrecioEstacion], bosquejos: dict | None = None
+) -> list[tuple[str, PrecioEstacion]]:
+    """
+    SEGUNDO CORTE: MIN y MAX POR CIUDAD Y PRODUCTO, CONTROLANDO DESVIACIÓN.
+    La ciudad es (provincia, localidad): hay localidades con el mismo nombre
+    en varias provincias (SANTA ROSA) y no se mezclan.
+    Devuelve pares (indice_precio, estación) con indice_precio = MAX/MIN.
+    Con FILTRO_OUTLIERS = "cuantiles" se pueden pasar los bosquejos por
+    (provincia, localidad, categoria) ya armados (si no, se arman acá).
+    """
+    if usa_cuantiles():
+        return _filas_finales_por_cuantiles(estaciones, bosquejos)
+
+    # Agrupamos todas las estaciones por (provincia, localidad, categoria)
+    grupos_ciudad_prod: dict[tuple[str, str, str], list[PrecioEstacion]] = defaultdict(list)
+    for r in estaciones:
+        grupos_ciudad_prod[(r.provincia, r.localidad, r.categoria)].append(r)
+
+    filas_finales = []
 
+    for lista in grupos_ciudad_prod.values():
         # Precio máximo real entre estaciones de esa ciudad/producto
-        max_price = max(r["precio_num"] for r in lista)
+        max_price = max(r.precio_num for r in lista)
 
         # Filtramos outliers demasiado bajos:
         # nos quedamos solo con precios >= max_price - MAX_DESVIACION
-        candidatos = [
-            r for r in lista
-            if r["precio_num"] >= max_price - MAX_DESVIACION
-        ]
-
-        if not candidatos:
-            # Por seguridad; en la práctica, el propio max siempre entra
-            candidatos = lista
+        # (el propio max siempre entra, así que nunca queda vacío)
+        candidatos = [r for r in lista if r.precio_num >= max_price - MAX_DESVIACION]
 
         # Elegimos MAX y MIN dentro de los candidatos
-        max_row = max(candidatos, key=lambda r: r["precio_num"])
-        min_row = min(candidatos, key=lambda r: r["precio_num"])
+        max_row = max(candidatos, key=lambda r: r.precio_num)
+        min_row = min(candidatos, key=lambda r: r.precio_num)
 
-        # Clonamos y marcamos cada fila con indice_precio = MAX/MIN
-        for row, label in ((max_row, "MAX"), (min_row, "MIN")):
-            nuevo = row.copy()
-            nuevo["indice_precio"] = label
-            filas_finales.append(nuevo)
+        filas_finales.append(("MAX", max_row))
+        filas_finales.append(("MIN", min_row))
 
     # Máximo teórico: 2 (MAX/MIN) × 4 productos × 2 ciudades = 16 filas
     # Ordenamos por ciudad, producto y luego MAX/MIN para que quede prolijo
-    filas_finales.sort(
-        key=lambda r: (
-            r["localidad"],
-            r["categoria"],
-            r["indice_precio"],  # MIN antes que MAX o al revés según te guste
-        )
-    )
+    filas_finales.sort(key=lambda f: (f[1].localidad, f[1].provincia, f[1].categoria, f[0]))
+    return filas_finales
+
+
+def _filas_finales_configuradas(por_estacion: dict) -> list[tuple[str, PrecioEstacion]]:
+    """
+    Las filas de precios.txt a partir del por_estacion de todo el país: el
+    segundo corte sobre las estaciones de LOCALIDADES_PERMITIDAS y
+    EMPRESAS_PERMITIDAS (lo mismo que hace IndicePrecios.consultar para
+    cualquier otra combinación).
+    """
+    localidades, empresas = _filtro_configurado()
+    with metricas.etapa("agregacion"):
+        return calcular_filas_finales([
+            r for r in por_estacion.values()
+            if r.localidad in localidades and r.idempresabandera in empresas
+        ])
+
+
+def bosquejos_por_grupo(
+    estaciones: Iterable[PrecioEstacion],
+) -> dict[tuple[str, str, str], BosquejoCuantiles]:
+    """
+    Bosquejo de cuantiles de los precios de cada (provincia, localidad,
+    categoria), en una sola pasada.
+    """
+    bosquejos: dict[tuple[str, str, str], BosquejoCuantiles] = {}
+    for r in estaciones:
+        grupo = (r.provincia, r.localidad, r.categoria)
+        bosquejo = bosquejos.get(grupo)
+        if bosquejo is None:
+            bosquejo = bosquejos[grupo] = BosquejoCuantiles()
+        bosquejo.agregar(r.precio_num)
+    return bosquejos
+
+
+def _limites_cuantiles(bosquejo: BosquejoCuantiles) -> tuple[float, float]:
+    """Rango de precios aceptados de un grupo: [p10, p90] ensanchado por el margen."""
+    p10, p90 = bosquejo.cuantiles((0.1, 0.9))
+    margen = max(MARGEN_CUANTILES * (p90 - p10), MARGEN_MINIMO_CUANTILES)
+    return p10 - margen, p90 + margen
+
+
+def _filas_finales_por_cuantiles(
+    estaciones: Iterable[PrecioEstacion], bosquejos: dict | None
+) -> list[tuple[str, PrecioEstacion]]:
+    """
+    calcular_filas_finales con el filtro por cuantiles, en dos pasadas y
+    sin listas por grupo: una arma los bosquejos (si no vienen) y la otra
+    se queda con el MAX y el MIN de cada grupo entre los precios aceptados.
+    El p10 y el p90 son precios del grupo, así que ninguno queda vacío.
+    """
+    if not isinstance(estaciones, Collection):
+        estaciones = list(estaciones)  # se recorre dos veces
+    if bosquejos is None:
+        bosquejos = bosquejos_por_grupo(estaciones)
+    limites = {grupo: _limites_cuantiles(b) for grupo, b in bosquejos.items()}
+
+    extremos: dict[tuple[str, str, str], list[PrecioEstacion]] = {}  # grupo -> [MAX, MIN]
+    for r in estaciones:
+        grupo = (r.provincia, r.localidad, r.categoria)
+        minimo, maximo = limites[grupo]
+        if not minimo <= r.precio_num <= maximo:
+            continue
+        actual = extremos.get(grupo)
+        if actual is None:
+            extremos[grupo] = [r, r]
+            continue
+        # Estricto, como max()/min(): ante empate queda la que apareció primero
+        if r.precio_num > actual[0].precio_num:
+            actual[0] = r
+        if r.precio_num < actual[1].precio_num:
+            actual[1] = r
+
+    filas_finales = []
+    for max_row, min_row in extremos.values():
+        filas_finales.append(("MAX", max_row))
+        filas_finales.append(("MIN", min_row))
+    filas_finales.sort(key=lambda f: (f[1].localidad, f[1].provincia, f[1].categoria, f[0]))
+    return filas_finales
+
 
-    # Escritura de precios.txt
-    with output_path.open("w", encoding="utf-8", newline="") as out:
-        w = csv.writer(out, delimiter="|")
+def renderizar_estadisticas(bosquejos: dict[tuple[str, str, str], BosquejoCuantiles]) -> bytes:
+    """
+    Cantidad de estaciones y CUANTILES_PUBLICADOS de cada (provincia,
+    localidad, categoria), con el mismo separador que precios.txt.
+    """
+    out = io.StringIO(newline="")
+    w = csv.writer(out, delimiter="|")
+    w.writerow([
+        "provincia", "localidad", "categoria", "estaciones",
+        *(f"p{round(q * 100)}" for q in CUANTILES_PUBLICADOS),
+    ])
+    for grupo, bosquejo in sorted(bosquejos.items()):
+        cuantiles = bosquejo.cuantiles(CUANTILES_PUBLICADOS)
+        w.writerow([*grupo, len(bosquejo), *(f"{c:.2f}" for c in cuantiles)])
+    return out.getvalue().encode("utf-8")
+
+
+def _escribir_precios_txt(filas_finales: list[tuple[str, PrecioEstacion]], output_path: Path):
+    """Escritura de precios.txt"""
+    with metricas.etapa("escritura"), output_path.open("w", encoding="utf-8", newline="") as out:
+        _escribir_filas(out, filas_finales)
+
+
+def _escribir_estadisticas(estaciones: Iterable[PrecioEstacion], output_path: Path = ESTADISTICAS_TXT):
+    """renderizar_estadisticas de `estaciones` en output_path (vía temporal, como precios.txt)."""
+    tmp = output_path.with_name(output_path.name + ".tmp")
+    with metricas.etapa("estadisticas"):
+        tmp.write_bytes(renderizar_estadisticas(bosquejos_por_grupo(estaciones)))
+    os.replace(tmp, output_path)
+    print(f"[INFO] Estadísticas generadas en {output_path.resolve()}")
+
+
+def renderizar_precios_txt(filas_finales: list[tuple[str, PrecioEstacion]]) -> bytes:
+    """El mismo contenido que _escribir_precios_txt, pero en memoria."""
+    out = io.StringIO(newline="")
+    _escribir_filas(out, filas_finales)
+    return out.getvalue().encode("utf-8")
+
+
+def _escribir_filas(out, filas_finales: list[tuple[str, PrecioEstacion]]):
+    w = csv.writer(out, delimiter="|")
+    w.writerow([
+        "indice_precio",     # NUEVA COLUMNA: MIN o MAX
+        "indice_tiempo",
+        "direccion",
+        "localidad",
+        "producto",
+        "precio",
+        "idempresabandera",
+        "empresabandera",
+        "latitud",
+        "longitud"
+    ])
+
+    for indice_precio, r in filas_finales:
         w.writerow([
-            "indice_precio",     # NUEVA COLUMNA: MIN o MAX
-            "indice_tiempo",
-            "direccion",
-            "localidad",
-            "producto",
-            "precio",
-            "idempresabandera",
-            "empresabandera",
-            "latitud",
-            "longitud"
+            indice_precio,
+            r.indice_tiempo,
+            r.direccion,
+            r.localidad,
+            r.producto,
+            r.precio,
+            r.idempresabandera,
+            r.empresabandera,
+            r.latitud,
+            r.longitud
         ])
 
-        for r in filas_finales:
-            w.writerow([
-                r["indice_precio"],
-                r["indice_tiempo"],
-                r["direccion"],
-                r["localidad"],
-                r["producto"],
-                r["precio"],
-                r["idempresabandera"],
-                r["empresabandera"],
-                r["latitud"],
-                r["longitud"]
-            ])
 
+def _procesar_stream_csv(
+    f,
+    por_estacion: dict | None = None,
+    fieldnames=None,
+    prefiltro: bool = PREFILTRO_RAPIDO,
+    filtro: FiltroProceso | None = None,
+    conteo: Counter | None = None,
+    registro: RegistroEstaciones | None = None,
+    historico: IngestaHistorico | None = None,
+) -> dict:
+    """
+    Filtros + primer corte sobre el CSV de `f`. Si se pasa por_estacion
+    (estado de una corrida anterior), las filas nuevas se suman sobre él.
+    fieldnames sirve para leer desde la mitad del archivo, sin encabezado.
+    Con prefiltro, las líneas que no pueden pasar el filtro de horario se
+    descartan antes de parsearlas como CSV. filtro=None usa las
+    localidades y empresas configuradas.
+    Las filas leídas / descartadas por filtro se publican en metricas, o
+    se suman en `conteo` si se pasa (lo usan los procesos de
+    _procesar_en_paralelo, que no comparten las métricas).
+    registro=None usa el de registro_actual().
+    Con historico, en la misma pasada se le pasan de a lotes los precios
+    por estación, producto y mes (ver _reducir_con_historico).
+    Devuelve el por_estacion actualizado.
+    """
+    if filtro is None:
+        filtro = _filtro_configurado()
+    if registro is None:
+        registro = registro_actual()
+
+    registros = _registros_crudos(f)
+    if fieldnames is None:
+        fieldnames = next(csv.reader([next(registros, "")]))
+    indices, ancho = _indices_columnas(fieldnames)
+
+    publicar = conteo is None
+    if publicar:
+        conteo = Counter()
+    if prefiltro:
+        registros = _prefiltrar_registros(registros, conteo)
+
+    if por_estacion is None:
+        por_estacion = {}
+
+    with metricas.etapa("lectura_y_reduccion"):
+        if historico is None:
+            resultados = _reducir_por_estacion(
+                csv.reader(registros), indices, ancho, por_estacion, filtro, registro
+            )
+        else:
+            resultados = _reducir_con_historico(
+                csv.reader(registros), indices, ancho, por_estacion, filtro, registro, historico
+            )
+    if not prefiltro:
+        conteo["leidas"] += sum(resultados.values())
+    conteo.update(resultados)
+
+    if publicar:
+        _publicar_conteo(conteo, filtro, len(por_estacion))
+    return por_estacion
+
+
+_FILTROS_CONTEO = ("localidad", "horario", "empresa", "producto", "precio", "coordenadas")
 
-def generar_precios_txt():
-    """Pipeline completo: asegura CSV local actualizado y genera precios.txt."""
-    descargar_csv_si_necesario()
 
-    with LOCAL_CSV.open("r", encoding="utf-8", newline="") as f:
-        _procesar_stream_csv(f, OUTPUT_TXT)
+def _publicar_conteo(conteo: Counter, filtro: FiltroProceso, estaciones: int):
+    """Filas leídas, descartadas por filtro y reducidas, como métricas."""
+    alcance = "nacional" if filtro.localidades is None else "configurado"
+    metricas.sumar("precios_filas_leidas_total", conteo["leidas"], alcance=alcance)
+    pasaron = sum(conteo[c] for c in _FILTROS_CONTEO + ("desplazada", "ganadora"))
+    metricas.sumar(
+        "precios_filas_descartadas_total", conteo["leidas"] - pasaron,
+        alcance=alcance, filtro="prefiltro",
+    )
+    for motivo in _FILTROS_CONTEO:
+        metricas.sumar("precios_filas_descartadas_total", conteo[motivo], alcance=alcance, filtro=motivo)
+    for resultado in ("desplazada", "ganadora"):
+        metricas.sumar("precios_filas_reducidas_total", conteo[resultado], alcance=alcance, resultado=resultado)
+    metricas.fijar("precios_estaciones", estaciones, alcance=alcance)
+
+
+metricas.describir("precios_filas_leidas_total", "counter", "Registros del CSV leídos.")
+metricas.describir(
+    "precios_filas_descartadas_total", "counter",
+    "Registros descartados, por filtro (prefiltro = descartado sin parsear).",
+)
+metricas.describir(
+    "precios_filas_reducidas_total", "counter",
+    "Registros que pasaron los filtros: ganadora (quedó como último precio) o desplazada.",
+)
+metricas.describir("precios_estaciones", "gauge", "Estaciones x producto tras el primer corte.")
+metricas.describir("precios_descarga_bytes_total", "counter", "Bytes del CSV bajados de la web.")
+
+
+# ------------ PARSEO EN PARALELO POR RANGOS DE BYTES ------------
+
+def _cortes_por_registro(fb, inicio: int, fin: int, partes: int) -> list[int]:
+    """
+    Parte [inicio, fin) de fb en hasta `partes` rangos que empiezan y
+    terminan en un límite de registro: un salto de línea con una cantidad
+    par de comillas desde `inicio` (la misma regla que _registros_crudos),
+    así ningún campo entre comillas con salto de línea queda partido.
+    Devuelve los bordes, de inicio a fin.
+    """
+    cortes = [inicio]
+    fb.seek(inicio)
+    pos, impar = inicio, 0
+    for k in range(1, partes):
+        objetivo = inicio + (fin - inicio) * k // partes
+        # Contar comillas en bloque hasta el objetivo es mucho más barato que leer líneas
+        while pos < objetivo:
+            bloque = fb.read(min(CHUNK_BYTES * 16, objetivo - pos))
+            if not bloque:
+                break
+            impar ^= bloque.count(b'"') & 1
+            pos += len(bloque)
+        # Desde ahí, hasta la primera línea que cierra un registro
+        while pos < fin:
+            linea = fb.readline(fin - pos)
+            if not linea:
+                break
+            impar ^= linea.count(b'"') & 1
+            pos += len(linea)
+            if not impar and linea.endswith(b"\n"):
+                break
+        if cortes[-1] < pos < fin:
+            cortes.append(pos)
+    cortes.append(fin)
+    return cortes
+
+
+def _procesar_rango(
+    ruta: Path, inicio: int, fin: int, fieldnames: list[str], filtro: FiltroProceso,
+    registro: RegistroEstaciones, historico: IngestaHistorico | None,
+) -> tuple[dict, Counter, RegistroEstaciones, IngestaHistorico | None, dict[str, int]]:
+    """
+    Trabajo de cada proceso: el primer corte sobre un rango de bytes del
+    CSV, leído de a bloques como en serie (el rango nunca está entero en
+    memoria). Devuelve su por_estacion, el conteo de filas por filtro, su
+    copia de `registro`, con las estaciones que dio de alta al final, su
+    copia de `historico` (que ya escribió sus lotes) y el uso de su cache
+    de productos (_uso_cache_productos).
+    """
+    cache_antes = _categoria_y_minimo.cache_info()
+    conteo = Counter()
+    with ruta.open("rb", buffering=0) as fb:
+        fb.seek(inicio)
+        texto = io.TextIOWrapper(
+            io.BufferedReader(_LectorAcotado(fb, fin - inicio), CHUNK_BYTES), encoding="utf-8", newline=""
+        )
+        por_estacion = _procesar_stream_csv(
+            texto, {}, fieldnames, filtro=filtro, conteo=conteo, registro=registro, historico=historico
+        )
+    return por_estacion, conteo, registro, historico, _uso_cache_productos(cache_antes)
 
+
+def _combinar_por_estacion(por_estacion: dict, parcial: dict, traduccion: dict[int, int] | None = None):
+    """
+    Suma a por_estacion el resultado de un rango posterior del CSV, con la
+    misma regla que _reducir_por_estacion: gana el indice_tiempo más nuevo,
+    si empata el precio más alto y, con empate total, el registro mayor.
+    `traduccion` pasa los ids de estación de `parcial` que no coinciden
+    con los del registro propio (los que dio de alta otro proceso) a los propios.
+    """
+    for clave, nuevo in parcial.items():
+        if traduccion:
+            estacion, *resto = clave
+            clave = (traduccion.get(estacion, estacion), *resto)
+        actual = por_estacion.get(clave)
+        if actual is not None and (nuevo.indice_tiempo, nuevo.precio_num, nuevo) <= (
+            actual.indice_tiempo, actual.precio_num, actual
+        ):
+            continue
+        por_estacion[clave] = nuevo
+
+
+def _procesar_en_paralelo(
+    fb,
+    offset: int,
+    por_estacion: dict,
+    fieldnames: list[str],
+    filtro: FiltroProceso,
+    procesos: int,
+    historico: IngestaHistorico | None = None,
+) -> bool:
+    """
+    Procesa LOCAL_CSV desde offset repartido en hasta `procesos` procesos y
+    suma el resultado sobre por_estacion (en el orden del archivo, así queda
+    igual que en serie). Con historico, cada proceso le escribe sus lotes.
+    Devuelve False, sin tocar nada, si el rango es demasiado chico para que
+    convenga.
+    """
+    fin = os.fstat(fb.fileno()).st_size
+    partes = min(procesos, (fin - offset) // MIN_BYTES_POR_PROCESO)
+    if partes < 2:
+        return False
+
+    cortes = _cortes_por_registro(fb, offset, fin, partes)
+    n = len(cortes) - 1
+    print(f"[INFO] Parseando {fin - offset} bytes en {n} procesos...")
+    conteo = Counter()
+    # Cada proceso parte de una copia del registro actual que no fusiona
+    # lecturas nuevas; las altas de cada uno se pasan al registro propio en
+    # el orden del archivo (los mismos ids que en serie)
+    registro = registro_actual()
+    conocidas = registro.identidades_vistas()
+    copia = registro.para_proceso()
+    with metricas.etapa("lectura_y_reduccion"), ProcessPoolExecutor(max_workers=n) as pool:
+        parciales = pool.map(
+            _procesar_rango,
+            [LOCAL_CSV] * n, cortes[:-1], cortes[1:], [fieldnames] * n, [filtro] * n, [copia] * n,
+            [historico] * n,
+        )
+        for parcial, conteo_parcial, registro_parcial, historico_parcial, cache_parcial in parciales:
+            _combinar_por_estacion(por_estacion, parcial, registro.traduccion(registro_parcial, conocidas))
+            conteo.update(conteo_parcial)
+            if historico is not None:
+                historico.combinar(historico_parcial)
+            _cache_productos_procesos["hits"] += cache_parcial["hits"]
+            _cache_productos_procesos["misses"] += cache_parcial["misses"]
+            _cache_productos_procesos["tamano"] = max(
+                _cache_productos_procesos["tamano"], cache_parcial["tamano"]
+            )
+    _publicar_conteo(conteo, filtro, len(por_estacion))
+    return True
+
+
+# ------------ REGISTRO DE ESTACIONES ------------
+
+_registro: RegistroEstaciones | None = None
+_registro_guardado = 0  # identidades que tenía el registro la última vez que se guardó
+
+
+def registro_actual() -> RegistroEstaciones:
+    """El registro de estaciones del proceso (se carga de REGISTRO_ESTACIONES_JSON la primera vez)."""
+    global _registro, _registro_guardado
+    if _registro is None:
+        _registro = RegistroEstaciones.cargar(REGISTRO_ESTACIONES_JSON)
+        _registro_guardado = _registro.identidades_vistas()
+    return _registro
+
+
+def _guardar_registro():
+    """Guarda el registro si vio identidades nuevas desde la última vez (nunca se borra ninguna)."""
+    global _registro_guardado
+    if _registro is not None and _registro.identidades_vistas() != _registro_guardado:
+        _registro.guardar(REGISTRO_ESTACIONES_JSON)
+        _registro_guardado = _registro.identidades_vistas()
+
+
+# ------------ CHECKPOINT PARA PROCESAMIENTO INCREMENTAL ------------
+
+def _huella_filtros(filtro: FiltroProceso) -> str:
+    """Si cambian los filtros, el por_estacion guardado ya no sirve."""
+    return repr((
+        _VERSION_CHECKPOINT,
+        None if filtro.localidades is None else sorted(filtro.localidades),
+        None if filtro.empresas is None else sorted(filtro.empresas),
+    ))
+
+
+class _HuellaPrefijo:
+    """
+    sha256 de los primeros `bytes` bytes de LOCAL_CSV. Hashear es mucho
+    más barato que parsear, y así cualquier corrección de datos viejos
+    fuerza un reproceso completo. Se extiende con lo que se agrega al
+    final sin volver a leer lo que ya se hasheó: la corrida incremental lee
+    el prefijo una vez (al validar el checkpoint) y después solo la cola.
+    """
+
+    def __init__(self):
+        self._hash = hashlib.sha256()
+        self.bytes = 0
+
+    def actualizar(self, bloque):
+        """Suma los bytes que siguen a los ya hasheados."""
+        self._hash.update(bloque)
+        self.bytes += len(bloque)
+
+    def extender(self, fb, hasta: int):
+        """Hashea de fb lo que falta hasta el byte `hasta`."""
+        fb.seek(self.bytes)
+        while self.bytes < hasta:
+            bloque = fb.read(min(CHUNK_BYTES * 16, hasta - self.bytes))
+            if not bloque:
+                break
+            self.actualizar(bloque)
+
+    def prefijo(self) -> str:
+        return self._hash.hexdigest()
+
+
+def _huellas_csv(encabezado: bytes, huella: _HuellaPrefijo) -> dict:
+    """Lo que se guarda para reconocer el archivo: hash del encabezado y del prefijo."""
+    return {
+        "encabezado": hashlib.sha256(encabezado).hexdigest(),
+        "prefijo": huella.prefijo(),
+    }
+
+
+def _guardar_checkpoint(por_estacion: dict, huella: _HuellaPrefijo | None = None) -> dict | None:
+    """
+    Guarda en CHECKPOINT_JSON por_estacion (de todo el país) junto con
+    hasta dónde se procesó LOCAL_CSV.
+    Solo sirve si el archivo termina en salto de línea (última fila completa).
+    `huella` es la del prefijo ya hasheado (la del checkpoint anterior,
+    extendida con lo que se leyó después): solo se hashea lo que le falte.
+    Antes guarda el registro de estaciones, si se dieron altas.
+    Devuelve hasta dónde llega (offset y huellas), o None si no se guardó.
+    """
+    _guardar_registro()
+    if huella is None:
+        huella = _HuellaPrefijo()
+    with LOCAL_CSV.open("rb") as fb:
+        encabezado = fb.readline()
+        offset = os.fstat(fb.fileno()).st_size
+        fb.seek(max(0, offset - 1))
+        if fb.read(1) != b"\n" or huella.bytes > offset:
+            CHECKPOINT_JSON.unlink(missing_ok=True)
+            return None
+        huella.extender(fb, offset)
+        huellas = _huellas_csv(encabezado, huella)
+
+    checkpoint = {
+        "filtros": _huella_filtros(FILTRO_NACIONAL),
+        "offset": offset,
+        "ultimo_indice_tiempo": max(
+            (r.indice_tiempo for r in por_estacion.values()), default=""
+        ),
+        **huellas,
+        # La clave (id, categoria) sale del propio registro (vía el registro de estaciones)
+        "por_estacion": list(por_estacion.values()),
+    }
+    tmp = CHECKPOINT_JSON.with_name(CHECKPOINT_JSON.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as out:
+        json.dump(checkpoint, out, ensure_ascii=False)
+    os.replace(tmp, CHECKPOINT_JSON)
+    return {"offset": offset, **huellas}
+
+
+def _cargar_checkpoint_valido(
+    fb, encabezado: bytes, historico: IngestaHistorico | None = None
+) -> tuple[int, dict, _HuellaPrefijo] | None:
+    """
+    Devuelve (offset, por_estacion, huella del prefijo) si el checkpoint
+    corresponde a un prefijo de LOCAL_CSV (mismo encabezado y mismos bytes
+    antes del offset) y, si se pasa historico, si este ingirió justo hasta
+    el checkpoint. Si no, None: hay que reprocesar todo.
+    """
+    try:
+        with CHECKPOINT_JSON.open("r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if checkpoint.get("filtros") != _huella_filtros(FILTRO_NACIONAL):
+        print("[INFO] Cambiaron los filtros desde el último checkpoint. Se reprocesa todo.")
+        return None
+
+    offset = checkpoint["offset"]
+    if os.fstat(fb.fileno()).st_size < offset:
+        print("[INFO] El CSV es más corto que el checkpoint. Se reprocesa todo.")
+        return None
+
+    huella = _HuellaPrefijo()
+    huella.extender(fb, offset)
+    huellas = _huellas_csv(encabezado, huella)
+    if huellas["encabezado"] != checkpoint["encabezado"] or huellas["prefijo"] != checkpoint["prefijo"]:
+        print("[INFO] Cambió contenido ya procesado del CSV. Se reprocesa todo.")
+        return None
+    if historico is not None and not historico.al_dia({"offset": offset, **huellas}):
+        print("[INFO] El histórico no está al día con el checkpoint. Se reprocesa todo.")
+        return None
+
+    por_estacion = {}
+    id_estacion = registro_actual().id_estacion
+    for campos in checkpoint["por_estacion"]:
+        r = _precio_estacion_internado(campos)
+        por_estacion[(id_estacion(r.latitud, r.longitud, r.direccion, r.idempresabandera), r.categoria)] = r
+    print(
+        f"[INFO] Checkpoint válido (hasta {checkpoint['ultimo_indice_tiempo']}, "
+        f"byte {offset}). Solo se procesan filas nuevas."
+    )
+    return offset, por_estacion, huella
+
+
+def procesar_csv_nacional(procesos: int | None = None, historico: IngestaHistorico | None = None) -> dict:
+    """
+    por_estacion de TODO el país (todas las localidades y banderas) a partir
+    del LOCAL_CSV ya descargado. Es la única pasada por el CSV: de ella salen
+    precios.txt y el índice multi-ciudad (cualquier combinación de
+    ciudades / empresas). Con PROCESAMIENTO_INCREMENTAL y un checkpoint
+    válido solo parsea los bytes agregados desde la última vez.
+    procesos=None usa PROCESOS_PARSEO. Con historico, la misma pasada le
+    pasa los precios por estación, producto y mes (si reprocesa todo, el
+    histórico se rearma).
+    """
+    if procesos is None:
+        procesos = PROCESOS_PARSEO
+
+    with LOCAL_CSV.open("rb") as fb:
+        encabezado = fb.readline()
+        fieldnames = next(csv.reader([encabezado.decode("utf-8")]))
+
+        checkpoint = None
+        if PROCESAMIENTO_INCREMENTAL and fieldnames:
+            with metricas.etapa("checkpoint_carga"):
+                checkpoint = _cargar_checkpoint_valido(fb, encabezado, historico)
+
+        if checkpoint is not None:
+            offset, por_estacion, huella = checkpoint
+        else:
+            offset, por_estacion = len(encabezado), {}
+            huella = _HuellaPrefijo()
+            huella.actualizar(encabezado)
+            if historico is not None:
+                historico.reiniciar()
+
+        if procesos <= 1 or not _procesar_en_paralelo(
+            fb, offset, por_estacion, fieldnames, FILTRO_NACIONAL, procesos, historico
+        ):
+            # Lo que se parsea se hashea al pasar: guardar el checkpoint no relee nada
+            fb.seek(offset)
+            lector = _LectorTee(fb, huella=huella if PROCESAMIENTO_INCREMENTAL else None)
+            texto = io.TextIOWrapper(io.BufferedReader(lector, CHUNK_BYTES), encoding="utf-8", newline="")
+            _procesar_stream_csv(texto, por_estacion, fieldnames, filtro=FILTRO_NACIONAL, historico=historico)
+
+    estado = None
+    if PROCESAMIENTO_INCREMENTAL:
+        with metricas.etapa("checkpoint_guardado"):
+            estado = _guardar_checkpoint(por_estacion, huella)
+    if historico is not None:
+        with metricas.etapa("historico"):
+            historico.terminar(estado)
+    return por_estacion
+
+
+def generar_precios_txt(
+    max_edad_csv: float = REFRESH_SECONDS,
+    streaming: bool = DESCARGA_STREAMING,
+    procesos: int | None = None,
+    historico: IngestaHistorico | None = None,
+) -> dict:
+    """
+    Pipeline completo: asegura CSV local actualizado y genera precios.txt.
+    Con streaming=True, si hay que bajar el CSV se parsea mientras baja.
+    Si hay checkpoint o copia previa, en cambio, se pide solo lo que cambió
+    (HEAD condicional / Range) y se procesan solo las filas nuevas.
+    Con historico, la misma pasada alimenta el histórico mensual.
+    Devuelve el por_estacion de todo el país del que salió precios.txt
+    (la mini web arma con él sus índices sin volver a parsear).
+    """
+    # Escribimos a un temporal y lo renombramos: quien lea OUTPUT_TXT
+    # nunca ve un archivo a medio escribir.
+    tmp = OUTPUT_TXT.with_name(OUTPUT_TXT.name + ".tmp")
+
+    with metricas.etapa("generar_precios_txt"):
+        vigente = _csv_local_vigente(max_edad_csv)
+        incremental = PROCESAMIENTO_INCREMENTAL and CHECKPOINT_JSON.exists()
+
+        if not vigente and streaming and not incremental and not _hay_descarga_previa():
+            # Hay que bajar y parsear todo igual: mejor hacerlo mientras baja
+            with metricas.etapa("descarga_y_procesamiento"):
+                por_estacion = _procesar_descarga_en_streaming(historico=historico)
+        else:
+            if not vigente:
+                descargar_csv()
+            por_estacion = procesar_csv_nacional(procesos, historico)
+        _escribir_precios_txt(_filas_finales_configuradas(por_estacion), tmp)
+        os.replace(tmp, OUTPUT_TXT)
+
+    cache = estadisticas_cache_productos()
+    print(
+        f"[INFO] Cache de productos: {cache['hits']} hits, "
+        f"{cache['misses']} misses ({cache['tamano']} textos distintos)"
+    )
     print(f"[INFO] precios.txt generado en {OUTPUT_TXT.resolve()}")
+    return por_estacion
 
 
 if __name__ == "__main__":
-    generar_precios_txt()
+    parser = argparse.ArgumentParser(description="Genera precios.txt a partir del CSV oficial")
+    parser.add_argument(
+        "--workers", type=int, default=PROCESOS_PARSEO,
+        help="procesos que parsean el CSV local en paralelo (1 = en serie)",
+    )
+    parser.add_argument(
+        "--perfilar", nargs="?", const="", default=os.environ.get(PERFIL_ENV), metavar="RUTA",
+        help=f"perfilar con cProfile y tracemalloc y dejar el reporte en RUTA "
+             f"(por defecto en perfiles/; también con la variable {PERFIL_ENV})",
+    )
+    parser.add_argument(
+        "--estadisticas", nargs="?", const=ESTADISTICAS_TXT, type=Path, metavar="RUTA",
+        help=f"escribir además los cuantiles por ciudad y producto de todo el país "
+             f"(por defecto en {ESTADISTICAS_TXT})",
+    )
+    parser.add_argument(
+        "--historico", action="store_true",
+        help="sumar en la misma pasada los precios mensuales al histórico (historico_precios.py)",
+    )
+    args = parser.parse_args()
+
+    def correr():
+        por_estacion = generar_precios_txt(
+            procesos=args.workers, historico=IngestaHistorico() if args.historico else None
+        )
+        if args.estadisticas is not None:
+            _escribir_estadisticas(por_estacion.values(), args.estadisticas)
+
+    if args.perfilar is None:
+        correr()
+    else:
+        import perfilado
+
+        with perfilado.perfilar(Path(args.perfilar) if args.perfilar not in ("", "1") else None):
+            correr()
@@ -0,0 +1,214 @@
+"""
+Registro canónico de estaciones: a cada estación física le da un id
+entero chico y estable entre corridas, así el primer corte, el checkpoint
+y el snapshot la identifican por (id, categoria) en vez de por los textos
+crudos de latitud / longitud.
+
+El CSV trae la misma estación con distinta precisión en las coordenadas
+(-27.46775 en un mes, -27.4677512345 en otro) y con la dirección escrita
+de distintas formas: con los textos crudos como clave eran dos
+estaciones, y la vieja seguía compitiendo en el MAX/MIN. La identidad de
+una estación es:
+
+    (latitud, longitud) redondeadas a DECIMALES_COORDENADAS (la celda)
+    + la bandera (idempresabandera)
+
+Redondear parte el plano en celdas y dos lecturas del mismo punto pueden
+caer a los lados de un borde (-27.46775 y -27.4677512 redondean a celdas
+vecinas): una lectura nueva toma el id de una estación de la misma
+bandera en su celda o en una vecina. La dirección (normalizada: mayúsculas,
+sin tildes ni puntuación) solo desempata cuando hay más de una candidata;
+si tampoco desempata, gana el id más bajo. Así el resultado depende solo
+de lo que ya hay en el registro, no del orden en que se recorre.
+
+La bandera separa estaciones distintas que comparten coordenadas (las
+geocodificadas al centro de la ciudad). Una estación que cambia de
+bandera pasa a ser otra: su último precio con la bandera anterior queda
+en el grupo de esa bandera.
+
+Los ids se asignan en orden de aparición y nunca se reusan. El registro
+se guarda en JSON con todas las lecturas vistas (celda, bandera y
+dirección), también las que tomaron el id de otra (ver guardar()).
+"""
+import json
+import math
+import os
+import sys
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+
+
+# 4 decimales de grado son ~11 m: la misma playa de surtidores
+DECIMALES_COORDENADAS = 4
+
+# Si cambia la regla de identidad, el registro guardado no sirve
+_VERSION_REGISTRO = 2
+
+# Direcciones distintas que se normalizan (hay una por estación y por variante de escritura)
+CACHE_DIRECCIONES_MAX = 1 << 16
+
+
+def normalizar_coordenada(texto: str) -> int | str:
+    """
+    La celda de la coordenada: el valor en unidades de 10^-DECIMALES_COORDENADAS
+    grados, redondeado. Si no es un número (no debería pasar, pero el primer
+    corte no lo filtra) queda el texto tal cual, sin espacios.
+    """
+    try:
+        valor = float(texto.replace(",", "."))
+    except ValueError:
+        return texto.strip()
+    if not math.isfinite(valor):
+        return texto.strip()
+    return round(valor * 10 ** DECIMALES_COORDENADAS)
+
+
+@lru_cache(maxsize=CACHE_DIRECCIONES_MAX)
+def normalizar_direccion(direccion: str) -> str:
+    """Mayúsculas, sin tildes, la puntuación como espacio y los espacios compactados."""
+    sin_tildes = unicodedata.normalize("NFKD", direccion.upper())
+    return " ".join(
+        "".join(c if c.isalnum() else " " for c in sin_tildes if not unicodedata.combining(c)).split()
+    )
+
+
+def _celdas_alrededor(celda: tuple) -> list[tuple]:
+    """(lat, lon, bandera) de la celda y de las 8 de alrededor, con la misma bandera."""
+    lat, lon, empresa = celda
+    if not isinstance(lat, int) or not isinstance(lon, int):
+        return [celda]
+    return [
+        (lat + d_lat, lon + d_lon, empresa)
+        for d_lat in (-1, 0, 1)
+        for d_lon in (-1, 0, 1)
+    ]
+
+
+class RegistroEstaciones:
+    """
+    Lectura (celda lat, celda lon, bandera, dirección) -> id. Además
+    guarda, por cada (latitud, longitud, dirección, bandera) cruda ya
+    vista, su id: las filas del CSV repiten los mismos textos mes a mes y
+    así solo se normaliza la primera vez.
+    """
+
+    def __init__(self, entradas: list | None = None, fusionar: bool = True):
+        """
+        entradas: las de entradas() de otro registro (o del JSON guardado), en orden.
+        fusionar=False: las lecturas nuevas no toman el id de otra (ver para_proceso()).
+        """
+        self.fusionar = fusionar
+        self._ids: dict[tuple, int] = {}  # lectura -> id
+        self._por_celda: dict[tuple, list[tuple[str, int]]] = {}  # (lat, lon, bandera) -> [(dirección, id)]
+        self._n = 0
+        self.por_texto: dict[tuple[str, str, str, str], int] = {}  # (lat, lon, dirección, bandera) crudos -> id
+        for lat, lon, empresa, direccion, id_estacion in entradas or ():
+            self._alta((lat, lon, sys.intern(empresa), sys.intern(direccion)), id_estacion)
+            self._n = max(self._n, id_estacion + 1)
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __reduce__(self):
+        # A otro proceso solo viajan las entradas (la cache cruda se rearma)
+        return RegistroEstaciones, (self.entradas(), self.fusionar)
+
+    def para_proceso(self) -> "RegistroEstaciones":
+        """
+        Copia para un proceso de _procesar_en_paralelo: las lecturas que ya
+        están resuelven igual, pero cada lectura nueva recibe un id propio.
+        El proceso no ve las de los rangos anteriores, así que no puede
+        decidir si es otra estación; lo decide traduccion(), en orden.
+        """
+        return RegistroEstaciones(self.entradas(), fusionar=False)
+
+    def identidades_vistas(self) -> int:
+        """Cuántas lecturas distintas vio (cada id tiene una o más)."""
+        return len(self._ids)
+
+    def entradas(self) -> list[tuple]:
+        """(celda lat, celda lon, bandera, dirección, id) de cada lectura vista, en orden de alta."""
+        return [(*lectura, id_estacion) for lectura, id_estacion in self._ids.items()]
+
+    def _alta(self, lectura: tuple, id_estacion: int):
+        self._ids[lectura] = id_estacion
+        self._por_celda.setdefault(lectura[:3], []).append((lectura[3], id_estacion))
+
+    def _agregar(self, lectura: tuple) -> int:
+        id_estacion = self._ids.get(lectura)
+        if id_estacion is not None:
+            return id_estacion
+        direccion = lectura[3]
+        candidatas = [
+            (otra != direccion, id_otra)
+            for celda in _celdas_alrededor(lectura[:3])
+            for otra, id_otra in self._por_celda.get(celda, ())
+        ] if self.fusionar else []
+        if candidatas:
+            # Primero la de la misma dirección; entre iguales, el id más bajo
+            id_estacion = min(candidatas)[1]
+        else:
+            id_estacion = self._n
+            self._n += 1
+        self._alta(lectura, id_estacion)
+        return id_estacion
+
+    def id_estacion(self, latitud: str, longitud: str, direccion: str, idempresabandera: str) -> int:
+        """Id de la estación de esa fila; si es nueva, se le asigna uno."""
+        crudo = (latitud, longitud, direccion, idempresabandera)
+        id_estacion = self.por_texto.get(crudo)
+        if id_estacion is None:
+            id_estacion = self.por_texto[crudo] = self._agregar((
+                normalizar_coordenada(latitud),
+                normalizar_coordenada(longitud),
+                sys.intern(idempresabandera.strip()),
+                sys.intern(normalizar_direccion(direccion)),
+            ))
+        return id_estacion
+
+    def traduccion(self, otro: "RegistroEstaciones", desde: int) -> dict[int, int]:
+        """
+        Para sumar lo que armó un proceso con para_proceso(): las lecturas
+        que `otro` vio después de las primeras `desde` (su
+        identidades_vistas() al copiarlo) se dan de alta acá, en el mismo
+        orden que en serie, y se devuelve el id de `otro` -> id de este
+        registro de las que cambian. Como en `otro` cada lectura nueva tiene
+        su propio id, la traducción queda igual que si se hubiera recorrido
+        en serie.
+        """
+        traduccion = {}
+        for *lectura, id_otro in otro.entradas()[desde:]:
+            id_estacion = self._agregar(tuple(lectura))
+            if id_estacion != id_otro:
+                traduccion[id_otro] = id_estacion
+        return traduccion
+
+    # ------------ PERSISTENCIA ------------
+
+    @classmethod
+    def cargar(cls, path: Path) -> "RegistroEstaciones":
+        """El registro guardado en path; uno vacío si no hay o no sirve."""
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                guardado = json.load(f)
+        except (OSError, ValueError):
+            return cls()
+        if (
+            guardado.get("version") != _VERSION_REGISTRO
+            or guardado.get("decimales") != DECIMALES_COORDENADAS
+        ):
+            print("[INFO] Cambió la regla del registro de estaciones. Se rearma desde cero.")
+            return cls()
+        return cls(guardado["entradas"])
+
+    def guardar(self, path: Path):
+        """Escribe el registro en path (a un temporal que después se renombra)."""
+        tmp = path.with_name(path.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as out:
+            json.dump({
+                "version": _VERSION_REGISTRO,
+                "decimales": DECIMALES_COORDENADAS,
+                "entradas": self.entradas(),
+            }, out, ensure_ascii=False)
+        os.replace(tmp, path)
@@ -0,0 +1,196 @@
+"""
+Snapshot binario de los datos ya procesados de todo el país: el último
+precio de cada estación (por_estacion) y el MAX/MIN de cada ciudad y
+producto. Layout fijo, little-endian, pensado para mapearlo en memoria
+(mmap) y leerlo sin parsear texto, tanto desde Python como desde C.
+
+    cabecera     _CABECERA (48 bytes)
+    offsets      (n_cadenas + 1) x uint32: inicio de cada cadena en el blob
+    estaciones   n_estaciones x _ESTACION (56 bytes)
+    filas        n_filas x _FILA (8 bytes)
+    blob         cadenas UTF-8 concatenadas, sin separador
+
+Cada estación guarda precio_num como double, sus campos de texto como
+índices a la tabla de cadenas (en el orden de PrecioEstacion) y su id en
+el registro de estaciones (la clave de por_estacion). Cada fila
+es (índice de estación, 0 = MAX / 1 = MIN), en el orden de
+calcular_filas_finales.
+
+Cada guardado es un archivo nuevo (ruta_version: el nombre lleva cuándo se
+generó) y nunca se pisa uno existente: quien tenga mapeado el anterior lo
+sigue leyendo entero, y en Windows, donde no se puede reemplazar ni borrar
+un archivo mapeado, guardar no falla. ultima_version da el más nuevo.
+"""
+import mmap
+import os
+import struct
+from pathlib import Path
+
+from procesarPrecios import PrecioEstacion, calcular_filas_finales
+
+
+MAGICO = b"PRECBIN\x00"
+VERSION = 3
+
+# magico, version, reservado, generado (epoch), tamaño y mtime_ns del CSV
+# de origen, n_cadenas, n_estaciones, n_filas
+_CABECERA = struct.Struct("<8sHHdQqIII4x")
+
+# precio_num + 11 campos de texto (índices a la tabla de cadenas) + id de estación
+_CAMPOS_TEXTO = tuple(c for c in PrecioEstacion._fields if c != "precio_num")
+_ESTACION = struct.Struct(f"<d{len(_CAMPOS_TEXTO)}II")
+
+# índice de estación, tipo (0 = MAX, 1 = MIN)
+_FILA = struct.Struct("<IB3x")
+_TIPOS_FILA = ("MAX", "MIN")
+
+_OFFSET = struct.Struct("<I")
+
+
+def huella_csv(ruta: Path) -> tuple[int, int]:
+    """(tamaño, mtime_ns) del CSV de origen, para saber si el snapshot sigue vigente."""
+    st = ruta.stat()
+    return st.st_size, st.st_mtime_ns
+
+
+def ruta_version(path: Path, generado: float) -> Path:
+    """precios_nacional.bin -> precios_nacional.<generado en ms>.bin"""
+    return path.with_name(f"{path.stem}.{int(generado * 1000)}{path.suffix}")
+
+
+def _versiones(path: Path) -> list[Path]:
+    """Las versiones guardadas de path, de la más vieja a la más nueva."""
+    versiones = []
+    for candidata in path.parent.glob(f"{path.stem}.*{path.suffix}"):
+        numero = candidata.name[len(path.stem) + 1:len(candidata.name) - len(path.suffix)]
+        if numero.isdigit():
+            versiones.append((int(numero), candidata))
+    return [v for _, v in sorted(versiones)]
+
+
+def ultima_version(path: Path) -> Path:
+    """La versión más nueva de path; FileNotFoundError si no hay ninguna."""
+    versiones = _versiones(path)
+    if not versiones:
+        raise FileNotFoundError(f"{path}: no hay ningún snapshot guardado")
+    return versiones[-1]
+
+
+def guardar_snapshot(
+    por_estacion: dict, path: Path, generado: float, fuente: tuple[int, int] = (0, 0)
+) -> Path:
+    """
+    Escribe el snapshot de por_estacion (y sus filas finales) en una
+    versión nueva de path (ruta_version) y devuelve su ruta. Después borra
+    las versiones anteriores; las que no se puedan borrar (en Windows, las
+    que siguen mapeadas) quedan para el próximo guardado.
+    """
+    estaciones = list(por_estacion.values())
+    posicion = {id(r): i for i, r in enumerate(estaciones)}
+    filas = calcular_filas_finales(estaciones)
+
+    # Tabla de cadenas sin repetidos (localidad, empresa, fecha, etc. se repiten mucho)
+    cadenas: dict[str, int] = {}
+    registros = bytearray()
+    for (id_estacion, _categoria), r in por_estacion.items():
+        campos = [cadenas.setdefault(getattr(r, c), len(cadenas)) for c in _CAMPOS_TEXTO]
+        registros += _ESTACION.pack(r.precio_num, *campos, id_estacion)
+
+    blob = bytearray()
+    offsets = bytearray()
+    for texto in cadenas:
+        offsets += _OFFSET.pack(len(blob))
+        blob += texto.encode("utf-8")
+    offsets += _OFFSET.pack(len(blob))
+
+    tamano, mtime_ns = fuente
+    destino = ruta_version(path, generado)
+    tmp = destino.with_name(destino.name + ".tmp")
+    with tmp.open("wb") as out:
+        out.write(_CABECERA.pack(
+            MAGICO, VERSION, 0, generado, tamano, mtime_ns,
+            len(cadenas), len(estaciones), len(filas),
+        ))
+        out.write(offsets)
+        out.write(registros)
+        for tipo, r in filas:
+            out.write(_FILA.pack(posicion[id(r)], _TIPOS_FILA.index(tipo)))
+        out.write(blob)
+    os.replace(tmp, destino)
+
+    for vieja in _versiones(path):
+        if vieja != destino:
+            try:
+                vieja.unlink()
+            except OSError:
+                pass
+    return destino
+
+
+class SnapshotBinario:
+    """
+    Snapshot binario mapeado en memoria. `datos` es un memoryview sobre el
+    mmap (se puede servir tal cual, sin copiarlo); los registros se
+    decodifican recién cuando se piden.
+    """
+
+    def __init__(self, path: Path):
+        with path.open("rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.datos = memoryview(self._mmap)
+
+        if len(self.datos) < _CABECERA.size:
+            raise ValueError(f"{path}: snapshot truncado")
+        (magico, version, _, self.generado, tamano, mtime_ns,
+         n_cadenas, self.n_estaciones, self.n_filas) = _CABECERA.unpack_from(self.datos)
+        if magico != MAGICO:
+            raise ValueError(f"{path}: no es un snapshot de precios")
+        if version != VERSION:
+            raise ValueError(f"{path}: versión {version} de snapshot no soportada")
+        self.fuente = (tamano, mtime_ns)
+
+        self._ini_offsets = _CABECERA.size
+        self._ini_estaciones = self._ini_offsets + (n_cadenas + 1) * _OFFSET.size
+        self._ini_filas = self._ini_estaciones + self.n_estaciones * _ESTACION.size
+        self._ini_blob = self._ini_filas + self.n_filas * _FILA.size
+
+        if len(self.datos) < self._ini_blob:
+            raise ValueError(f"{path}: snapshot truncado")
+        self._offsets = struct.unpack_from(f"<{n_cadenas + 1}I", self.datos, self._ini_offsets)
+        if len(self.datos) != self._ini_blob + self._offsets[-1]:
+            raise ValueError(f"{path}: el tamaño no coincide con la cabecera")
+
+    def _cadenas(self) -> list[str]:
+        blob = self.datos[self._ini_blob:]
+        o = self._offsets
+        return [str(blob[o[i]:o[i + 1]], "utf-8") for i in range(len(o) - 1)]
+
+    def _estaciones(self, cadenas: list[str]) -> tuple[list[int], list[PrecioEstacion]]:
+        """Id de estación y PrecioEstacion de cada estación guardada."""
+        i_num = PrecioEstacion._fields.index("precio_num")
+        ids, estaciones = [], []
+        for precio_num, *campos, id_estacion in _ESTACION.iter_unpack(
+            self.datos[self._ini_estaciones:self._ini_filas]
+        ):
+            valores = [cadenas[c] for c in campos]
+            valores.insert(i_num, precio_num)
+            ids.append(id_estacion)
+            estaciones.append(PrecioEstacion(*valores))
+        return ids, estaciones
+
+    def por_estacion(self) -> dict:
+        """El por_estacion guardado, en el mismo orden."""
+        ids, estaciones = self._estaciones(self._cadenas())
+        return {(e, r.categoria): r for e, r in zip(ids, estaciones)}
+
+    def filas_finales(self) -> list[tuple[str, PrecioEstacion]]:
+        """MAX/MIN por ciudad y producto, como calcular_filas_finales."""
+        _, estaciones = self._estaciones(self._cadenas())
+        return [
+            (_TIPOS_FILA[tipo], estaciones[i])
+            for i, tipo in _FILA.iter_unpack(self.datos[self._ini_filas:self._ini_blob])
+        ]
+
+    def vigente_para(self, fuente: tuple[int, int]) -> bool:
+        """True si se generó a partir de un CSV con esa huella (tamaño, mtime_ns)."""
+        return self.fuente == tuple(fuente)
@@ -15,12 +15,15 @@ int descargarArchivoPrecios(const char *url) {
         return 0;
     }
 
+    // RESYNCHRONIZE: WinINet manda If-None-Match/If-Modified-Since con lo
+    // que tiene en cache; si el servidor responde 304 lo leemos del cache
+    // en vez de bajar todo de nuevo.
     HINTERNET hFile = InternetOpenUrl(
         hInternet,
         url,
         NULL,
         0,
-        INTERNET_FLAG_RELOAD,
+        INTERNET_FLAG_RESYNCHRONIZE,
         0
     );
     if (!hFile) {